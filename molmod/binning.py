@@ -40,7 +40,7 @@ import numpy as np
 from molmod.unit_cells import UnitCell
 
 
-__all__ = ["PairSearchIntra", "PairSearchInter"]
+__all__ = ["PairSearchIntra", "PairSearchInter", "get_pair_arrays"]
 
 
 class Binning(object):
@@ -269,3 +269,110 @@ class PairSearchInter(PairSearchBase):
                         distance = np.linalg.norm(delta)
                         if distance <= self.cutoff:
                             yield i0, i1, delta, distance
+
+
+def _get_bin_frame(unit_cell):
+    """A basis with the active cell vectors and an orthonormal complement
+
+       Returns the inverse of the basis matrix (to transform Cartesian
+       coordinates into frame coordinates) and a mask of periodic axes.
+    """
+    if unit_cell is None:
+        return np.identity(3), np.zeros(3, bool)
+    active = unit_cell.active_inactive[0]
+    frame = np.zeros((3, 3), float)
+    frame[:, :len(active)] = unit_cell.matrix[:, active]
+    if len(active) < 3:
+        # The left singular vectors with a zero singular value span the
+        # orthogonal complement of the active cell vectors.
+        U = np.linalg.svd(frame[:, :len(active)].reshape(3, -1), full_matrices=True)[0]
+        frame[:, len(active):] = U[:, len(active):]
+    periodic = np.zeros(3, bool)
+    periodic[:len(active)] = True
+    return np.linalg.inv(frame), periodic
+
+
+def get_pair_arrays(coordinates, cutoff, unit_cell=None):
+    """Find all pairs of coordinates with a distance below a cutoff
+
+       Arguments:
+        | ``coordinates``  --  A Nx3 numpy array with Cartesian coordinates
+        | ``cutoff``  --  The cutoff radius for the pair distances.
+
+       Optional argument:
+        | ``unit_cell``  --  Specifies the periodic boundary conditions
+
+       This is a vectorized alternative for :class:`PairSearchIntra` that
+       returns all pairs at once instead of iterating over them. The result is
+       a tuple ``(indexes0, indexes1, deltas, distances)`` of arrays, sorted by
+       the first and then the second index, such that ``indexes0 >
+       indexes1``. Just like in :class:`PairSearchIntra`, the relative vectors
+       are ``coordinates[indexes1] - coordinates[indexes0]`` and the minimum
+       image convention is applied for periodic systems.
+    """
+    coordinates = np.asarray(coordinates, float).reshape((-1, 3))
+    inverse, periodic = _get_bin_frame(unit_cell)
+
+    # assign all coordinates to bins. along periodic directions, the bins are
+    # integer divisions of the cell vectors with spacings above the cutoff.
+    # along the other directions, cubic bins with edge length cutoff are used.
+    frame_coords = np.dot(coordinates, inverse.T)
+    divisions = np.ones(3, int)
+    keys = np.zeros(frame_coords.shape, int)
+    for axis in range(3):
+        column = frame_coords[:, axis]
+        if periodic[axis]:
+            spacing = 1.0/np.linalg.norm(inverse[axis])
+            divisions[axis] = max(1, int(np.floor(spacing/cutoff)))
+            keys[:, axis] = np.floor((column - np.floor(column))*divisions[axis])
+            keys[:, axis] %= divisions[axis]
+        elif len(column) > 0:
+            keys[:, axis] = np.floor((column - column.min())/cutoff)
+            divisions[axis] = keys[:, axis].max() + 1
+    bin_ids = np.ravel_multi_index(keys.T, divisions)
+    order = bin_ids.argsort(kind="mergesort")
+    sorted_ids = bin_ids[order]
+
+    # relative positions of neighboring bins, without duplicates in case of
+    # periodic directions with less than three divisions
+    axis_shifts = []
+    for axis in range(3):
+        if periodic[axis]:
+            axis_shifts.append(sorted(set(shift % divisions[axis] for shift in (-1, 0, 1))))
+        else:
+            axis_shifts.append([-1, 0, 1])
+
+    all_i0 = []
+    all_i1 = []
+    for shift in np.array(np.meshgrid(*axis_shifts, indexing="ij")).reshape(3, -1).T:
+        other_keys = keys + shift
+        mask = np.ones(len(keys), bool)
+        for axis in range(3):
+            if periodic[axis]:
+                other_keys[:, axis] %= divisions[axis]
+            else:
+                mask &= (other_keys[:, axis] >= 0) & (other_keys[:, axis] < divisions[axis])
+        i0 = mask.nonzero()[0]
+        other_ids = np.ravel_multi_index(other_keys[i0].T, divisions)
+        begins = np.searchsorted(sorted_ids, other_ids, "left")
+        counts = np.searchsorted(sorted_ids, other_ids, "right") - begins
+        # expand into all pairs between an atom and the atoms in the other bin
+        i0 = i0.repeat(counts)
+        offsets = np.arange(counts.sum()) - (counts.cumsum() - counts).repeat(counts)
+        i1 = order[begins.repeat(counts) + offsets]
+        keep = i1 < i0
+        all_i0.append(i0[keep])
+        all_i1.append(i1[keep])
+
+    indexes0 = np.concatenate(all_i0)
+    indexes1 = np.concatenate(all_i1)
+    deltas = coordinates[indexes1] - coordinates[indexes0]
+    if unit_cell is not None:
+        deltas = unit_cell.shortest_vector(deltas)
+    distances = np.sqrt((deltas**2).sum(axis=1))
+    mask = distances <= cutoff
+    pair_order = np.lexsort((indexes1[mask], indexes0[mask]))
+    return (
+        indexes0[mask][pair_order], indexes1[mask][pair_order],
+        deltas[mask][pair_order], distances[mask][pair_order]
+    )
@@ -44,6 +44,7 @@
 from __future__ import division
 
 from builtins import range
+import numpy as np
 import pkg_resources
 
 from molmod.periodic import periodic
@@ -85,6 +86,7 @@ class BondData(object):
             in self.lengths.values()
             if len(lengths) > 0
         )
+        self._build_length_table()
 
     def _load_bond_data(self):
         """Load the bond data from the given file
@@ -139,6 +141,89 @@ class BondData(object):
                         dataset[pair] = (atom1.covalent_radius + atom2.covalent_radius)
                     #print "%3i  %3i  %s %30s %30s" % (n1, n2, dataset.get(pair), atom1, atom2)
 
+    def _build_length_table(self):
+        """Store all bond lengths in a dense array for vectorized lookups
+
+           The array ``self.length_table`` has shape (max_number+1,
+           max_number+1, len(bond_types)). Missing bond lengths are NaN.
+        """
+        max_number = max(
+            max(pair)
+            for lengths in self.lengths.values()
+            for pair in lengths
+        )
+        self.length_table = np.zeros((max_number+1, max_number+1, len(bond_types)), float)
+        self.length_table[:] = np.nan
+        for index, bond_type in enumerate(bond_types):
+            for pair, length in self.lengths[bond_type].items():
+                n1 = min(pair)
+                n2 = max(pair)
+                self.length_table[n1, n2, index] = length
+                self.length_table[n2, n1, index] = length
+
+    def _get_table_lengths(self, numbers1, numbers2):
+        """The tabulated lengths for pairs of atom numbers, NaN if unknown"""
+        numbers1 = np.asarray(numbers1, int)
+        numbers2 = np.asarray(numbers2, int)
+        size = len(self.length_table)
+        # Unknown atom numbers are mapped to row zero, which only has NaNs.
+        numbers1 = np.where((numbers1 > 0) & (numbers1 < size), numbers1, 0)
+        numbers2 = np.where((numbers2 > 0) & (numbers2 < size), numbers2, 0)
+        return self.length_table[numbers1, numbers2]
+
+    def get_max_length(self, numbers):
+        """The largest bond length among the given atom numbers
+
+           Argument:
+            | ``numbers``  --  an array with atom numbers
+
+           This is useful to limit the cutoff of a pair search to the elements
+           that are really present. Zero is returned if no bond lengths are
+           known for the given elements.
+        """
+        present = np.unique(numbers)
+        lengths = self._get_table_lengths(present[:, None], present)
+        lengths = lengths[~np.isnan(lengths)]
+        if len(lengths) == 0:
+            return 0.0
+        return min(lengths.max(), self.max_length)
+
+    def get_max_distances(self, numbers1, numbers2):
+        """Return the distances below which pairs of atoms are bonded
+
+           Arguments:
+            | ``numbers1``  --  the atom numbers of the first atoms in the bonds
+            | ``numbers2``  --  the atom numbers of the second atoms in the bonds
+
+           For each pair, :meth:`bonded_many` returns a bond type if and only if
+           the distance is below the corresponding value in the returned array.
+           Zero is used for pairs without tabulated bond lengths.
+        """
+        lengths = self._get_table_lengths(numbers1, numbers2)
+        lengths = np.where(np.isnan(lengths), 0.0, lengths)
+        return lengths.max(axis=-1)*self.bond_tolerance
+
+    def bonded_many(self, numbers1, numbers2, distances):
+        """Return the estimated bond types for arrays of atom pairs
+
+           Arguments:
+            | ``numbers1``  --  the atom numbers of the first atoms in the bonds
+            | ``numbers2``  --  the atom numbers of the second atoms in the bonds
+            | ``distances``  --  the distances between the two atoms
+
+           This is the vectorized counterpart of :meth:`bonded`. The return
+           value is an integer array with the best matching bond type for each
+           pair, or zero if the atoms are not bonded.
+        """
+        distances = np.asarray(distances, float)
+        lengths = self._get_table_lengths(numbers1, numbers2)
+        with np.errstate(invalid='ignore'):
+            valid = distances[..., None] < lengths*self.bond_tolerance
+        deviations = np.where(valid, abs(lengths - distances[..., None]), np.inf)
+        # argmin picks the first bond type in case of ties, just like bonded
+        best = deviations.argmin(axis=-1)
+        return np.where(valid.any(axis=-1), np.array(bond_types)[best], 0)
+
     def bonded(self, n1, n2, distance):
         """Return the estimated bond type
 
@@ -33,6 +33,7 @@ cimport ff
 cimport graphs
 cimport molecules
 cimport similarity
+cimport transformations
 cimport unit_cells
 
 
@@ -170,6 +171,75 @@ def graphs_floyd_warshall(long[:, ::1] dm):
     graphs.graphs_floyd_warshall(nvertex, &dm[0, 0])
 
 
+def graphs_components(size_t nvertex, const long[:, ::1] edges not None):
+    if edges.shape[1] != 2:
+        raise TypeError('edges must have two columns.')
+    cdef size_t nedge = edges.shape[0]
+    cdef np.ndarray[long, ndim=1] labels = np.zeros(nvertex, int)
+    if nvertex == 0:
+        return labels, 0
+    cdef long ncomponent
+    if nedge == 0:
+        ncomponent = graphs.graphs_components(nvertex, 0, NULL, &labels[0])
+    else:
+        ncomponent = graphs.graphs_components(nvertex, nedge, &edges[0, 0], &labels[0])
+    return labels, ncomponent
+
+
+def graphs_breadth_first(const int[::1] indptr not None, const int[::1] indices not None,
+                         long start, bint do_edges=False):
+    cdef size_t nvertex = indptr.shape[0] - 1
+    if start < 0 or start >= <long>nvertex:
+        raise ValueError('start must be in the range [0, nvertex[')
+    if indptr[nvertex] != indices.shape[0]:
+        raise TypeError('indptr and indices are not consistent.')
+    cdef np.ndarray[long, ndim=1] order = np.zeros(nvertex, int)
+    cdef np.ndarray[long, ndim=1] distances = np.zeros(nvertex, int)
+    cdef np.ndarray[long, ndim=1] parents = np.zeros(nvertex, int)
+    cdef long norder
+    if not do_edges:
+        norder = graphs.graphs_breadth_first(
+            nvertex, &indptr[0], &indices[0] if indices.shape[0] > 0 else NULL,
+            start, &order[0], &distances[0], &parents[0], NULL, NULL, NULL, NULL)
+        return order[:norder], distances, parents
+    # each edge is classified at most once
+    cdef size_t nedge_max = indices.shape[0]//2 + 1
+    cdef np.ndarray[long, ndim=2] edges = np.zeros((nedge_max, 2), int)
+    cdef np.ndarray[long, ndim=1] edge_distances = np.zeros(nedge_max, int)
+    cdef np.ndarray[long, ndim=1] edge_kinds = np.zeros(nedge_max, int)
+    cdef long nedge = 0
+    norder = graphs.graphs_breadth_first(
+        nvertex, &indptr[0], &indices[0] if indices.shape[0] > 0 else NULL,
+        start, &order[0], &distances[0], &parents[0], &edges[0, 0],
+        &edge_distances[0], &edge_kinds[0], &nedge)
+    return (order[:norder], distances, parents, edges[:nedge],
+            edge_distances[:nedge], edge_kinds[:nedge])
+
+
+def graphs_distances_within(const int[::1] indptr not None, const int[::1] indices not None,
+                            long max_distance):
+    cdef size_t nvertex = indptr.shape[0] - 1
+    if indptr[nvertex] != indices.shape[0]:
+        raise TypeError('indptr and indices are not consistent.')
+    cdef np.ndarray[long, ndim=2] pairs
+    cdef np.ndarray[long, ndim=1] lengths
+    if nvertex == 0:
+        return np.zeros((0, 2), int), np.zeros(0, int)
+    cdef np.ndarray[long, ndim=1] distances = np.zeros(nvertex, int)
+    cdef np.ndarray[long, ndim=1] queue = np.zeros(nvertex, int)
+    cdef const int* indices_ptr = &indices[0] if indices.shape[0] > 0 else NULL
+    # The first pass only counts the pairs, the second one stores them.
+    cdef long npair = graphs.graphs_distances_within(
+        nvertex, &indptr[0], indices_ptr, max_distance, &distances[0], &queue[0],
+        NULL, NULL)
+    pairs = np.zeros((max(npair, 1), 2), int)
+    lengths = np.zeros(max(npair, 1), int)
+    graphs.graphs_distances_within(
+        nvertex, &indptr[0], indices_ptr, max_distance, &distances[0], &queue[0],
+        &pairs[0, 0], &lengths[0])
+    return pairs[:npair], lengths[:npair]
+
+
 #
 # molecules.c
 #
@@ -235,6 +305,63 @@ def similarity_measure(long[:, ::1] labels1 not None, double[::1] distances1 not
                                          margin, cutoff)
 
 
+#
+# transformations.c
+#
+
+
+def transformations_qcp(double[:, ::1] a not None, double[:, ::1] b not None,
+                        double[::1] weights=None, double[:, ::1] rot=None):
+    cdef size_t natom = a.shape[0]
+    if a.shape[1] != 3:
+        raise TypeError('a must have three columns.')
+    if b.shape[0] != natom or b.shape[1] != 3:
+        raise TypeError('b must have the same shape as a.')
+    if weights is not None and weights.shape[0] != natom:
+        raise TypeError('weights must have as many elements as a has rows.')
+    if rot is not None and (rot.shape[0] != 3 or rot.shape[1] != 3):
+        raise TypeError('rot must be an array with shape (3, 3)')
+    cdef double inner[9]
+    cdef double *pweights = NULL
+    cdef double total_weight = natom
+    if weights is not None:
+        pweights = &weights[0]
+        total_weight = np.sum(weights)
+    cdef double e0 = transformations.transformations_qcp_inner(
+        natom, &a[0, 0], &b[0, 0], pweights, inner)
+    if rot is None:
+        return transformations.transformations_qcp_rmsd(inner, e0, total_weight, NULL)
+    else:
+        return transformations.transformations_qcp_rmsd(inner, e0, total_weight, &rot[0, 0])
+
+
+def transformations_rmsd_matrix(double[:, :, ::1] frames not None, double[::1] weights,
+                                double[::1] norms not None, double total_weight,
+                                double threshold, size_t begin, size_t end,
+                                double[::1] out not None):
+    cdef size_t nframe = frames.shape[0]
+    cdef size_t natom = frames.shape[1]
+    if frames.shape[2] != 3:
+        raise TypeError('frames must have shape (nframe, natom, 3).')
+    if weights is not None and weights.shape[0] != natom:
+        raise TypeError('weights must have natom elements.')
+    if norms.shape[0] != nframe:
+        raise TypeError('norms must have nframe elements.')
+    if out.shape[0] != (nframe*(nframe-1))//2:
+        raise TypeError('out must have nframe*(nframe-1)/2 elements.')
+    if begin > end or end > out.shape[0]:
+        raise ValueError('Invalid range begin:end.')
+    if begin == end:
+        return
+    cdef double *pweights = NULL
+    if weights is not None:
+        pweights = &weights[0]
+    with nogil:
+        transformations.transformations_rmsd_matrix(
+            nframe, natom, &frames[0, 0, 0], pweights, &norms[0], total_weight, threshold,
+            begin, end, &out[0])
+
+
 #
 # unit_cell.c
 #
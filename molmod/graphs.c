@@ -48,3 +48,147 @@ void graphs_floyd_warshall(size_t n, long* dm) {
     }
   }
 }
+
+
+static long graphs_find_root(long* parents, long i) {
+  // Path halving: every vertex on the path points to its grandparent.
+  while (parents[i] != i) {
+    parents[i] = parents[parents[i]];
+    i = parents[i];
+  }
+  return i;
+}
+
+
+long graphs_components(size_t nvertex, size_t nedge, const long* edges, long* labels) {
+  size_t i;
+  long root0, root1, ncomponent;
+
+  // Use labels as the parent array of the union-find forest.
+  for (i=0; i<nvertex; i++) {
+    labels[i] = i;
+  }
+  for (i=0; i<nedge; i++) {
+    root0 = graphs_find_root(labels, edges[2*i]);
+    root1 = graphs_find_root(labels, edges[2*i+1]);
+    // The root is always the vertex with the lowest index.
+    if (root0 < root1) {
+      labels[root1] = root0;
+    } else if (root1 < root0) {
+      labels[root0] = root1;
+    }
+  }
+  // Number the components in the order of their lowest vertex. Because the
+  // root is the lowest vertex of a component, the parent of each vertex
+  // precedes the vertex itself and already has its final label.
+  ncomponent = 0;
+  for (i=0; i<nvertex; i++) {
+    if (labels[i] == (long)i) {
+      labels[i] = ncomponent;
+      ncomponent++;
+    } else {
+      labels[i] = labels[labels[i]];
+    }
+  }
+  return ncomponent;
+}
+
+
+long graphs_breadth_first(size_t nvertex, const int* indptr, const int* indices,
+                          long start, long* order, long* distances, long* parents,
+                          long* edges, long* edge_distances, long* edge_kinds,
+                          long* nedge) {
+  size_t i;
+  long head, tail, parent, current, distance, j;
+
+  for (i=0; i<nvertex; i++) {
+    distances[i] = -1;
+    parents[i] = -1;
+  }
+  if (nedge != NULL) *nedge = 0;
+  // The order array also serves as the queue.
+  distances[start] = 0;
+  order[0] = start;
+  head = 0;
+  tail = 1;
+  while (head < tail) {
+    parent = order[head];
+    head++;
+    distance = distances[parent];
+    for (j=indptr[parent]; j<indptr[parent+1]; j++) {
+      current = indices[j];
+      if (distances[current] == -1) {
+        // tree edge
+        distances[current] = distance + 1;
+        parents[current] = parent;
+        order[tail] = current;
+        tail++;
+        if (edges == NULL) continue;
+        edge_kinds[*nedge] = 0;
+      } else if (edges == NULL) {
+        continue;
+      } else if (distances[current] == distance && current > parent) {
+        // edge between two vertices at the same distance, only once
+        edge_kinds[*nedge] = 1;
+      } else if (distances[current] == distance + 1) {
+        // another edge to a vertex at the next distance
+        edge_kinds[*nedge] = 2;
+      } else {
+        continue;
+      }
+      edges[2*(*nedge)] = parent;
+      edges[2*(*nedge)+1] = current;
+      edge_distances[*nedge] = distance;
+      (*nedge)++;
+    }
+  }
+  return tail;
+}
+
+
+long graphs_distances_within(size_t nvertex, const int* indptr, const int* indices,
+                             long max_distance, long* distances, long* queue,
+                             long* pairs, long* lengths) {
+  size_t i;
+  long head, tail, parent, current, distance, j, npair;
+
+  for (i=0; i<nvertex; i++) {
+    distances[i] = -1;
+  }
+  npair = 0;
+  for (i=0; i<nvertex; i++) {
+    // Breadth first search from i that stops at max_distance. A negative
+    // max_distance means that there is no cutoff.
+    distances[i] = 0;
+    queue[0] = i;
+    head = 0;
+    tail = 1;
+    while (head < tail) {
+      parent = queue[head];
+      head++;
+      distance = distances[parent];
+      if (distance == max_distance) continue;
+      for (j=indptr[parent]; j<indptr[parent+1]; j++) {
+        current = indices[j];
+        if (distances[current] != -1) continue;
+        distances[current] = distance + 1;
+        queue[tail] = current;
+        tail++;
+        if (current > (long)i) {
+          // Only count the pairs when no output arrays are given.
+          if (pairs != NULL) {
+            pairs[2*npair] = i;
+            pairs[2*npair+1] = current;
+            lengths[npair] = distance + 1;
+          }
+          npair++;
+        }
+      }
+    }
+    // Only reset the vertices that were reached.
+    for (head=0; head<tail; head++) {
+      distances[queue[head]] = -1;
+    }
+  }
+  return npair;
+}
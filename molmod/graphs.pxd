@@ -24,3 +24,11 @@
 
 cdef extern from "graphs.h":
     void graphs_floyd_warshall(size_t n, long* dm)
+    long graphs_components(size_t nvertex, size_t nedge, const long* edges, long* labels)
+    long graphs_breadth_first(size_t nvertex, const int* indptr, const int* indices,
+                              long start, long* order, long* distances, long* parents,
+                              long* edges, long* edge_distances, long* edge_kinds,
+                              long* nedge)
+    long graphs_distances_within(size_t nvertex, const int* indptr, const int* indices,
+                                 long max_distance, long* distances, long* queue,
+                                 long* pairs, long* lengths)
@@ -54,6 +54,7 @@ from __future__ import print_function, division
 
 from builtins import range
 import copy
+from collections import OrderedDict
 
 import numpy as np
 
@@ -61,8 +62,9 @@ from molmod.utils import cached, ReadOnly, ReadOnlyAttribute
 
 
 __all__ = [
-    "GraphError", "Graph", "OneToOne", "Match", "Pattern",
+    "GraphError", "Graph", "GraphBuilder", "GraphIndex", "OneToOne", "Match", "Pattern",
     "CriteriaSet", "Anything", "CritOr", "CritAnd", "CritXor", "CritNot",
+    "get_vertex_mask",
     "CustomPattern", "EqualPattern", "RingPattern", "GraphSearch",
 ]
 
@@ -72,6 +74,63 @@ class GraphError(Exception):
     pass
 
 
+def _mix64(x):
+    """Scramble the bits of an array of unsigned 64-bit integers
+
+       This is the finalizer of the SplitMix64 generator. It is a bijection
+       with good avalanche properties, i.e. flipping one input bit flips on
+       average half of the output bits.
+    """
+    x = x ^ (x >> np.uint64(30))
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _hash_strings(strings):
+    """Return a (len(strings), 2) array of 64-bit integers with string hashes
+
+       Each distinct string is hashed only once with SHA1, such that the result
+       does not depend on the Python hash seed.
+    """
+    import hashlib
+    lookup = {}
+    indexes = np.zeros(len(strings), int)
+    for i, string in enumerate(strings):
+        index = lookup.get(string)
+        if index is None:
+            index = len(lookup)
+            lookup[string] = index
+        indexes[i] = index
+    table = np.zeros((len(lookup), 2), np.uint64)
+    for string, index in lookup.items():
+        if not isinstance(string, bytes):
+            string = string.encode("utf-8")
+        table[index] = np.frombuffer(hashlib.sha1(string).digest()[:16], "<u8")
+    return table[indexes]
+
+
+class _EdgesAttribute(ReadOnlyAttribute):
+    """The edges of a graph as a tuple of frozensets
+
+       When the graph is constructed from an edge array, the tuple is only
+       derived from that array when it is accessed for the first time.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        result = ReadOnlyAttribute.__get__(self, instance, cls)
+        if result is None:
+            edge_array = instance.__dict__.get("_edge_array")
+            if edge_array is not None:
+                result = tuple(frozenset(edge) for edge in edge_array.tolist())
+                ReadOnlyAttribute.__set__(self, instance, result, do_check=False)
+        return result
+
+
 class Graph(ReadOnly):
     """An undirected graph, where edges have equal weight
 
@@ -100,8 +159,17 @@ class Graph(ReadOnly):
        >>> graph.vertex_property = np.array([6, 6, 1, 1, 1, 1], int)
        >>> # bond orders of ethene
        >>> graph.edge_property = np.array([2, 1, 1, 1, 1], int)
+
+       Internally, the edges are stored as an integer array, see
+       :attr:`edge_array`, and the neighbors are derived from it in compressed
+       sparse row format, see :attr:`csr`. The tuple of frozensets in
+       :attr:`edges` and the dictionary :attr:`neighbors` are only constructed
+       when they are used.
     """
-    edges = ReadOnlyAttribute(tuple, none=False, doc="the incidence list")
+    edges = _EdgesAttribute(tuple, none=False, doc="the incidence list")
+    # The default hash function for the vertex fingerprints, see
+    # get_vertex_fingerprints
+    fingerprint_method = "mix"
     num_vertices = ReadOnlyAttribute(int, none=False, doc="the number of vertices")
 
     def __init__(self, edges, num_vertices=None):
@@ -115,27 +183,29 @@ class Graph(ReadOnly):
            num_vertices argument to tell what the total number of vertices is.
 
            If the edges argument does not have the correct format, it will be
-           converted.
-        """
-
-        tmp = []
-        for edge in edges:
-            if len(edge) != 2:
-                raise TypeError("The edges must be a iterable with 2 elements")
-            i, j = edge
-            i = int(i)
-            j = int(j)
-            if i == j:
-                raise ValueError("A edge must contain two different values.")
-            if i < 0 or j < 0:
-                raise TypeError("The edges must contain positive integers.")
-            tmp.append(frozenset([i, j]))
-        edges = tuple(tmp)
-
-        if len(edges) == 0:
+           converted. An integer numpy array with shape (num_edges, 2) is also
+           accepted.
+        """
+        if isinstance(edges, np.ndarray) and edges.ndim == 2 and \
+           edges.shape[1] == 2 and edges.dtype.kind in "iu":
+            edge_array = edges.astype(np.int32)
+        else:
+            tmp = []
+            for edge in edges:
+                if len(edge) != 2:
+                    raise TypeError("The edges must be a iterable with 2 elements")
+                i, j = edge
+                tmp.append((int(i), int(j)))
+            edge_array = np.array(tmp, np.int32).reshape((-1, 2))
+        if (edge_array[:, 0] == edge_array[:, 1]).any():
+            raise ValueError("A edge must contain two different values.")
+        if (edge_array < 0).any():
+            raise TypeError("The edges must contain positive integers.")
+
+        if len(edge_array) == 0:
             real_num_vertices = 0
         else:
-            real_num_vertices = max(max(a, b) for a, b in edges)+1
+            real_num_vertices = int(edge_array.max())+1
         if num_vertices is not None:
             if not isinstance(num_vertices, int):
                 raise TypeError("The optional argument num_vertices must be an "
@@ -145,10 +215,42 @@ class Graph(ReadOnly):
                     "number of vertices deduced from the edge list.")
             real_num_vertices = num_vertices
 
-        self.edges = edges
-        self.num_vertices = real_num_vertices
+        self._init_arrays(edge_array, real_num_vertices)
 
-    num_edges = property(lambda self: len(self.edges),
+    @classmethod
+    def from_arrays(cls, edge_array, num_vertices):
+        """Construct a graph directly from an array with edges
+
+           Arguments:
+            | ``edge_array`` -- an integer array with shape (num_edges, 2)
+            | ``num_vertices`` -- the number of vertices
+
+           Unlike the constructor, this method does not check the edges. The
+           caller must make sure that all values are in the range
+           ``[0, num_vertices[`` and that no edge connects a vertex with
+           itself.
+        """
+        result = cls.__new__(cls)
+        Graph._init_arrays(result, edge_array, num_vertices)
+        return result
+
+    def _init_arrays(self, edge_array, num_vertices):
+        """Assign the edge array and the number of vertices"""
+        self._edge_array = np.ascontiguousarray(edge_array, np.int32).reshape((-1, 2))
+        self.num_vertices = int(num_vertices)
+
+    @property
+    def edge_array(self):
+        """*Read-only attribute:* the edges as an integer array with shape (num_edges, 2)."""
+        result = self.__dict__.get("_edge_array")
+        if result is None:
+            # This happens when the edges are assigned without the constructor,
+            # e.g. when unpickling.
+            result = np.array([tuple(edge) for edge in self.edges], np.int32).reshape((-1, 2))
+            self._edge_array = result
+        return result
+
+    num_edges = property(lambda self: len(self.edge_array),
         doc="*Read-only attribute:* the number of edges in the graph.")
 
     def __mul__(self, repeat):
@@ -159,14 +261,12 @@ class Graph(ReadOnly):
         """
         if not isinstance(repeat, int):
             raise TypeError("Can only multiply a graph with an integer")
-        new_edges = []
-        for i in range(repeat):
-            for vertex1, vertex2 in self.edges:
-                new_edges.append(frozenset([
-                    vertex1+i*self.num_vertices,
-                    vertex2+i*self.num_vertices
-                ]))
-        return Graph(new_edges, self.num_vertices*repeat)
+        return Graph.from_arrays(self._get_repeated_edges(repeat), self.num_vertices*repeat)
+
+    def _get_repeated_edges(self, repeat):
+        """The edge array of ``repeat`` copies, with offsets of num_vertices"""
+        offsets = np.arange(max(repeat, 0), dtype=np.int32)*self.num_vertices
+        return (self.edge_array + offsets[:, None, None]).reshape((-1, 2))
 
     __rmul__ = __mul__
 
@@ -196,6 +296,24 @@ class Graph(ReadOnly):
         """A map to look up the index of a edge"""
         return dict((edge, index) for index, edge in enumerate(self.edges))
 
+    @cached
+    def csr(self):
+        """The neighbors in compressed sparse row format
+
+           This is a tuple ``(indptr, indices)`` of two int32 arrays. The
+           (sorted) neighbors of vertex ``i`` are
+           ``indices[indptr[i]:indptr[i+1]]``. Duplicate edges only appear
+           once.
+        """
+        edge_array = self.edge_array.astype(np.int64)
+        both = np.concatenate([edge_array, edge_array[:, ::-1]])
+        keys = np.unique(both[:, 0]*self.num_vertices + both[:, 1])
+        rows = keys//max(self.num_vertices, 1)
+        indptr = np.zeros(self.num_vertices+1, np.int32)
+        np.cumsum(np.bincount(rows, minlength=self.num_vertices), out=indptr[1:])
+        indices = (keys - rows*self.num_vertices).astype(np.int32)
+        return indptr, indices
+
     @cached
     def neighbors(self):
         """A dictionary with neighbors
@@ -206,16 +324,13 @@ class Graph(ReadOnly):
            implies that the following elements are part of the dictionary:
            ``{vertexY1: (vertexX, ...), vertexY2: (vertexX, ...), ...}``.
         """
-        neighbors = dict(
-            (vertex, []) for vertex
-            in range(self.num_vertices)
+        indptr, indices = self.csr
+        indptr = indptr.tolist()
+        indices = indices.tolist()
+        return dict(
+            (vertex, frozenset(indices[indptr[vertex]:indptr[vertex+1]]))
+            for vertex in range(self.num_vertices)
         )
-        for a, b in self.edges:
-            neighbors[a].append(b)
-            neighbors[b].append(a)
-        # turn lists into frozensets
-        neighbors = dict((key, frozenset(val)) for key, val in neighbors.items())
-        return neighbors
 
     @cached
     def distances(self):
@@ -224,12 +339,22 @@ class Graph(ReadOnly):
         distances = np.zeros((self.num_vertices,)*2, dtype=int)
         #distances[:] = -1 # set all -1, which is just a very big integer
         #distances.ravel()[::len(distances)+1] = 0 # set diagonal to zero
-        for i, j in self.edges: # set edges to one
-            distances[i, j] = 1
-            distances[j, i] = 1
+        # set edges to one
+        distances[self.edge_array[:, 0], self.edge_array[:, 1]] = 1
+        distances[self.edge_array[:, 1], self.edge_array[:, 0]] = 1
         graphs_floyd_warshall(distances)
         return distances
 
+    @cached
+    def _breadth_first_cache(self):
+        """Single-source breadth first results, see _get_breadth_first"""
+        return {}
+
+    @cached
+    def _distances_within_cache(self):
+        """Sparse distance results, see distances_within"""
+        return {}
+
     @cached
     def max_distance(self):
         """The maximum value in the distances matrix."""
@@ -241,7 +366,15 @@ class Graph(ReadOnly):
     @cached
     def central_vertices(self):
         """Vertices that have the lowest maximum distance to any other vertex"""
-        max_distances = self.distances.max(0)
+        if "_cache_distances" in self.__dict__:
+            max_distances = self.distances.max(0)
+        else:
+            # One breadth first search per vertex avoids the construction of
+            # the dense distance matrix.
+            max_distances = np.zeros(self.num_vertices, int)
+            for vertex in range(self.num_vertices):
+                order, row = self._get_breadth_first(vertex)
+                max_distances[vertex] = row[order[-1]]
         max_distances_min = max_distances[max_distances > 0].min()
         return (max_distances == max_distances_min).nonzero()[0]
 
@@ -262,21 +395,213 @@ class Graph(ReadOnly):
            vertex in another list. In case of a molecular graph, this would
            yield the atoms that belong to individual molecules.
         """
-        candidates = set(range(self.num_vertices))
+        return [group.tolist() for group in self.component_groups]
 
-        result = []
-        while len(candidates) > 0:
-            pivot = candidates.pop()
-            group = [
-                vertex for vertex, distance
-                in self.iter_breadth_first(pivot)
-            ]
-            candidates.difference_update(group)
+    @cached
+    def component_labels(self):
+        """An array with the index of the connected component of each vertex
 
-            # this sort makes sure that the order of the vertices is respected
-            group.sort()
-            result.append(group)
-        return result
+           The components are numbered in the order of their lowest vertex.
+        """
+        from molmod.ext import graphs_components
+        labels, num_components = graphs_components(
+            self.num_vertices, self.edge_array.astype(int)
+        )
+        return labels
+
+    @cached
+    def component_groups(self):
+        """A list with an array of vertices for each connected component
+
+           The vertices in each array are sorted and the arrays are sorted by
+           their first vertex.
+        """
+        if self.num_vertices == 0:
+            return []
+        labels = self.component_labels
+        order = labels.argsort(kind="mergesort")
+        counts = np.bincount(labels)
+        return np.split(order, counts.cumsum()[:-1])
+
+    @cached
+    def _dfs_forest(self):
+        """A depth-first spanning forest with Tarjan's bookkeeping
+
+           Returns a tuple ``(order, pre, parent, size, low, root, blocks)``
+           with the following lists:
+
+           * ``order``: all vertices in preorder
+           * ``pre``: the preorder index of each vertex
+           * ``parent``: the parent of each vertex in the tree (-1 for roots)
+           * ``size``: the number of vertices in the subtree of each vertex
+           * ``low``: the lowest preorder index that can be reached from the
+             subtree of each vertex with a single back edge
+           * ``root``: the root of the tree of each vertex
+           * ``blocks``: the vertices in each biconnected component
+
+           The subtree of vertex ``v`` consists of
+           ``order[pre[v]:pre[v]+size[v]]``.
+        """
+        indptr, indices = self.csr
+        indptr = indptr.tolist()
+        indices = indices.tolist()
+        order = []
+        pre = [-1]*self.num_vertices
+        parent = [-1]*self.num_vertices
+        size = [1]*self.num_vertices
+        low = [0]*self.num_vertices
+        root = [-1]*self.num_vertices
+        blocks = []
+        edge_stack = []
+        for start in range(self.num_vertices):
+            if pre[start] != -1:
+                continue
+            pre[start] = len(order)
+            low[start] = pre[start]
+            root[start] = start
+            order.append(start)
+            stack = [[start, indptr[start]]]
+            while len(stack) > 0:
+                top = stack[-1]
+                vertex = top[0]
+                if top[1] < indptr[vertex+1]:
+                    neighbor = indices[top[1]]
+                    top[1] += 1
+                    if pre[neighbor] == -1:
+                        # tree edge
+                        parent[neighbor] = vertex
+                        pre[neighbor] = len(order)
+                        low[neighbor] = pre[neighbor]
+                        root[neighbor] = start
+                        order.append(neighbor)
+                        edge_stack.append((vertex, neighbor))
+                        stack.append([neighbor, indptr[neighbor]])
+                    elif neighbor != parent[vertex] and pre[neighbor] < pre[vertex]:
+                        # back edge
+                        edge_stack.append((vertex, neighbor))
+                        if pre[neighbor] < low[vertex]:
+                            low[vertex] = pre[neighbor]
+                else:
+                    stack.pop()
+                    up = parent[vertex]
+                    if up == -1:
+                        continue
+                    size[up] += size[vertex]
+                    if low[vertex] < low[up]:
+                        low[up] = low[vertex]
+                    if low[vertex] >= pre[up]:
+                        # up separates the subtree of vertex from the rest.
+                        block = set()
+                        while True:
+                            edge = edge_stack.pop()
+                            block.update(edge)
+                            if edge == (up, vertex):
+                                break
+                        blocks.append(sorted(block))
+        return order, pre, parent, size, low, root, blocks
+
+    @cached
+    def _cut_labels(self):
+        """Labels to detect bridges and pairs of edges that cut the graph
+
+           Returns a tuple ``(labels, children)``. For each edge, ``children``
+           contains the vertex below the edge in the depth-first forest, or -1
+           for back edges. Each back edge gets a random 128-bit label and each
+           tree edge gets the XOR of the labels of all back edges that span
+           it. Bridges get a zero label. Two other edges separate the graph
+           if and only if their labels are equal. (The probability that two
+           labels coincide by accident is negligible.)
+        """
+        import random
+        order, pre, parent, size, low, root, blocks = self._dfs_forest
+        rng = random.Random(1)
+        back_labels = {}
+        work = [0]*self.num_vertices
+        labels = []
+        children = []
+        for a, b in self.edge_array.tolist():
+            if parent[b] == a:
+                children.append(b)
+            elif parent[a] == b:
+                children.append(a)
+            else:
+                children.append(-1)
+                key = (min(a, b), max(a, b))
+                label = back_labels.get(key)
+                if label is None:
+                    label = rng.getrandbits(128)
+                    back_labels[key] = label
+                    work[a] ^= label
+                    work[b] ^= label
+                labels.append(label)
+                continue
+            labels.append(None)
+        # accumulate the labels of the back edges leaving each subtree
+        for vertex in reversed(order):
+            up = parent[vertex]
+            if up != -1:
+                work[up] ^= work[vertex]
+        for index, child in enumerate(children):
+            if child != -1:
+                labels[index] = work[child]
+        return labels, children
+
+    @cached
+    def bridges(self):
+        """The indexes of the edges that disconnect the graph when removed"""
+        labels, children = self._cut_labels
+        return [
+            index for index, label in enumerate(labels)
+            if label == 0
+        ]
+
+    @cached
+    def articulation_points(self):
+        """The vertices that disconnect the graph when removed"""
+        order, pre, parent, size, low, root, blocks = self._dfs_forest
+        result = set()
+        num_children = [0]*self.num_vertices
+        for vertex in order:
+            up = parent[vertex]
+            if up == -1:
+                continue
+            num_children[up] += 1
+            if low[vertex] >= pre[up] and (parent[up] != -1 or num_children[up] > 1):
+                result.add(up)
+        return sorted(result)
+
+    @cached
+    def biconnected_components(self):
+        """Lists of vertices in each biconnected component (block)
+
+           Vertices that are not part of any edge do not belong to a block.
+           Articulation points belong to more than one block. Each bridge
+           forms a block with two vertices.
+        """
+        return self._dfs_forest[-1]
+
+    @cached
+    def block_cut_tree(self):
+        """The block-cut tree of the graph
+
+           The first ``len(self.biconnected_components)`` vertices of this
+           graph correspond to the blocks. The remaining vertices correspond to
+           the articulation points, in the order of
+           :attr:`articulation_points`. Each articulation point is connected to
+           all blocks it belongs to.
+        """
+        num_blocks = len(self.biconnected_components)
+        lookup = dict(
+            (vertex, num_blocks + index) for index, vertex
+            in enumerate(self.articulation_points)
+        )
+        edges = []
+        for index, block in enumerate(self.biconnected_components):
+            for vertex in block:
+                other = lookup.get(vertex)
+                if other is not None:
+                    edges.append((index, other))
+        return Graph(edges, num_blocks + len(lookup))
 
     @cached
     def fingerprint(self):
@@ -285,10 +610,7 @@ class Graph(ReadOnly):
            The result is invariant under permutation of the vertex indexes. The
            chance that two different (molecular) graphs yield the same
            fingerprint is small but not zero. (See unit tests.)"""
-        if self.num_vertices == 0:
-            return np.zeros(20, np.ubyte)
-        else:
-            return sum(self.vertex_fingerprints)
+        return self.vertex_fingerprints.sum(axis=0, dtype=np.ubyte)
 
     @cached
     def vertex_fingerprints(self):
@@ -306,25 +628,442 @@ class Graph(ReadOnly):
 
     @cached
     def equivalent_vertices(self):
-        """A dictionary with symmetrically equivalent vertices."""
-        level1 = {}
-        for i, row in enumerate(self.vertex_fingerprints):
-            key = row.tobytes()
-            l = level1.get(key)
-            if l is None:
-                l = set([i])
-                level1[key] = l
-            else:
-                l.add(i)
-        level2 = {}
-        for key, vertices in level1.items():
+        """A dictionary with symmetrically equivalent vertices.
+
+           Vertices are considered equivalent when they have the same color
+           after refining the partition of the vertex fingerprints (see
+           :meth:`_refine_colors`). This is cheap and, for nearly all molecular
+           graphs, identical to the orbits under the graph symmetries. The
+           exact orbits are available as :attr:`symmetry_orbits`, at the cost
+           of a search for the symmetry group. Vertices that are equivalent
+           share the same set object.
+        """
+        groups = {}
+        for vertex, color in enumerate(self._refined_colors[0]):
+            groups.setdefault(color, set([])).add(vertex)
+        result = {}
+        for vertices in groups.values():
             for vertex in vertices:
-                level2[vertex] = vertices
-        return level2
+                result[vertex] = vertices
+        return result
+
+    @cached
+    def _refined_colors(self):
+        """The equitable refinement of the initial colors and its trace"""
+        return self._refine_colors(self._symmetry_adjacency[0])
+
+    @cached
+    def _component_classes(self):
+        """Groups of identical connected components
+
+           Returns a list of pairs ``(subgraph, members)``, sorted by the
+           canonical strings of the components. The subgraph is the first
+           component of the group. Each element of ``members`` is an array with
+           the vertices of one component in canonical order, such that
+           corresponding positions in two members are related by an
+           isomorphism.
+        """
+        classes = {}
+        for vertices in self.component_groups:
+            subgraph = self.get_subgraph(vertices, normalize=True)
+            key = subgraph.canonical_string
+            if key not in classes:
+                classes[key] = (subgraph, [])
+            classes[key][1].append(vertices[np.argsort(subgraph.canonical_labels)])
+        return [classes[key] for key in sorted(classes)]
+
+    @property
+    def _factor_components(self):
+        """Whether the symmetries are derived from the individual components"""
+        return len(self.component_groups) > 1
+
+    @cached
+    def _symmetry_adjacency(self):
+        """Initial colors, neighbors, labeled edges and edge labels
+
+           The initial colors are the ranks of the vertex strings combined with
+           the vertex fingerprints. The edge labels are the ranks of the edge
+           strings. They are used to refine vertex partitions in
+           :attr:`_automorphisms` and :attr:`canonical_labels`.
+        """
+        vertex_keys = [
+            (self.get_vertex_string(i), self.vertex_fingerprints[i].tobytes())
+            for i in range(self.num_vertices)
+        ]
+        edge_strings = [self.get_edge_string(i) for i in range(self.num_edges)]
+        vertex_ranks = dict((s, i) for i, s in enumerate(sorted(set(vertex_keys))))
+        edge_ranks = dict((s, i) for i, s in enumerate(sorted(set(edge_strings))))
+        colors = [vertex_ranks[s] for s in vertex_keys]
+        edge_labels = [edge_ranks[s] for s in edge_strings]
+        adjacency = [[] for vertex in range(self.num_vertices)]
+        labeled_edges = set([])
+        for (vertex1, vertex2), label in zip(self.edge_array.tolist(), edge_labels):
+            adjacency[vertex1].append((label, vertex2))
+            adjacency[vertex2].append((label, vertex1))
+            labeled_edges.add((min(vertex1, vertex2), max(vertex1, vertex2), label))
+        return colors, adjacency, labeled_edges, edge_labels
+
+    def _refine_colors(self, colors):
+        """Refine a vertex coloring until it is equitable
+
+           Argument:
+            | ``colors``  --  a list with a color (a non-negative integer) for
+                              each vertex
+
+           Returns the refined colors and a trace. The colors are ranks of
+           vertex signatures that only depend on the colors of the vertices,
+           their neighbors and the edges. The trace contains the sorted
+           signatures of each refinement step. Two colorings can only be
+           related by a symmetry when their traces are equal.
+        """
+        adjacency = self._symmetry_adjacency[1]
+        trace = []
+        num_colors = len(set(colors))
+        while True:
+            signatures = [
+                (colors[vertex], tuple(sorted((label, colors[other]) for label, other in adjacency[vertex])))
+                for vertex in range(self.num_vertices)
+            ]
+            distinct = sorted(set(signatures))
+            trace.append(tuple(distinct))
+            ranks = dict((signature, rank) for rank, signature in enumerate(distinct))
+            colors = [ranks[signature] for signature in signatures]
+            if len(distinct) == num_colors:
+                return colors, tuple(trace)
+            num_colors = len(distinct)
+
+    def _individualize(self, colors, vertex):
+        """Give a vertex a unique color and refine the result"""
+        colors = [2*color + 1 for color in colors]
+        colors[vertex] -= 1
+        return self._refine_colors(colors)
+
+    @staticmethod
+    def _get_target_cell(colors):
+        """The vertices of the first non-singleton cell of a coloring, or None"""
+        cells = {}
+        for vertex, color in enumerate(colors):
+            cells.setdefault(color, []).append(vertex)
+        for color in sorted(cells):
+            if len(cells[color]) > 1:
+                return cells[color]
+        return None
+
+    @cached
+    def _automorphisms(self):
+        """A generating set and a stabilizer chain of the symmetry group
+
+           The symmetries are found with an individualization-refinement
+           search, similar to nauty. The first path in the search tree
+           individualizes the lowest vertex of the first non-singleton cell,
+           until the partition is discrete. For each level on this path, from
+           the deepest one upwards, the other vertices in the target cell are
+           tried, unless they are already in the same orbit as the first path
+           vertex. A leaf with the same trace as the first leaf that also
+           preserves all (labeled) edges yields a new generator.
+
+           Returns a list of generators and the stabilizer chain. Each element
+           of the chain is a pair ``(vertex, transversal)``, where transversal
+           is a dictionary that maps each vertex ``other`` in the orbit of
+           ``vertex``, under the symmetries that fix all previous vertices in
+           the chain, to such a symmetry that maps ``vertex`` on ``other``.
+           Generators and symmetries are integer arrays with the image of each
+           vertex.
+        """
+        colors, trace = self._refined_colors
+        # A) the first path
+        path = []
+        cell = self._get_target_cell(colors)
+        while cell is not None:
+            path.append((colors, trace, cell))
+            colors, trace = self._individualize(colors, cell[0])
+            cell = self._get_target_cell(colors)
+        # the leaf of the first path, i.e. the vertex at each position
+        leaf_vertices = np.zeros(self.num_vertices, int)
+        leaf_vertices[colors] = np.arange(self.num_vertices)
+        leaf_trace = trace
+        labeled_edges = self._symmetry_adjacency[2]
+
+        def iter_leafs(colors, trace, level):
+            """Iterate over leaf colorings with the same traces as the first path"""
+            if level == len(path):
+                if trace == leaf_trace:
+                    yield colors
+                return
+            if trace != path[level][1]:
+                return
+            for vertex in self._get_target_cell(colors):
+                child_colors, child_trace = self._individualize(colors, vertex)
+                for leaf_colors in iter_leafs(child_colors, child_trace, level+1):
+                    yield leaf_colors
+
+        def get_symmetry(leaf_colors):
+            """Return the permutation between the first leaf and another leaf"""
+            other_vertices = np.zeros(self.num_vertices, int)
+            other_vertices[leaf_colors] = np.arange(self.num_vertices)
+            permutation = np.zeros(self.num_vertices, int)
+            permutation[leaf_vertices] = other_vertices
+            for vertex1, vertex2, label in labeled_edges:
+                image1 = permutation[vertex1]
+                image2 = permutation[vertex2]
+                if (min(image1, image2), max(image1, image2), label) not in labeled_edges:
+                    return None
+            return permutation
+
+        def get_transversal(vertex, generators):
+            """The orbit of vertex with a symmetry for each element"""
+            transversal = {vertex: np.arange(self.num_vertices)}
+            todo = [vertex]
+            while len(todo) > 0:
+                current = todo.pop(0)
+                for generator in generators:
+                    other = generator[current]
+                    if other not in transversal:
+                        transversal[other] = generator[transversal[current]]
+                        todo.append(other)
+            return transversal
+
+        # B) the other branches of the first path
+        generators = []
+        chain = []
+        for level in range(len(path)-1, -1, -1):
+            colors, trace, cell = path[level]
+            vertex = cell[0]
+            transversal = get_transversal(vertex, generators)
+            for other in cell[1:]:
+                if other in transversal:
+                    continue
+                other_colors, other_trace = self._individualize(colors, other)
+                for leaf_colors in iter_leafs(other_colors, other_trace, level+1):
+                    symmetry = get_symmetry(leaf_colors)
+                    if symmetry is not None:
+                        generators.append(symmetry)
+                        transversal = get_transversal(vertex, generators)
+                        break
+            if len(transversal) > 1:
+                chain.append((vertex, transversal))
+        chain.reverse()
+        return generators, chain
+
+    @cached
+    def symmetry_generators(self):
+        """A set of graph symmetries that generates all graph symmetries
+
+           Each symmetry is an integer array with the image of each vertex.
+           Unlike :attr:`symmetries`, the group of symmetries is not
+           enumerated, which is feasible for highly symmetric graphs. The
+           symmetries must preserve the vertex and edge strings.
+        """
+        if not self._factor_components:
+            return self._automorphisms[0]
+        # The symmetries of a graph with several components are generated by
+        # the symmetries of one component of each group of identical
+        # components and by swaps of consecutive identical components.
+        result = []
+        for subgraph, members in self._component_classes:
+            # the vertices of the first member in the order of the subgraph
+            vertices = members[0][subgraph.canonical_labels]
+            for generator in subgraph.symmetry_generators:
+                symmetry = np.arange(self.num_vertices)
+                symmetry[vertices] = vertices[generator]
+                result.append(symmetry)
+            for member1, member2 in zip(members[:-1], members[1:]):
+                symmetry = np.arange(self.num_vertices)
+                symmetry[member1] = member2
+                symmetry[member2] = member1
+                result.append(symmetry)
+        return result
+
+    @cached
+    def symmetry_order(self):
+        """The number of graph symmetries, including the identity"""
+        result = 1
+        if self._factor_components:
+            for subgraph, members in self._component_classes:
+                for index in range(len(members)):
+                    result *= subgraph.symmetry_order*(index + 1)
+            return result
+        for vertex, transversal in self._automorphisms[1]:
+            result *= len(transversal)
+        return result
+
+    @cached
+    def symmetry_orbits(self):
+        """Lists of vertices that are mapped onto each other by symmetries
+
+           Each orbit is sorted and the orbits are sorted by their first
+           vertex. The symmetry group is only searched when the refined
+           partition of :attr:`equivalent_vertices` is not discrete. Identical
+           components, e.g. solvent molecules, are treated only once.
+        """
+        if len(set(self._refined_colors[0])) == self.num_vertices:
+            return [[vertex] for vertex in range(self.num_vertices)]
+        pairs = [np.zeros((0, 2), int)]
+        for generator in self.symmetry_generators:
+            moved = (generator != np.arange(self.num_vertices)).nonzero()[0]
+            pairs.append(np.array([moved, generator[moved]]).T)
+        return Graph.from_arrays(np.concatenate(pairs), self.num_vertices).independent_vertices
+
+    def iter_symmetry_permutations(self, accept=None):
+        """Iterate over all graph symmetries as integer arrays
+
+           Optional argument:
+            | ``accept``  --  a function that is called with two arrays: a
+                              number of vertices and their images. When it
+                              returns False, all symmetries that map these
+                              vertices on these images are skipped.
+
+           The symmetries are generated from the stabilizer chain. The
+           ``accept`` function makes it possible to search for a subgroup, e.g.
+           geometric symmetries, without enumerating all symmetries.
+        """
+        chain = self._automorphisms[1]
+        vertices = np.array([vertex for vertex, transversal in chain], int)
+
+        def iter_recursive(level, current):
+            if level == len(chain):
+                yield current
+                return
+            vertex, transversal = chain[level]
+            for other in sorted(transversal):
+                new = current[transversal[other]]
+                if accept is not None and not accept(vertices[:level+1], new[vertices[:level+1]]):
+                    continue
+                for permutation in iter_recursive(level+1, new):
+                    yield permutation
+
+        for permutation in iter_recursive(0, np.arange(self.num_vertices)):
+            yield permutation
+
+    @cached
+    def canonical_labels(self):
+        """The position of each vertex in a canonical order
+
+           The canonical order only depends on the connectivity and the vertex
+           and edge strings, not on the initial order of the vertices. It is
+           the leaf of the individualization-refinement search tree (see
+           :attr:`_automorphisms`) with the smallest traces and edges, in the
+           spirit of nauty. Subtrees that are equivalent under the graph
+           symmetries are not visited. The vertex fingerprints define the
+           initial partition.
+
+           Two graphs are isomorphic if and only if they become identical after
+           reordering their vertices with ``canonical_labels``. See
+           :attr:`canonical_string`.
+
+           The components of a disconnected graph are labeled separately and
+           concatenated in the order of their canonical strings.
+        """
+        if self._factor_components:
+            result = np.zeros(self.num_vertices, int)
+            offset = 0
+            for subgraph, members in self._component_classes:
+                for vertices in members:
+                    result[vertices] = np.arange(offset, offset + len(vertices))
+                    offset += len(vertices)
+            return result
+        adjacency = self._symmetry_adjacency
+        initial_colors = np.array(adjacency[0], int)
+        edge_labels = adjacency[3]
+        # The search visits the first path of the automorphism search first,
+        # such that the generators that fix its vertices generate the exact
+        # stabilizers.
+        generators = list(self.symmetry_generators)
+        best = [None, None, None]
+
+        def get_key(colors):
+            """The vertex colors and the edges in the order of the leaf"""
+            vertices = np.zeros(self.num_vertices, int)
+            vertices[colors] = np.arange(self.num_vertices)
+            edges = np.array(colors)[self.edge_array] if self.num_edges > 0 else np.zeros((0, 2), int)
+            edges.sort(axis=1)
+            records = sorted(zip(edges[:, 0].tolist(), edges[:, 1].tolist(), edge_labels))
+            return tuple(initial_colors[vertices].tolist()), tuple(records)
+
+        def search(colors, traces, prefix):
+            """Recursive depth-first search for the smallest leaf"""
+            if best[0] is not None:
+                size = min(len(traces), len(best[0]))
+                if traces[:size] > best[0][:size]:
+                    return
+                if traces[:size] == best[0][:size] and len(traces) > len(best[0]):
+                    return
+            cell = self._get_target_cell(colors)
+            if cell is None:
+                key = get_key(colors)
+                if best[0] is None or (traces, key) < (best[0], best[1]):
+                    best[:] = traces, key, colors
+                elif (traces, key) == (best[0], best[1]):
+                    # two leafs with the same key are related by a symmetry
+                    symmetry = np.zeros(self.num_vertices, int)
+                    symmetry[np.array(best[2])] = np.arange(self.num_vertices)
+                    generators.append(symmetry[colors])
+                return
+            # only one vertex of each orbit of the stabilizer of the prefix
+            orbits = {}
+            fixing = [
+                generator for generator in generators
+                if (generator[prefix] == prefix).all()
+            ]
+            for vertex in cell:
+                if vertex in orbits:
+                    continue
+                orbit = set([vertex])
+                todo = [vertex]
+                while len(todo) > 0:
+                    current = todo.pop()
+                    for generator in fixing:
+                        other = generator[current]
+                        if other not in orbit:
+                            orbit.add(other)
+                            todo.append(other)
+                for other in orbit:
+                    orbits[other] = vertex
+                child_colors, child_trace = self._individualize(colors, vertex)
+                search(child_colors, traces + [child_trace], prefix + [vertex])
+
+        colors, trace = self._refine_colors(adjacency[0])
+        search(colors, [trace], [])
+        return np.array(best[2], int)
+
+    @cached
+    def canonical_string(self):
+        """A byte string that is identical for all isomorphic graphs
+
+           It contains the number of vertices, the vertex strings in the order
+           of :attr:`canonical_labels` and the sorted edges with their edge
+           strings. Two graphs are isomorphic if and only if their canonical
+           strings are equal. This makes it possible to look up graphs in a
+           dictionary instead of comparing them pairwise with
+           :meth:`full_match`.
+        """
+        labels = self.canonical_labels
+        vertices = np.zeros(self.num_vertices, int)
+        vertices[labels] = np.arange(self.num_vertices)
+        edges = sorted(
+            (min(labels[vertex1], labels[vertex2]), max(labels[vertex1], labels[vertex2]), self.get_edge_string(i))
+            for i, (vertex1, vertex2) in enumerate(self.edge_array.tolist())
+        )
+        return ("%i|%s|%s" % (
+            self.num_vertices,
+            ",".join(self.get_vertex_string(vertex) for vertex in vertices),
+            ",".join("%i-%i:%s" % edge for edge in edges),
+        )).encode("utf-8")
+
+    @cached
+    def canonical_hash(self):
+        """The SHA1 hex digest of the :attr:`canonical_string`"""
+        import hashlib
+        return hashlib.sha1(self.canonical_string).hexdigest()
 
     @cached
     def symmetries(self):
-        """Graph symmetries (permutations) that map the graph onto itself."""
+        """Graph symmetries (permutations) that map the graph onto itself.
+
+           All symmetries are enumerated explicitly. For highly symmetric
+           graphs, use :attr:`symmetry_generators`, :attr:`symmetry_orbits`
+           or :meth:`iter_symmetry_permutations` instead.
+        """
 
         symmetry_cycles = set([])
         symmetries = set([])
@@ -357,23 +1096,22 @@ class Graph(ReadOnly):
            reduce=True as second argument. This will return a complete canonical
            graph.
 
-           The routine is designed not to use symmetry relations that are
-           obtained with the GraphSearch routine. We also tried to create an
-           ordering that feels like natural, i.e. starting in the center and
-           pushing vertices with few equivalents to the front. If necessary, the
-           nature of the vertices and  their bonds to atoms closer to the center
-           will also play a role, but only as a last resort.
+           We tried to create an ordering that feels like natural, i.e.
+           starting in the center and pushing vertices with few equivalents to
+           the front. If necessary, the nature of the vertices and  their bonds
+           to atoms closer to the center will also play a role. Remaining ties
+           are broken with the :attr:`canonical_labels`.
         """
+        labels = self.canonical_labels
         # A) find an appropriate starting vertex.
         # Here we take a central vertex that has a minimal number of symmetrical
         # equivalents, 'the highest atom number', and the highest fingerprint.
-        # Note that the symmetrical equivalents are computed from the vertex
-        # fingerprints, i.e. without the GraphSearch.
         starting_vertex = max(
             (
                 -len(self.equivalent_vertices[vertex]),
                 self.get_vertex_string(vertex),
                 self.vertex_fingerprints[vertex].tobytes(),
+                -labels[vertex],
                 vertex
             ) for vertex in self.central_vertices
         )[-1]
@@ -383,49 +1121,170 @@ class Graph(ReadOnly):
         #      2) number of equivalent vertices
         #      3) vertex string, (higher atom numbers come first)
         #      4) fingerprint
-        #      5) vertex index
+        #      5) canonical label
+        #      6) vertex index
         # The last field is only included to collect the result of the sort.
-        # The fingerprint on itself would be sufficient, but the three first are
-        # there to have a naturally appealing result.
+        # The canonical label on itself would be sufficient, but the first four
+        # are there to have a naturally appealing result. Symmetrically
+        # equivalent vertices, e.g. the four hydrogen atoms in allene, can only
+        # be ordered with the canonical labels.
+        order, distances, parents = self.get_breadth_first(starting_vertex)
+        order = order[np.diff(self.csr[0])[order] > 0]
         l = [
             [
                 -distance,
                 -len(self.equivalent_vertices[vertex]),
                 self.get_vertex_string(vertex),
                 self.vertex_fingerprints[vertex].tobytes(),
+                -labels[vertex],
                 vertex
-            ] for vertex, distance in self.iter_breadth_first(starting_vertex)
-            if len(self.neighbors[vertex]) > 0
+            ] for vertex, distance in zip(order.tolist(), distances[order].tolist())
         ]
         l.sort(reverse=True)
 
-        # C) The order of some vertices is still not completely set. e.g.
-        # consider the case of allene. The four hydrogen atoms are equivalent,
-        # but one can have two different orders: make geminiles consecutive or
-        # don't. It is more trikcy than one would think at first sight. In the
-        # case of allene, geminility could easily solve the problem. Consider a
-        # big flat rotationally symmetric molecule (order 2). The first five
-        # shells are order 4 and one would just give a random order to four
-        # segemnts in the first shell. Only when one reaches the outer part that
-        # has order two, it turns out that the arbitrary choices in the inner
-        # shell play a role. So it does not help to look at relations with
-        # vertices at inner or current shells only. One has to consider the
-        # whole picture. (unit testing reveals troubles like these)
-
-        # I need some sleep now. The code below checks for potential fuzz and
-        # will raise an error if the ordering is not fully determined yet. One
-        # day, I'll need this code more than I do now, and I'll fix things up.
-        # I know how to do this, but I don't care enough right now.
-        # -- Toon
-        for i in range(1, len(l)):
-            if l[i][:-1] == l[i-1][:-1]:
-                raise NotImplementedError
-
-        # D) Return only the vertex indexes.
+        # C) Return only the vertex indexes.
         return [record[-1] for record in l]
 
     # other usefull graph functions
 
+    def _get_breadth_first(self, start, cache=False):
+        """Return the breadth first order and distances from a start vertex
+
+           The first return value is the array of vertices that can be reached
+           from ``start``, in the order of a breadth first search. The second
+           is an integer array with the distances from ``start`` to all
+           vertices, using the same conventions as the rows of
+           :attr:`distances`, i.e. zero for unreachable vertices.
+
+           When ``cache`` is True, the result is stored for later use.
+        """
+        result = self._breadth_first_cache.get(start)
+        if result is not None:
+            return result
+        order, row, parents = self.get_breadth_first(start)
+        row[row == -1] = 0
+        result = order, row
+        if cache:
+            self._breadth_first_cache[start] = result
+        return result
+
+    def _check_start(self, start):
+        """Return a valid start vertex for a breadth first search"""
+        if start is None:
+            return self.central_vertex
+        try:
+            start = int(start)
+        except ValueError:
+            raise TypeError("First argument (start) must be an integer.")
+        if start < 0 or start >= self.num_vertices:
+            raise ValueError("start must be in the range [0, %i[" %
+                             self.num_vertices)
+        return start
+
+    def get_breadth_first(self, start=None):
+        """Compiled breadth first search, returning arrays
+
+           Optional argument:
+            | ``start`` -- the start vertex. If not given, the central vertex
+                           is taken.
+
+           Returns a tuple ``(order, distances, parents)``: the vertices that
+           can be reached from ``start`` in the order of the breadth first
+           search, the distance of each vertex from ``start`` and the vertex
+           from which each vertex is reached first. Unreachable vertices have
+           distance -1. Parents are -1 for ``start`` and for unreachable
+           vertices.
+
+           This is the array counterpart of :meth:`iter_breadth_first`.
+        """
+        from molmod.ext import graphs_breadth_first
+        start = self._check_start(start)
+        indptr, indices = self.csr
+        return graphs_breadth_first(indptr, indices, start)
+
+    def get_breadth_first_edges(self, start=None):
+        """Compiled breadth first classification of edges, returning arrays
+
+           Optional argument:
+            | ``start`` -- the start vertex. If not given, the central vertex
+                           is taken.
+
+           Returns a tuple ``(edges, distances, kinds)`` with the edges that
+           can be reached from ``start``, in the same order as
+           :meth:`iter_breadth_first_edges`. The first vertex of each edge is
+           at the given distance from ``start``. The kinds array contains 0
+           for edges of the breadth first tree, 1 for edges between vertices
+           at the same distance and 2 for other edges towards the next
+           distance.
+
+           This is the array counterpart of :meth:`iter_breadth_first_edges`.
+        """
+        from molmod.ext import graphs_breadth_first
+        start = self._check_start(start)
+        indptr, indices = self.csr
+        return graphs_breadth_first(indptr, indices, start, True)[3:]
+
+    def distances_from(self, source):
+        """The shortest path lengths from one vertex to all other vertices
+
+           Argument:
+            | ``source``  --  the vertex from which the distances are measured
+
+           The result is equal to ``self.distances[source]``, but it is
+           computed with a single breadth first search instead of the all-pairs
+           algorithm. Results are cached per source vertex.
+        """
+        source = int(source)
+        if source < 0 or source >= self.num_vertices:
+            raise ValueError("source must be in the range [0, %i[" %
+                             self.num_vertices)
+        if "_cache_distances" in self.__dict__:
+            return self.distances[source]
+        return self._get_breadth_first(source, cache=True)[1]
+
+    def distances_within(self, max_distance=None):
+        """All pairs of vertices that are at most ``max_distance`` edges apart
+
+           Optional argument:
+            | ``max_distance``  --  the largest shortest path length that is
+                                    included in the result. When not given,
+                                    all connected pairs are returned.
+
+           Returns two arrays: ``pairs`` with shape (M, 2) and ``lengths`` with
+           shape (M,). Each row of ``pairs`` contains two vertices i < j whose
+           shortest path length, ``lengths[k]``, is not larger than
+           ``max_distance``. The rows are sorted by i and then by j.
+
+           This is a sparse alternative for the :attr:`distances` matrix. One
+           compiled breadth first search per vertex is carried out, each
+           truncated at ``max_distance``, and the dense matrix is never
+           constructed.
+        """
+        result = self._distances_within_cache.get(max_distance)
+        if result is None:
+            result = self._compute_distances_within(max_distance)
+            self._distances_within_cache[max_distance] = result
+        return result
+
+    def _compute_distances_within(self, max_distance):
+        """Compute the result of :meth:`distances_within`"""
+        if (max_distance is not None and max_distance < 1) or self.num_vertices == 0:
+            return np.zeros((0, 2), int), np.zeros(0, int)
+        if "_cache_distances" in self.__dict__:
+            mask = self.distances > 0
+            if max_distance is not None:
+                mask &= self.distances <= max_distance
+            mask = np.triu(mask, 1)
+            pairs = np.array(mask.nonzero()).T
+            return pairs, self.distances[mask]
+        from molmod.ext import graphs_distances_within
+        indptr, indices = self.csr
+        pairs, lengths = graphs_distances_within(
+            indptr, indices, -1 if max_distance is None else max_distance)
+        # The search from vertex i yields its pairs in breadth first order.
+        order = np.argsort(pairs[:, 0]*self.num_vertices + pairs[:, 1], kind="mergesort")
+        return pairs[order], lengths[order]
+
     def iter_breadth_first(self, start=None, do_paths=False, do_duplicates=False):
         """Iterate over the vertices with the breadth first algorithm.
 
@@ -440,20 +1299,18 @@ class Graph(ReadOnly):
            different  paths of equal length, will be iterated twice. This
            typically only makes sense when path==True.
         """
-        if start is None:
-            start = self.central_vertex
-        else:
-            try:
-                start = int(start)
-            except ValueError:
-                raise TypeError("First argument (start) must be an integer.")
-            if start < 0 or start >= self.num_vertices:
-                raise ValueError("start must be in the range [0, %i[" %
-                                 self.num_vertices)
+        start = self._check_start(start)
+        order, row = self._get_breadth_first(start)
+        if not (do_paths or do_duplicates):
+            for vertex, distance in zip(order.tolist(), row[order].tolist()):
+                yield vertex, distance
+            return
+        # The distances from the single-source search tell where to go next,
+        # such that only the paths have to be constructed below.
         from collections import deque
-        work = np.zeros(self.num_vertices, int)
-        work[:] = -1
-        work[start] = 0
+        indptr, indices = self.csr
+        work = np.zeros(self.num_vertices, bool)
+        work[start] = True
         if do_paths:
             result = (start, 0, (start, ))
         else:
@@ -466,10 +1323,11 @@ class Graph(ReadOnly):
             else:
                 parent, parent_length = todo.popleft()
             current_length = parent_length + 1
-            for current in self.neighbors[parent]:
-                visited = work[current]
-                if visited == -1 or (do_duplicates and visited == current_length):
-                    work[current] = current_length
+            for current in indices[indptr[parent]:indptr[parent+1]].tolist():
+                if row[current] != current_length:
+                    continue
+                if do_duplicates or not work[current]:
+                    work[current] = True
                     if do_paths:
                         current_path = parent_path + (current, )
                         result = (current, current_length, current_path)
@@ -480,16 +1338,43 @@ class Graph(ReadOnly):
                     todo.append(result)
 
     def iter_shortest_paths(self, a, b):
-        """Iterate over all the shortest paths between vertex a and b."""
-        max_len = None
-        ibf = self.iter_breadth_first(a, do_paths=True, do_duplicates=True)
-        for vertex, length, path in ibf:
-            if max_len is not None:
-                if length > max_len:
-                    return
-            if vertex == b:
-                max_len = length
-                yield path
+        """Iterate over all the shortest paths between vertex a and b.
+
+           The distances to ``b`` are computed with the compiled breadth first
+           search. The paths are then built depth first, only following the
+           neighbors that are one step closer to ``b``. They come out in the
+           same order as in a breadth first search over all paths from ``a``.
+        """
+        a = self._check_start(a)
+        b = self._check_start(b)
+        if a == b:
+            yield (a, )
+            return
+        indptr, indices = self.csr
+        distances = self.get_breadth_first(b)[1]
+        if distances[a] < 0:
+            return
+
+        def get_closer(vertex):
+            """Neighbors one step closer to b, reversed for popping"""
+            neighbors = indices[indptr[vertex]:indptr[vertex+1]]
+            mask = distances[neighbors] == distances[vertex] - 1
+            return neighbors[mask].tolist()[::-1]
+
+        path = [a]
+        todo = [get_closer(a)]
+        while len(todo) > 0:
+            candidates = todo[-1]
+            if len(candidates) == 0:
+                todo.pop()
+                path.pop()
+            else:
+                vertex = candidates.pop()
+                if vertex == b:
+                    yield tuple(path) + (b, )
+                else:
+                    path.append(vertex)
+                    todo.append(get_closer(vertex))
 
     def iter_breadth_first_edges(self, start=None):
         """Iterate over the edges with the breadth first convention.
@@ -504,35 +1389,215 @@ class Graph(ReadOnly):
            starting vertex to edge[0] is equal to the distance variable and the
            distance from edge[1] to the starting vertex is equal to distance+1.
            One item has the following format: ((i, j), distance, flag)
+
+           See :meth:`get_breadth_first_edges` for the array version.
         """
-        if start is None:
-            start = self.central_vertex
-        else:
-            try:
-                start = int(start)
-            except ValueError:
-                raise TypeError("First argument (start) must be an integer.")
-            if start < 0 or start >= self.num_vertices:
-                raise ValueError("start must be in the range [0, %i[" %
-                                 self.num_vertices)
-        from collections import deque
-        work = np.zeros(self.num_vertices, int)
-        work[:] = -1
-        work[start] = 0
-        todo = deque([start])
-        while len(todo) > 0:
-            parent = todo.popleft()
-            distance = work[parent]
-            for current in self.neighbors[parent]:
-                if work[current] == -1:
-                    yield (parent, current), distance, False
-                    work[current] = distance+1
-                    todo.append(current)
-                elif work[current] == distance and current > parent:
-                    # second equation in elif avoids duplicates
-                    yield (parent, current), distance, True
-                elif work[current] == distance+1:
-                    yield (parent, current), distance, False
+        edges, distances, kinds = self.get_breadth_first_edges(start)
+        for (i, j), distance, kind in zip(edges.tolist(), distances.tolist(), kinds.tolist()):
+            yield (i, j), distance, kind == 1
+
+    def _iter_ring_prototypes(self, max_size):
+        """Iterate over groups of candidate cycles with increasing size
+
+           Argument:
+            | ``max_size``  --  the maximum number of vertices in a cycle
+
+           For each vertex ``r``, a shortest path tree is grown level by level
+           in the subgraph of the vertices with an index not larger than
+           ``r``. Each edge ``y``, ``z`` between two vertices at the same
+           distance, or each pair of predecessors ``p``, ``q`` of a vertex
+           ``y``, defines one prototype cycle with the paths to ``r`` in the
+           tree (Vismara, Electron. J. Comb. 4 (1997)). The trees of all roots
+           grow simultaneously, such that the prototypes are yielded in groups
+           ``(size, prototypes)`` with increasing size. Each prototype is a
+           tuple ``(predecessors, half1, middle, half2)``, where
+           ``predecessors`` maps every vertex in the tree of ``r`` on its
+           neighbors one step closer to ``r``.
+        """
+        indptr, indices = self.csr
+        trees = [({root: 0}, {root: []}, [root]) for root in range(self.num_vertices)]
+        distance = 0
+        while 2*distance + 1 <= max_size:
+            odd = []
+            even = []
+            active = False
+            for root, (distances, predecessors, frontier) in enumerate(trees):
+                if len(frontier) == 0:
+                    continue
+                active = True
+                new_frontier = []
+                for vertex in frontier:
+                    for other in indices[indptr[vertex]:indptr[vertex+1]].tolist():
+                        if other > root:
+                            continue
+                        other_distance = distances.get(other)
+                        if other_distance is None:
+                            distances[other] = distance + 1
+                            predecessors[other] = [vertex]
+                            new_frontier.append(other)
+                        elif other_distance == distance + 1:
+                            predecessors[other].append(vertex)
+                        elif other_distance == distance and other < vertex:
+                            odd.append((predecessors, vertex, (), other))
+                for vertex in new_frontier:
+                    closer = predecessors[vertex]
+                    for index, other1 in enumerate(closer):
+                        for other2 in closer[:index]:
+                            even.append((predecessors, other1, (vertex,), other2))
+                trees[root] = (distances, predecessors, new_frontier)
+            if not active:
+                return
+            yield 2*distance + 1, odd
+            if 2*distance + 2 <= max_size:
+                yield 2*distance + 2, even
+            distance += 1
+
+    def _get_rings(self, max_size):
+        """Return the relevant cycles and a minimum cycle basis
+
+           See :meth:`rings` and :meth:`sssr`.
+
+           Only the prototypes that are independent of all shorter cycles are
+           expanded into their family of cycles with the same two halves in
+           length (Vismara, Electron. J. Comb. 4 (1997)). The other members
+           of a family only differ by a sum of shorter cycles. The search
+           stops as soon as the basis spans all cycles of the graph.
+        """
+        if max_size is None:
+            max_size = self.num_vertices
+        edge_index = self.edge_index
+        rank = self.num_edges - self.num_vertices + len(self.component_groups)
+
+        def get_tree_path(predecessors, vertex):
+            """The path in the shortest path tree from vertex to its root"""
+            path = [vertex]
+            while len(predecessors[vertex]) > 0:
+                vertex = predecessors[vertex][0]
+                path.append(vertex)
+            return path
+
+        def iter_paths(predecessors, vertex):
+            """All shortest paths from vertex to the root of the tree"""
+            if len(predecessors[vertex]) == 0:
+                yield [vertex]
+                return
+            for predecessor in predecessors[vertex]:
+                for path in iter_paths(predecessors, predecessor):
+                    yield [vertex] + path
+
+        def iter_family(predecessors, half1, middle, half2):
+            """The cycles with two disjoint shortest paths to the root"""
+            paths2 = list(iter_paths(predecessors, half2))
+            for path1 in iter_paths(predecessors, half1):
+                set1 = set(path1[:-1])
+                for path2 in paths2:
+                    if set1.isdisjoint(path2[:-1]):
+                        yield tuple(path1[::-1]) + middle + tuple(path2[:-1])
+
+        def normalize(ring):
+            """Lowest vertex first, lowest neighbor second"""
+            start = ring.index(min(ring))
+            ring = ring[start:] + ring[:start]
+            if ring[-1] < ring[1]:
+                ring = ring[:1] + ring[:0:-1]
+            return ring
+
+        def get_vector(ring):
+            """The edges of the ring as a bit vector"""
+            vector = 0
+            for index in range(len(ring)):
+                vector |= 1 << edge_index[frozenset([ring[index-1], ring[index]])]
+            return vector
+
+        def reduce(vector, basis):
+            """Eliminate the pivots of the basis from a vector over GF(2)"""
+            while vector:
+                pivot = vector.bit_length() - 1
+                row = basis.get(pivot)
+                if row is None:
+                    break
+                vector ^= row
+            return vector
+
+        relevant = []
+        sssr = []
+        basis = {}
+        for size, prototypes in self._iter_ring_prototypes(max_size):
+            if len(basis) == rank:
+                break
+            # the basis of all cycles that are shorter than size
+            shorter = basis.copy()
+            found = set()
+            for predecessors, half1, middle, half2 in prototypes:
+                path1 = get_tree_path(predecessors, half1)
+                path2 = get_tree_path(predecessors, half2)
+                if not set(path1[:-1]).isdisjoint(path2[:-1]):
+                    continue
+                ring = tuple(path1[::-1]) + middle + tuple(path2[:-1])
+                if reduce(get_vector(ring), shorter) == 0:
+                    continue
+                for ring in iter_family(predecessors, half1, middle, half2):
+                    found.add(normalize(ring))
+            for ring in sorted(found):
+                relevant.append(ring)
+                vector = reduce(get_vector(ring), basis)
+                if vector:
+                    basis[vector.bit_length() - 1] = vector
+                    sssr.append(ring)
+        return relevant, sssr
+
+    def rings(self, max_size=None):
+        """The relevant cycles of the graph
+
+           Optional argument:
+            | ``max_size``  --  the maximum number of vertices in a ring. The
+                                default is no limit.
+
+           A relevant cycle can not be written as the sum (symmetric difference
+           of edges) of shorter cycles. The union of all minimum cycle bases
+           is the set of relevant cycles. Unlike the rings found by
+           :class:`RingPattern`, relevant cycles may have more than one
+           shortest path between opposite vertices. Each ring is a
+           tuple with the vertices in the order of the ring, starting with the
+           lowest vertex. The rings are sorted by size. See
+           :meth:`get_ring_membership` to convert them into an array.
+        """
+        return self._get_rings(max_size)[0]
+
+    def sssr(self, max_size=None):
+        """The smallest set of smallest rings
+
+           Optional argument:
+            | ``max_size``  --  the maximum number of vertices in a ring. The
+                                default is no limit.
+
+           The result is a minimum cycle basis, with the same conventions as
+           :meth:`rings`. The number of rings equals the number of independent
+           cycles (edges - vertices + components), unless some rings are
+           larger than ``max_size``. The sizes of the rings are unique, but
+           the rings themselves are not always unique. Among equivalent
+           choices, the rings with the lowest vertices are selected.
+        """
+        return self._get_rings(max_size)[1]
+
+    def get_ring_membership(self, rings):
+        """Return a boolean array that indicates which vertices are in which rings
+
+           Argument:
+            | ``rings``  --  a list of rings, e.g. from :meth:`rings` or
+                             :meth:`sssr`
+
+           The result has shape (len(rings), num_vertices). E.g. the sum over
+           the first axis is the number of rings that contain each vertex.
+        """
+        result = np.zeros((len(rings), self.num_vertices), bool)
+        for index, ring in enumerate(rings):
+            result[index, list(ring)] = True
+        return result
+
+    def _get_edited(self, edge_array, orders):
+        """A graph with new edges and the same vertices, see :class:`GraphBuilder`"""
+        return Graph.from_arrays(edge_array, self.num_vertices)
 
     def get_subgraph(self, subvertices, normalize=False):
         """Constructs a subgraph of the current graph
@@ -565,53 +1630,111 @@ class Graph(ReadOnly):
            The attribute ``old_vertex_indexes`` is only constructed when
            ``normalize==True``.
         """
+        subvertices = np.asarray(subvertices, dtype=int).ravel()
+        # each edge as (lowest vertex, highest vertex)
+        edge_array = np.sort(self.edge_array, axis=1)
         if normalize:
-            revorder = dict((j, i) for i, j in enumerate(subvertices))
-            new_edges = []
-            old_edge_indexes = []
-            for counter, (i, j) in enumerate(self.edges):
-                new_i = revorder.get(i)
-                if new_i is None:
-                    continue
-                new_j = revorder.get(j)
-                if new_j is None:
-                    continue
-                new_edges.append((new_i, new_j))
-                old_edge_indexes.append(counter)
-            # sort the edges
-            order = list(range(len(new_edges)))
-            # argsort in pure python
-            order.sort( key=(lambda i: tuple(sorted(new_edges[i]))) )
-            new_edges = [new_edges[i] for i in order]
-            old_edge_indexes = [old_edge_indexes[i] for i in order]
-
-            result = Graph(new_edges, num_vertices=len(subvertices))
-            result._old_vertex_indexes = np.array(subvertices, dtype=int)
-            #result.new_vertex_indexes = revorder
-            result._old_edge_indexes = np.array(old_edge_indexes, dtype=int)
+            revorder = np.zeros(self.num_vertices, dtype=int) - 1
+            revorder[subvertices] = np.arange(len(subvertices))
+            new_edges = revorder[edge_array]
+            old_edge_indexes = (new_edges >= 0).all(axis=1).nonzero()[0]
+            new_edges = new_edges[old_edge_indexes]
+            # sort the edges, stable for duplicate edges
+            new_lows = new_edges.min(axis=1)
+            new_highs = new_edges.max(axis=1)
+            order = np.lexsort((new_highs, new_lows))
+            new_edges = new_edges[order]
+            old_edge_indexes = old_edge_indexes[order]
+
+            result = Graph.from_arrays(new_edges, len(subvertices))
+            result._old_vertex_indexes = subvertices
+            result._old_edge_indexes = old_edge_indexes
         else:
-            subvertices = set(subvertices)
-            old_edge_indexes = np.array([
-                i for i, edge in enumerate(self.edges)
-                if edge.issubset(subvertices)
-            ], dtype=int)
-            new_edges = tuple(self.edges[i] for i in old_edge_indexes)
-            result = Graph(new_edges, self.num_vertices)
+            retained = np.zeros(self.num_vertices, dtype=bool)
+            retained[subvertices] = True
+            old_edge_indexes = retained[edge_array].all(axis=1).nonzero()[0]
+            result = Graph.from_arrays(edge_array[old_edge_indexes], self.num_vertices)
             result._old_edge_indexes = old_edge_indexes
             # no need for old and new vertex_indexes because they remain the
             # same.
         return result
 
-    def get_vertex_fingerprints(self, vertex_strings, edge_strings, num_iter=None):
-        """Return an array with fingerprints for each vertex"""
+    def get_vertex_fingerprints(self, vertex_strings, edge_strings, num_iter=None, method=None):
+        """Return an array with fingerprints for each vertex
+
+           Arguments:
+            | ``vertex_strings`` -- a string for each vertex
+            | ``edge_strings`` -- a string for each edge
+
+           Optional arguments:
+            | ``num_iter`` -- the maximum number of iterations
+            | ``method`` -- ``"mix"`` or ``"sha1"``. When not given,
+                            :attr:`fingerprint_method` is used.
+
+           The ``"mix"`` method returns 16 bytes per vertex. It refines the
+           fingerprints with a vectorized 128-bit integer hash until the
+           partition of the vertices in classes with equal fingerprints no
+           longer changes, or until ``num_iter`` iterations are carried out.
+
+           The ``"sha1"`` method is the original (slow) implementation that
+           returns 20 bytes per vertex. It always carries out ``num_iter``
+           iterations, which defaults to :attr:`max_distance`.
+        """
+        if method is None:
+            method = self.fingerprint_method
+        if method == "mix":
+            return self._get_vertex_fingerprints_mix(vertex_strings, edge_strings, num_iter)
+        elif method == "sha1":
+            return self._get_vertex_fingerprints_sha1(vertex_strings, edge_strings, num_iter)
+        else:
+            raise ValueError("Unknown fingerprint method: %s" % method)
+
+    def _get_vertex_fingerprints_mix(self, vertex_strings, edge_strings, num_iter):
+        """Vectorized fingerprints, see :meth:`get_vertex_fingerprints`"""
+        def count_classes(x):
+            """the number of distinct rows in x"""
+            return len(np.unique(np.ascontiguousarray(x).view("V16")))
+
+        if num_iter is None:
+            num_iter = self.num_vertices
+        a = self.edge_array[:, 0]
+        b = self.edge_array[:, 1]
+        edge_hashes = _hash_strings(edge_strings)
+        # initialization
+        result = _hash_strings(vertex_strings).reshape((self.num_vertices, 2))
+        np.add.at(result, a, edge_hashes)
+        np.add.at(result, b, edge_hashes)
+        result = _mix64(result)
+        num_classes = count_classes(result)
+        # iterations
+        for i in range(num_iter):
+            work = np.zeros(result.shape, np.uint64)
+            np.add.at(work, a, _mix64(result[b] + edge_hashes))
+            np.add.at(work, b, _mix64(result[a] + edge_hashes))
+            # combine with the previous fingerprint, such that every iteration
+            # refines the partition of the previous iteration
+            work[:, 0] += result[:, 0]*np.uint64(0x9e3779b97f4a7c15) + result[:, 1]
+            work[:, 1] ^= result[:, 0]
+            work[:, 1] += result[:, 1]*np.uint64(0xc2b2ae3d27d4eb4f)
+            result = _mix64(work)
+            new_num_classes = count_classes(result)
+            if new_num_classes == num_classes:
+                break
+            num_classes = new_num_classes
+        return result.astype("<u8").view(np.ubyte)
+
+    def _get_vertex_fingerprints_sha1(self, vertex_strings, edge_strings, num_iter):
+        """SHA1 fingerprints, see :meth:`get_vertex_fingerprints`"""
         import hashlib
         def str2array(x):
             """convert a hash string to a numpy array of bytes"""
             if len(x) == 0:
                 return np.zeros(0, np.ubyte)
             else:
-                return np.fromstring(x, np.ubyte)
-        hashrow = lambda x: np.fromstring(hashlib.sha1(x.data).digest(), np.ubyte)
+                if not isinstance(x, bytes):
+                    x = x.encode("utf-8")
+                return np.frombuffer(x, np.ubyte)
+        hashrow = lambda x: np.frombuffer(hashlib.sha1(x.tobytes()).digest(), np.ubyte)
         # initialization
         result = np.zeros((self.num_vertices, 20), np.ubyte)
         for i in range(self.num_vertices):
@@ -644,6 +1767,16 @@ class Graph(ReadOnly):
 
            Returns the vertices in both halfs.
         """
+        edge_index = self.edge_index.get(frozenset([vertex1, vertex2]))
+        if edge_index is not None:
+            # fast path based on the depth-first forest
+            labels, children = self._cut_labels
+            if labels[edge_index] != 0:
+                raise GraphError("The graph can not be separated in two halfs "
+                                 "by disconnecting vertex1 and vertex2.")
+            cut = self._get_cut_intervals(children[edge_index])
+            return self._get_cut_part(vertex1, cut), self._get_cut_part(vertex2, cut)
+
         def grow(origin, other):
             frontier = set(self.neighbors[origin])
             frontier.discard(other)
@@ -776,6 +1909,121 @@ class Graph(ReadOnly):
         return vertex_a_part, vertex_b_part, \
                (vertex_a1, vertex_b1, vertex_a2, vertex_b2)
 
+    def _get_cut_intervals(self, child1, child2=-1):
+        """Intervals in the preorder that are cut off by removing edges
+
+           Arguments:
+            | ``child1`` -- the vertex below a tree edge that is removed.
+
+           Optional argument:
+            | ``child2`` -- the vertex below a second tree edge that is
+                            removed. (-1 if the second edge is a back edge.)
+
+           The edges must form a cut set, such that the graph is split into
+           two parts. The part that does not contain the root is returned as a
+           list of ``(begin, end)`` tuples of preorder indexes.
+        """
+        order, pre, parent, size, low, root, blocks = self._dfs_forest
+        if child2 == -1:
+            return [(pre[child1], pre[child1] + size[child1])]
+        if pre[child2] < pre[child1]:
+            child1, child2 = child2, child1
+        # child2 is in the subtree of child1
+        return [
+            (pre[child1], pre[child2]),
+            (pre[child2] + size[child2], pre[child1] + size[child1]),
+        ]
+
+    def _get_cut_part(self, vertex, cut):
+        """The vertices on the same side of a cut as the given vertex
+
+           Arguments:
+            | ``vertex`` -- the vertex of interest
+            | ``cut`` -- the result of :meth:`_get_cut_intervals`
+
+           Returns a set with vertices.
+        """
+        order, pre, parent, size, low, root, blocks = self._dfs_forest
+        index = pre[vertex]
+        if any(begin <= index < end for begin, end in cut):
+            intervals = cut
+        else:
+            # complement of the cut within the connected component
+            top = root[vertex]
+            intervals = []
+            begin = pre[top]
+            for cut_begin, cut_end in cut:
+                intervals.append((begin, cut_begin))
+                begin = cut_end
+            intervals.append((begin, pre[top] + size[top]))
+        result = set()
+        for begin, end in intervals:
+            result.update(order[begin:end])
+        return result
+
+    def iter_single_cuts(self):
+        """Iterate over all edges that split the graph in two halfs
+
+           The edges are visited in the order of :attr:`edges`. For each edge
+           ``(vertex1, vertex2)`` that is a bridge, the result of
+           ``get_halfs(vertex1, vertex2)`` is yielded together with the
+           edge, i.e. ``(vertex1_part, vertex2_part, (vertex1, vertex2))``.
+           The halfs are derived from the depth-first forest, which takes
+           (nearly) linear time in total, apart from the construction of the
+           resulting sets.
+        """
+        labels, children = self._cut_labels
+        for index in self.bridges:
+            vertex1, vertex2 = self.edges[index]
+            cut = self._get_cut_intervals(children[index])
+            yield (
+                self._get_cut_part(vertex1, cut),
+                self._get_cut_part(vertex2, cut),
+                (vertex1, vertex2),
+            )
+
+    def iter_double_cuts(self):
+        """Iterate over all pairs of edges that split the graph in two halfs
+
+           This yields the results of :meth:`get_halfs_double` for all pairs
+           of edges for which the latter does not raise a GraphError. The
+           first edge runs over :attr:`edges` and the second edge runs over
+           all preceding edges.
+
+           Only pairs of edges with equal labels, see :meth:`_cut_labels`, are
+           considered, such that no flood fill is needed for pairs of edges
+           that do not split the graph.
+        """
+        labels, children = self._cut_labels
+        groups = {}
+        for index, label in enumerate(labels):
+            if label == 0:
+                # Bridges can only be combined with their duplicates.
+                groups.setdefault(self.edges[index], []).append(index)
+            else:
+                groups.setdefault(label, []).append(index)
+        all_vertices = set(range(self.num_vertices))
+        for index1, label in enumerate(labels):
+            for index2 in groups[self.edges[index1] if label == 0 else label]:
+                if index2 >= index1:
+                    break
+                if label != 0 and self.edges[index1] == self.edges[index2]:
+                    # a duplicate edge that is not a bridge
+                    continue
+                if label == 0 or children[index1] == -1:
+                    cut = self._get_cut_intervals(children[index2])
+                else:
+                    cut = self._get_cut_intervals(children[index1], children[index2])
+                vertex_a1, vertex_b1 = self.edges[index1]
+                vertex_a2, vertex_b2 = self.edges[index2]
+                vertex_a_part = self._get_cut_part(vertex_a1, cut)
+                if vertex_a2 not in vertex_a_part:
+                    vertex_a2, vertex_b2 = vertex_b2, vertex_a2
+                yield (
+                    vertex_a_part, all_vertices - vertex_a_part,
+                    (vertex_a1, vertex_b1, vertex_a2, vertex_b2)
+                )
+
     def full_match(self, other):
         """Find the mapping between vertex indexes in self and other.
 
@@ -825,6 +2073,495 @@ class Graph(ReadOnly):
         return result
 
 
+class GraphBuilder(object):
+    """An editable graph that is frozen into a read-only Graph
+
+       Graphs are read-only objects, such that their cached attributes remain
+       valid. When many graphs have to be constructed by adding or removing a
+       few edges, e.g. when bonds are formed or broken in a reactive molecular
+       dynamics simulation, the builder avoids recomputing everything from
+       scratch. The neighbors and the connected components are updated
+       incrementally. Optionally, the all-pairs distances are updated after
+       each edit: inserting an edge takes a single pass over the distance
+       matrix. Removing an edge that splits a component needs no search at
+       all. Otherwise, the distances between the vertices closer to one end of
+       the edge and those closer to the other end are recomputed, with one
+       breadth first search per vertex on the smallest of the two sides. The
+       attribute ``num_searches`` counts these searches.
+
+       Usage::
+
+           >>> builder = GraphBuilder.from_graph(graph)
+           >>> builder.remove_edge(0, 1)
+           >>> builder.add_edge(1, 5)
+           >>> new_graph = builder.freeze()
+
+       The frozen graph gets the neighbors, the CSR arrays, the component
+       labels and (when tracked) the distances of the builder as precomputed
+       cached attributes.
+    """
+    def __init__(self, num_vertices, edges=None, track_distances=False, template=None):
+        """
+           Argument:
+            | ``num_vertices``  --  the number of vertices
+
+           Optional arguments:
+            | ``edges``  --  initial edges, pairs of vertices
+            | ``track_distances``  --  when True, the all-pairs distances are
+                                       updated after each edit.
+            | ``template``  --  a graph whose vertex properties are copied
+                                when the builder is frozen, e.g. the atom
+                                numbers of a MolecularGraph. See
+                                :meth:`from_graph`.
+        """
+        self.num_vertices = num_vertices
+        self.template = template
+        self._edges = OrderedDict()
+        self._neighbors = [set([]) for vertex in range(num_vertices)]
+        # Component labels are arbitrary integers, each with a set of members.
+        self._labels = np.arange(num_vertices)
+        self._members = dict((vertex, set([vertex])) for vertex in range(num_vertices))
+        self._next_label = num_vertices
+        self._distances = None
+        self.num_searches = 0
+        if edges is not None:
+            for vertex1, vertex2 in edges:
+                self.add_edge(vertex1, vertex2)
+        if track_distances:
+            self._init_distances()
+
+    @classmethod
+    def from_graph(cls, graph, track_distances=None):
+        """Construct a builder that starts from an existing graph
+
+           Argument:
+            | ``graph``  --  a Graph object, e.g. a MolecularGraph
+
+           Optional argument:
+            | ``track_distances``  --  See constructor. The default is True if
+                                       the distances of the graph are already
+                                       computed.
+
+           The edge orders of a MolecularGraph are copied and the frozen graph
+           has the same class and vertex properties as ``graph``.
+        """
+        if track_distances is None:
+            track_distances = "_cache_distances" in graph.__dict__
+        result = cls(graph.num_vertices, template=graph)
+        orders = getattr(graph, "orders", None)
+        for index, (vertex1, vertex2) in enumerate(graph.edge_array.tolist()):
+            if orders is None:
+                result.add_edge(vertex1, vertex2)
+            else:
+                result.add_edge(vertex1, vertex2, orders[index])
+        if track_distances:
+            if "_cache_distances" in graph.__dict__:
+                result._distances = graph.distances.copy()
+                result._distances[result._distances == 0] = graph.num_vertices
+                result._distances.ravel()[::graph.num_vertices+1] = 0
+            else:
+                result._init_distances()
+        return result
+
+    num_edges = property(lambda self: len(self._edges),
+        doc="The current number of edges")
+
+    edges = property(lambda self: [value[0] for value in self._edges.values()],
+        doc="A list with the current edges as pairs of vertices")
+
+    def _init_distances(self):
+        """Compute the distances from scratch, unreachable vertices get num_vertices"""
+        self._distances = np.zeros((self.num_vertices, self.num_vertices), int)
+        indptr, indices = self._get_csr()
+        for vertex in range(self.num_vertices):
+            self._update_row(vertex, indptr, indices)
+
+    def _get_csr(self):
+        """The current neighbors in compressed sparse row format"""
+        counts = [len(neighbors) for neighbors in self._neighbors]
+        indptr = np.zeros(self.num_vertices+1, np.int32)
+        np.cumsum(counts, out=indptr[1:])
+        indices = np.zeros(indptr[-1], np.int32)
+        for vertex, neighbors in enumerate(self._neighbors):
+            indices[indptr[vertex]:indptr[vertex+1]] = sorted(neighbors)
+        return indptr, indices
+
+    def _update_row(self, vertex, indptr, indices):
+        """Recompute the distances from one vertex with a breadth first search"""
+        self._update_entries(vertex, slice(None), indptr, indices)
+
+    def _update_entries(self, vertex, others, indptr, indices):
+        """Recompute the distances between one vertex and a set of others"""
+        from molmod.ext import graphs_breadth_first
+        order, distances, parents = graphs_breadth_first(indptr, indices, vertex)
+        self.num_searches += 1
+        distances = distances[others]
+        distances[distances < 0] = self.num_vertices
+        self._distances[vertex, others] = distances
+        self._distances[others, vertex] = distances
+
+    def has_edge(self, vertex1, vertex2):
+        """Return True when the two vertices are connected"""
+        return vertex2 in self._neighbors[vertex1]
+
+    def get_neighbors(self, vertex):
+        """Return a frozenset with the current neighbors of a vertex"""
+        return frozenset(self._neighbors[vertex])
+
+    def add_edge(self, vertex1, vertex2, order=1.0):
+        """Add an edge between two vertices
+
+           Arguments:
+            | ``vertex1``, ``vertex2``  --  two different vertices that are not
+                                           connected yet
+
+           Optional argument:
+            | ``order``  --  the bond order, only used when the template is a
+                             MolecularGraph
+        """
+        vertex1 = int(vertex1)
+        vertex2 = int(vertex2)
+        if vertex1 == vertex2:
+            raise ValueError("A edge must contain two different values.")
+        if not (0 <= vertex1 < self.num_vertices and 0 <= vertex2 < self.num_vertices):
+            raise ValueError("The vertices must be in the range [0, num_vertices[.")
+        key = frozenset([vertex1, vertex2])
+        if key in self._edges:
+            raise ValueError("The edge %i-%i is already present." % (vertex1, vertex2))
+        self._edges[key] = ((vertex1, vertex2), order)
+        self._neighbors[vertex1].add(vertex2)
+        self._neighbors[vertex2].add(vertex1)
+        # merge the smallest component into the largest
+        label1 = self._labels[vertex1]
+        label2 = self._labels[vertex2]
+        if label1 != label2:
+            if len(self._members[label1]) < len(self._members[label2]):
+                label1, label2 = label2, label1
+            moved = self._members.pop(label2)
+            self._labels[list(moved)] = label1
+            self._members[label1].update(moved)
+        # paths through the new edge
+        if self._distances is not None:
+            d1 = self._distances[:, vertex1].copy()
+            d2 = self._distances[:, vertex2].copy()
+            np.minimum(self._distances, d1[:, None] + 1 + d2, self._distances)
+            np.minimum(self._distances, d2[:, None] + 1 + d1, self._distances)
+
+    def remove_edge(self, vertex1, vertex2):
+        """Remove the edge between two vertices
+
+           Returns the bond order that was given to :meth:`add_edge`.
+        """
+        key = frozenset([vertex1, vertex2])
+        if key not in self._edges:
+            raise ValueError("The edge %i-%i is not present." % (vertex1, vertex2))
+        pair, order = self._edges.pop(key)
+        self._neighbors[vertex1].discard(vertex2)
+        self._neighbors[vertex2].discard(vertex1)
+        # Search from both vertices alternately until they meet or until one
+        # side is exhausted. The exhausted side becomes a new component.
+        visited = (set([vertex1]), set([vertex2]))
+        todo = ([vertex1], [vertex2])
+        split = None
+        while split is None:
+            for side in 0, 1:
+                if len(todo[side]) == 0:
+                    split = side
+                    break
+                vertex = todo[side].pop()
+                for other in self._neighbors[vertex]:
+                    if other in visited[1-side]:
+                        split = -1
+                        break
+                    if other not in visited[side]:
+                        visited[side].add(other)
+                        todo[side].append(other)
+                if split is not None:
+                    break
+        if split >= 0:
+            label = self._labels[vertex1]
+            self._members[label].difference_update(visited[split])
+            self._members[self._next_label] = visited[split]
+            self._labels[list(visited[split])] = self._next_label
+            self._next_label += 1
+            if self._distances is not None:
+                # A bridge was removed. No shortest path within one of the two
+                # new components used it, so only the block between the two
+                # components changes.
+                part1 = list(visited[split])
+                part2 = list(self._members[label])
+                self._distances[np.ix_(part1, part2)] = self.num_vertices
+                self._distances[np.ix_(part2, part1)] = self.num_vertices
+        elif self._distances is not None:
+            # Only the pairs (u, w) with u on the side of vertex1 and w on the
+            # side of vertex2 may have a shortest path through the edge.
+            d1 = self._distances[:, vertex1]
+            d2 = self._distances[:, vertex2]
+            side1 = (d1 + 1 == d2).nonzero()[0]
+            side2 = (d2 + 1 == d1).nonzero()[0]
+            if len(side1) > len(side2):
+                side1, side2 = side2, side1
+            indptr, indices = self._get_csr()
+            for vertex in side1:
+                self._update_entries(vertex, side2, indptr, indices)
+        return order
+
+    @property
+    def component_labels(self):
+        """The index of the connected component of each vertex
+
+           The components are numbered in the order of their lowest vertex,
+           like :attr:`Graph.component_labels`.
+        """
+        labels, first, inverse = np.unique(self._labels, return_index=True, return_inverse=True)
+        ranks = np.zeros(len(first), int)
+        ranks[first.argsort()] = np.arange(len(first))
+        return ranks[inverse]
+
+    num_components = property(lambda self: len(self._members),
+        doc="The current number of connected components")
+
+    @property
+    def distances(self):
+        """The current all-pairs distances, with the conventions of :attr:`Graph.distances`
+
+           Only available when the distances are tracked.
+        """
+        if self._distances is None:
+            raise GraphError("The distances are not tracked.")
+        result = self._distances.copy()
+        result[result == self.num_vertices] = 0
+        return result
+
+    def freeze(self):
+        """Return a read-only graph with the current edges
+
+           The result has the same class and vertex properties as the template,
+           or is a plain Graph when no template is given. The still valid
+           information of the builder is stored in the cached attributes of the
+           new graph.
+        """
+        edge_array = np.array([value[0] for value in self._edges.values()], np.int32).reshape((-1, 2))
+        if self.template is None:
+            graph = Graph.from_arrays(edge_array, self.num_vertices)
+        else:
+            orders = np.array([value[1] for value in self._edges.values()], float)
+            graph = self.template._get_edited(edge_array, orders)
+        graph._cache_csr = self._get_csr()
+        graph._cache_neighbors = dict(
+            (vertex, frozenset(neighbors)) for vertex, neighbors
+            in enumerate(self._neighbors)
+        )
+        graph._cache_component_labels = self.component_labels
+        if self._distances is not None:
+            graph._cache_distances = self.distances
+        return graph
+
+
+class GraphIndex(object):
+    """A collection of graphs with distinct topologies
+
+       Graphs are put in buckets based on their fingerprint. Whether a graph
+       with the same topology is already present, is only tested with
+       :attr:`Graph.canonical_string` on the graphs in the same bucket. This
+       also works for disconnected graphs and isolated vertices. The expected
+       cost of a lookup is therefore independent of the size of the index.
+
+       >>> index = GraphIndex()
+       >>> for graph in graphs:
+       ...     i, is_new = index.add(graph)
+       >>> index.save("unique.idx")
+       >>> index = GraphIndex.load("unique.idx")
+       >>> graph in index
+
+       A saved index is memory-mapped when loaded. The graphs are only
+       constructed when they are needed for a comparison or when they are
+       accessed explicitly. Only the edges, and the atom numbers and bond
+       orders of molecular graphs, are stored. Instances of other subclasses
+       are loaded as a :class:`Graph` or a
+       :class:`molmod.molecular_graphs.MolecularGraph`.
+    """
+    magic = b"MMGIDX02"
+
+    def __init__(self, graphs=None):
+        """
+           Optional argument:
+            | ``graphs`` -- an iterable of graphs to be added
+        """
+        self._fingerprints = []
+        self._graphs = []
+        self._buckets = {}
+        self._arrays = None
+        if graphs is not None:
+            for graph in graphs:
+                self.add(graph)
+
+    def __len__(self):
+        return len(self._graphs)
+
+    def __getitem__(self, index):
+        """Return the graph with the given index"""
+        graph = self._graphs[index]
+        if graph is None:
+            vertex_offsets, edge_offsets, kinds, edges, numbers, orders = self._arrays
+            vbegin, vend = vertex_offsets[index], vertex_offsets[index+1]
+            ebegin, eend = edge_offsets[index], edge_offsets[index+1]
+            edge_array = np.array(edges[ebegin:eend])
+            if kinds[index] == 1:
+                from molmod.molecular_graphs import MolecularGraph
+                graph = MolecularGraph.from_arrays(
+                    edge_array, np.array(numbers[vbegin:vend]),
+                    np.array(orders[ebegin:eend])
+                )
+            else:
+                graph = Graph.from_arrays(edge_array, vend - vbegin)
+            self._graphs[index] = graph
+        return graph
+
+    def __contains__(self, graph):
+        return self.lookup(graph) is not None
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _get_key(self, graph):
+        """Return the bucket key of a graph"""
+        key = graph.fingerprint.tobytes()
+        if len(self._fingerprints) > 0 and len(key) != len(self._fingerprints[0]):
+            raise ValueError("The size of the fingerprint does not match with "
+                "the other graphs in the index.")
+        return key
+
+    def _lookup(self, graph, key):
+        """Return the index of a graph with the same topology or None"""
+        for index in self._buckets.get(key, ()):
+            other = self[index]
+            if other.num_vertices != graph.num_vertices or \
+               other.num_edges != graph.num_edges:
+                continue
+            if graph.canonical_string == other.canonical_string:
+                return index
+
+    def lookup(self, graph):
+        """Return the index of a graph with the same topology or None
+
+           Argument:
+            | ``graph`` -- the graph to look up
+        """
+        return self._lookup(graph, self._get_key(graph))
+
+    def add(self, graph):
+        """Add a graph unless a graph with the same topology is present
+
+           Argument:
+            | ``graph`` -- the graph to be added
+
+           Returns: ``(index, is_new)``, where ``index`` refers to the new or
+           the already present graph and ``is_new`` is True when the graph was
+           added.
+        """
+        key = self._get_key(graph)
+        index = self._lookup(graph, key)
+        if index is not None:
+            return index, False
+        index = len(self._graphs)
+        self._fingerprints.append(key)
+        self._graphs.append(graph)
+        self._buckets.setdefault(key, []).append(index)
+        return index, True
+
+    def save(self, filename):
+        """Write the index to a file
+
+           Argument:
+            | ``filename`` -- the file to write to
+
+           The file consists of a header (magic string, number of graphs and
+           fingerprint size), all fingerprints and the graphs as plain arrays:
+           the offsets of the vertices and the edges of each graph, the kind of
+           each graph (0 for a Graph, 1 for a MolecularGraph), all edges, all
+           atom numbers and all bond orders. Plain graphs have zero atom
+           numbers and bond orders. All integers and floats are little-endian.
+        """
+        import os
+        from molmod.molecular_graphs import MolecularGraph
+        graphs = [self[index] for index in range(len(self))]
+        kinds = np.array([isinstance(graph, MolecularGraph) for graph in graphs], "<i8")
+        vertex_offsets = np.zeros(len(graphs)+1, "<i8")
+        vertex_offsets[1:] = np.cumsum([graph.num_vertices for graph in graphs])
+        edge_offsets = np.zeros(len(graphs)+1, "<i8")
+        edge_offsets[1:] = np.cumsum([graph.num_edges for graph in graphs])
+        numbers = np.zeros(vertex_offsets[-1], "<i8")
+        orders = np.zeros(edge_offsets[-1], "<f8")
+        for index, graph in enumerate(graphs):
+            if kinds[index] == 1:
+                numbers[vertex_offsets[index]:vertex_offsets[index+1]] = graph.numbers
+                orders[edge_offsets[index]:edge_offsets[index+1]] = graph.orders
+        if len(graphs) > 0:
+            edges = np.concatenate([graph.edge_array for graph in graphs]).astype("<i4")
+        else:
+            edges = np.zeros((0, 2), "<i4")
+        size = 0 if len(self) == 0 else len(self._fingerprints[0])
+        header_size = len(self.magic) + 16
+        begin = header_size + len(self)*size
+        # The loaded file may be memory-mapped, so write a new file first.
+        tmpname = filename + ".tmp"
+        with open(tmpname, "wb") as f:
+            f.write(self.magic)
+            f.write(np.array([len(self), size], "<i8").tobytes())
+            f.write(b"".join(self._fingerprints))
+            f.write(b"\0"*((-begin) % 8))
+            # all arrays below have a size that is a multiple of 8 bytes
+            for array in vertex_offsets, edge_offsets, kinds, edges, numbers, orders:
+                f.write(array.tobytes())
+        os.replace(tmpname, filename)
+
+    @classmethod
+    def load(cls, filename):
+        """Load an index from a file written with :meth:`save`
+
+           Argument:
+            | ``filename`` -- the file to read from
+
+           The file is memory-mapped and the graphs are only constructed when
+           they are needed.
+        """
+        data = np.memmap(filename, np.ubyte, mode="r")
+        header_size = len(cls.magic) + 16
+        if data[:len(cls.magic)].tobytes() != cls.magic:
+            raise ValueError("The file %s does not contain a graph index." % filename)
+        num_graphs, size = data[len(cls.magic):header_size].view("<i8")
+        num_graphs = int(num_graphs)
+        size = int(size)
+        begin = header_size + num_graphs*size
+        fingerprints = data[header_size:begin].reshape((num_graphs, size))
+        begin += (-begin) % 8
+
+        def read(begin, dtype, count):
+            """Return a view on an array in the file and the end position"""
+            result = data[begin:begin + count*np.dtype(dtype).itemsize].view(dtype)
+            return result, begin + result.nbytes
+
+        vertex_offsets, begin = read(begin, "<i8", num_graphs+1)
+        edge_offsets, begin = read(begin, "<i8", num_graphs+1)
+        kinds, begin = read(begin, "<i8", num_graphs)
+        edges, begin = read(begin, "<i4", 2*int(edge_offsets[-1]))
+        numbers, begin = read(begin, "<i8", int(vertex_offsets[-1]))
+        orders, begin = read(begin, "<f8", int(edge_offsets[-1]))
+        result = cls()
+        result._arrays = (
+            vertex_offsets, edge_offsets, kinds, edges.reshape((-1, 2)),
+            numbers, orders
+        )
+        for index in range(num_graphs):
+            key = fingerprints[index].tobytes()
+            result._fingerprints.append(key)
+            result._graphs.append(None)
+            result._buckets.setdefault(key, []).append(index)
+        return result
+
+
 # Pattern matching
 
 
@@ -987,6 +2724,17 @@ class Pattern(object):
         """
         return True
 
+    def get_vertex_masks(self, subject_graph):
+        """Return the subject vertices that can be linked to pattern vertices
+
+           The result is None or a dictionary with pattern vertices as keys
+           and boolean arrays over the subject vertices as values. Pattern
+           vertices that are not present in the dictionary can be linked to
+           any subject vertex. As with :meth:`compare`, false positives are
+           allowed.
+        """
+        return None
+
     def check_next_match(self, match, new_relations, subject_graph, one_match):
         """Does this match object make sense for the current pattern
 
@@ -1053,12 +2801,36 @@ class CriteriaSet(object):
 
 # few basic example criteria
 
+
+def get_vertex_mask(criterion, graph):
+    """Evaluate a vertex criterion for all vertices of a graph at once
+
+       Arguments:
+        | ``criterion``  --  a criterion object
+        | ``graph``  --  the graph on which the criterion is tested
+
+       Returns a boolean array with one element per vertex. Criteria with a
+       ``get_vertex_mask`` method are evaluated in a vectorized way. Other
+       criteria are called once for each vertex.
+    """
+    method = getattr(criterion, "get_vertex_mask", None)
+    if method is not None:
+        return method(graph)
+    return np.array([
+        bool(criterion(vertex, graph)) for vertex in range(graph.num_vertices)
+    ], bool)
+
+
 class Anything(object):
     """A criterion that always returns True"""
     def __call__(self, index, subject_graph):
         """Always returns True"""
         return True
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`get_vertex_mask`"""
+        return np.ones(graph.num_vertices, bool)
+
 
 class CritOr(object):
     """OR Operator for criteria objects"""
@@ -1083,6 +2855,13 @@ class CritOr(object):
                 return True
         return False
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`get_vertex_mask`"""
+        result = np.zeros(graph.num_vertices, bool)
+        for c in self.criteria:
+            result |= get_vertex_mask(c, graph)
+        return result
+
 
 class CritAnd(object):
     """AND Operator for criteria objects"""
@@ -1107,6 +2886,13 @@ class CritAnd(object):
                 return False
         return True
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`get_vertex_mask`"""
+        result = np.ones(graph.num_vertices, bool)
+        for c in self.criteria:
+            result &= get_vertex_mask(c, graph)
+        return result
+
 
 class CritXor(object):
     """XOR Operator for criteria objects"""
@@ -1135,6 +2921,13 @@ class CritXor(object):
                 count += 1
         return (count % 2) == 1
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`get_vertex_mask`"""
+        result = np.zeros(graph.num_vertices, bool)
+        for c in self.criteria:
+            result ^= get_vertex_mask(c, graph)
+        return result
+
 
 class CritNot(object):
     """Inverion of another criterion"""
@@ -1156,6 +2949,10 @@ class CritNot(object):
         """
         return not self.criterion(index, graph)
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`get_vertex_mask`"""
+        return ~get_vertex_mask(self.criterion, graph)
+
 
 # pattern and match stuff
 
@@ -1212,6 +3009,7 @@ class CustomPattern(Pattern):
         self.level_edges = {}
         self.level_constraints = {}
         self.duplicate_checks = set([])
+        self.symmetries = []
         if pattern_graph is None:
             return
         if len(pattern_graph.independent_vertices) != 1:
@@ -1233,6 +3031,15 @@ class CustomPattern(Pattern):
             for cycles in pattern_graph.symmetry_cycles:
                 if len(cycles) > 0:
                     self.duplicate_checks.add((cycles[0][0], cycles[0][1]))
+            # C) The symmetries in a fixed order, such that the final matches
+            # are always generated in the same order, also in other processes.
+            self.symmetries = sorted(
+                pattern_graph.symmetries,
+                key=(lambda symmetry: [
+                    symmetry.forward[vertex]
+                    for vertex in range(pattern_graph.num_vertices)
+                ])
+            )
 
 
     def iter_initial_relations(self, subject_graph):
@@ -1242,6 +3049,43 @@ class CustomPattern(Pattern):
             if self.compare(vertex0, vertex1, subject_graph):
                 yield vertex0, vertex1
 
+    def get_vertex_masks(self, subject_graph):
+        """Return the subject vertices that can be linked to pattern vertices
+
+           See :meth:`Pattern.get_vertex_masks`. Each vertex criterion is
+           evaluated once over the whole subject graph. Because the final
+           matches are permuted with the symmetries of the pattern graph, a
+           pattern vertex can be linked to any subject vertex that satisfies
+           the criterion of a pattern vertex in the same orbit, in any of the
+           criteria sets.
+        """
+        if self.criteria_sets is None:
+            return None
+        orbits = {}
+        for symmetry in self.symmetries:
+            for vertex0, other0 in symmetry.forward.items():
+                orbits.setdefault(vertex0, set()).add(other0)
+        criterion_masks = {}
+        result = {}
+        for vertex0 in range(self.pattern_graph.num_vertices):
+            mask = np.zeros(subject_graph.num_vertices, bool)
+            for criteria_set in self.criteria_sets:
+                for other0 in orbits.get(vertex0, [vertex0]):
+                    criterion = criteria_set.vertex_criteria.get(other0)
+                    if criterion is None:
+                        mask = None
+                        break
+                    criterion_mask = criterion_masks.get(id(criterion))
+                    if criterion_mask is None:
+                        criterion_mask = get_vertex_mask(criterion, subject_graph)
+                        criterion_masks[id(criterion)] = criterion_mask
+                    mask |= criterion_mask
+                if mask is None:
+                    break
+            if mask is not None:
+                result[vertex0] = mask
+        return result
+
     def get_new_edges(self, level):
         """Get new edges from the pattern graph for the graph search algorithm
 
@@ -1316,7 +3160,7 @@ class CustomPattern(Pattern):
         else:
             for criteria_set in self.criteria_sets:
                 satisfied_match_tags = set([])
-                for symmetry in self.pattern_graph.symmetries:
+                for symmetry in self.symmetries:
                     final_match = canonical_match * symmetry
                     #print final_match
                     if criteria_set.test_match(final_match, self.pattern_graph, subject_graph):
@@ -1565,13 +3409,35 @@ class GraphSearch(object):
             | one_match --  If True, only one match will be returned. This
                             allows certain optimizations.
         """
+        masks = self._get_vertex_masks(subject_graph, one_match)
+        initial_relations = self.pattern.iter_initial_relations(subject_graph)
+        for final_match in self._iter_final_matches(subject_graph, one_match, initial_relations, masks):
+            yield final_match
+
+    def _get_vertex_masks(self, subject_graph, one_match):
+        """Return the vertex masks of the pattern or None"""
+        # Vertex criteria are evaluated for all vertices at once. When only one
+        # match is requested, criteria are not taken into account.
+        if one_match:
+            return None
+        masks = self.pattern.get_vertex_masks(subject_graph)
+        if not masks:
+            return None
+        return masks
+
+    def _iter_final_matches(self, subject_graph, one_match, initial_relations, masks):
+        """Iterate over all matches that grow from the given initial relations"""
         # Matches are grown iteratively.
-        for vertex0, vertex1 in self.pattern.iter_initial_relations(subject_graph):
+        for vertex0, vertex1 in initial_relations:
+            if masks is not None:
+                mask = masks.get(vertex0)
+                if mask is not None and not mask[vertex1]:
+                    continue
             init_match = self.pattern.MatchClass.from_first_relation(vertex0, vertex1)
             # init_match cotains only one source -> dest relation. starting from
             # this initial match, the function iter_matches extends the match
             # in all possible ways and yields the completed matches
-            for canonical_match in self._iter_matches(init_match, subject_graph, one_match):
+            for canonical_match in self._iter_matches(init_match, subject_graph, one_match, masks=masks):
                 # Some patterns my exclude symmetrically equivalent matches as
                 # to aviod dupplicates. with such a 'canonical' solution,
                 # the pattern is allowed to generate just those symmatrical
@@ -1582,6 +3448,90 @@ class GraphSearch(object):
                     yield final_match
                     if one_match: return
 
+    def _map(self, tasks, processes):
+        """Run _search_worker on all tasks, in parallel if processes != 1"""
+        if processes == 1 or len(tasks) <= 1:
+            return [_search_worker(task) for task in tasks]
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        try:
+            return pool.map(_search_worker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    def search_many(self, subject_graphs, processes=None, one_match=False):
+        """Search the pattern in many subject graphs with a pool of processes
+
+           Arguments:
+            | ``subject_graphs``  --  A list of subject graphs
+
+           Optional arguments:
+            | ``processes``  --  The number of worker processes. The default is
+                                 the number of CPUs. When set to 1, no worker
+                                 processes are created.
+            | ``one_match``  --  See :meth:`__call__`
+
+           Returns a list with, for each subject graph, the list of matches,
+           in the same order as :meth:`__call__`. The pattern and the graphs
+           must be picklable. Note that only the read-only attributes of a
+           graph are transferred to the workers, e.g. ``bond_lengths`` are
+           lost.
+        """
+        tasks = [
+            (self.pattern, subject_graph, one_match, None, None)
+            for subject_graph in subject_graphs
+        ]
+        return self._map(tasks, processes)
+
+    def search_split(self, subject_graph, processes=None, one_match=False, num_chunks=None):
+        """Search the pattern in one (large) graph with a pool of processes
+
+           Arguments:
+            | ``subject_graph``  --  The subject graph
+
+           Optional arguments:
+            | ``processes``  --  The number of worker processes. The default is
+                                 the number of CPUs. When set to 1, no worker
+                                 processes are created.
+            | ``one_match``  --  See :meth:`__call__`
+            | ``num_chunks``  --  The number of parts in which the initial
+                                  relations are split. The default is the
+                                  number of processes.
+
+           The initial relations of the pattern are split in consecutive
+           chunks. The matches that grow from each chunk are searched in a
+           separate task. Returns a list with the same matches, in the same
+           order, as :meth:`__call__`.
+        """
+        masks = self._get_vertex_masks(subject_graph, one_match)
+        initial_relations = []
+        for vertex0, vertex1 in self.pattern.iter_initial_relations(subject_graph):
+            if masks is not None:
+                mask = masks.get(vertex0)
+                if mask is not None and not mask[vertex1]:
+                    continue
+            initial_relations.append((vertex0, vertex1))
+        if num_chunks is None:
+            if processes is None:
+                from multiprocessing import cpu_count
+                num_chunks = cpu_count()
+            else:
+                num_chunks = processes
+        num_chunks = max(1, min(num_chunks, len(initial_relations)))
+        bounds = np.linspace(0, len(initial_relations), num_chunks+1).astype(int)
+        tasks = [
+            (self.pattern, subject_graph, one_match,
+             initial_relations[begin:end], masks)
+            for begin, end in zip(bounds[:-1], bounds[1:])
+        ]
+        result = []
+        for matches in self._map(tasks, processes):
+            result.extend(matches)
+            if one_match and len(result) > 0:
+                return result[:1]
+        return result
+
     def print_debug(self, text, indent=0):
         """Only prints debug info on screen when self.debug == True."""
         if self.debug:
@@ -1609,7 +3559,7 @@ class GraphSearch(object):
             yield end_vertices0, end_vertices1
 
 
-    def _iter_new_relations(self, init_match, subject_graph, edges0, constraints0, edges1):
+    def _iter_new_relations(self, init_match, subject_graph, edges0, constraints0, edges1, masks=None):
         """Given an onset for a match, iterate over all possible new key-value pairs"""
         # Count the number of unique edges0[i][1] values. This is also
         # the number of new relations.
@@ -1641,7 +3591,10 @@ class GraphSearch(object):
                 return # an exact match is sought, this can never work
             l = []
             for end_vertex0 in end_vertices0:
+                mask = None if masks is None else masks.get(end_vertex0)
                 for end_vertex1 in end_vertices1:
+                    if mask is not None and not mask[end_vertex1]:
+                        continue
                     if self.pattern.compare(end_vertex0, end_vertex1, subject_graph):
                         l.append((end_vertex0, end_vertex1))
             # len(end_vertices0) = the total number of relations that must be
@@ -1690,12 +3643,13 @@ class GraphSearch(object):
                 continue
             yield forward
 
-    def _iter_matches(self, input_match, subject_graph, one_match, level=0):
+    def _iter_matches(self, input_match, subject_graph, one_match, level=0, masks=None):
         """Given an onset for a match, iterate over all completions of that match
 
            This iterator works recursively. At each level the match is extended
            with a new set of relations based on vertices in the pattern graph
-           that are at a distances 'level' from the starting vertex
+           that are at a distances 'level' from the starting vertex. The
+           optional masks are the result of :meth:`Pattern.get_vertex_masks`.
         """
         self.print_debug("ENTERING _ITER_MATCHES", 1)
         self.print_debug("input_match: %s" % input_match)
@@ -1724,7 +3678,7 @@ class GraphSearch(object):
         # whether vertex1[j] also satisfies additional conditions inherent
         # vertex0[i].
         inr = self._iter_new_relations(input_match, subject_graph, edges0,
-                                       constraints0, edges1)
+                                       constraints0, edges1, masks)
         for new_relations in inr:
             # for each set of new_relations, construct a next_match and recurse
             next_match = input_match.copy_with_new_relations(new_relations)
@@ -1733,6 +3687,16 @@ class GraphSearch(object):
             if self.pattern.complete(next_match, subject_graph):
                 yield next_match
             else:
-                for match in self._iter_matches(next_match, subject_graph, one_match, level+1):
+                for match in self._iter_matches(next_match, subject_graph, one_match, level+1, masks):
                     yield match
         self.print_debug("LEAVING_ITER_MATCHES", -1)
+
+
+def _search_worker(task):
+    """Search matches in a worker process, see :meth:`GraphSearch.search_many`"""
+    pattern, subject_graph, one_match, initial_relations, masks = task
+    graph_search = GraphSearch(pattern)
+    if initial_relations is None:
+        return list(graph_search(subject_graph, one_match))
+    return list(graph_search._iter_final_matches(
+        subject_graph, one_match, initial_relations, masks))
@@ -32,6 +32,10 @@ Two auxiliary classes Scalar and Vector3 support most of the mathematical
 operations required to compute the internal coordinates. Additionally they also
 know the chain rule for each operation and can therefore evaluate the
 derivatives simultaneously.
+
+For the most common internal coordinates, there are also vectorized versions
+(bond_lengths, bend_angles and dihed_angles) that evaluate many internal
+coordinates at once with closed-form expressions for the derivatives.
 """
 
 
@@ -47,6 +51,7 @@ __all__ = [
     "dihed_cos", "dihed_angle",
     "opbend_cos", "opbend_angle", "opbend_dist",
     "opbend_mcos", "opbend_mangle",
+    "bond_lengths", "bend_angles", "dihed_angles",
 ]
 
 
@@ -800,3 +805,215 @@ def _sin_to_angle(result, deriv, side=1):
     if deriv == 2:
         return v*sign + offset, d*sign, dd*sign
     raise ValueError("deriv must be 0, 1 or 2.")
+
+
+#
+# Vectorized internal coordinate functions
+#
+
+
+def bond_lengths(coordinates, pairs, deriv=0):
+    """Compute the distances between many pairs of atoms
+
+       Arguments:
+        | ``coordinates``  --  a numpy array with Cartesian coordinates,
+                               shape=(N,3)
+        | ``pairs``  --  an integer array with atom indexes, shape=(nic,2)
+        | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
+
+       This is the vectorized version of :func:`bond_length`. A tuple with the
+       values, shape=(nic,), the first derivatives, shape=(nic,2,3), and the
+       second derivatives, shape=(nic,2,3,2,3), is returned, depending on
+       deriv.
+    """
+    rs = _get_ic_points(coordinates, pairs, 2)
+    r = rs[:, 0] - rs[:, 1]
+    length = np.sqrt((r**2).sum(axis=1))
+    result = [length]
+    if deriv > 0:
+        unit = r/length[:, None]
+        result.append(unit)
+    if deriv > 1:
+        result.append((np.identity(3) - unit[:, :, None]*unit[:, None, :])/length[:, None, None])
+    return _transform_many(result, _bond_coeffs, deriv)
+
+
+def bend_angles(coordinates, triples, deriv=0):
+    """Compute many angles between the vectors rs[0]-rs[1] and rs[2]-rs[1]
+
+       Arguments:
+        | ``coordinates``  --  a numpy array with Cartesian coordinates,
+                               shape=(N,3)
+        | ``triples``  --  an integer array with atom indexes, shape=(nic,3)
+        | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
+
+       This is the vectorized version of :func:`bend_angle`. A tuple with the
+       values, shape=(nic,), the first derivatives, shape=(nic,3,3), and the
+       second derivatives, shape=(nic,3,3,3,3), is returned, depending on
+       deriv.
+    """
+    rs = _get_ic_points(coordinates, triples, 3)
+    a = rs[:, 0] - rs[:, 1]
+    b = rs[:, 2] - rs[:, 1]
+    la = np.sqrt((a**2).sum(axis=1))
+    lb = np.sqrt((b**2).sum(axis=1))
+    ua = a/la[:, None]
+    ub = b/lb[:, None]
+    cos = (ua*ub).sum(axis=1)
+    result = [cos]
+    if deriv > 0:
+        ga = (ub - cos[:, None]*ua)/la[:, None]
+        gb = (ua - cos[:, None]*ub)/lb[:, None]
+        result.append(np.concatenate([ga, gb], axis=1))
+    if deriv > 1:
+        eye = np.identity(3)
+        hessian = np.zeros((len(cos), 6, 6), float)
+        hessian[:, :3, :3] = -(
+            _outer(ua, ga) + _outer(ga, ua) + cos[:, None, None]*(eye - _outer(ua, ua))/la[:, None, None]
+        )/la[:, None, None]
+        hessian[:, 3:, 3:] = -(
+            _outer(ub, gb) + _outer(gb, ub) + cos[:, None, None]*(eye - _outer(ub, ub))/lb[:, None, None]
+        )/lb[:, None, None]
+        hessian[:, :3, 3:] = ((eye - _outer(ub, ub))/lb[:, None, None] - _outer(ua, gb))/la[:, None, None]
+        hessian[:, 3:, :3] = hessian[:, :3, 3:].transpose(0, 2, 1)
+        result.append(hessian)
+    return _transform_many(_cos_to_angle_many(result, deriv), _bend_coeffs, deriv)
+
+
+def dihed_angles(coordinates, quads, deriv=0):
+    """Compute many angles between the planes rs[0], rs[1], rs[2] and rs[1], rs[2], rs[3]
+
+       Arguments:
+        | ``coordinates``  --  a numpy array with Cartesian coordinates,
+                               shape=(N,3)
+        | ``quads``  --  an integer array with atom indexes, shape=(nic,4)
+        | ``deriv``  --  the derivatives to be computed: 0, 1 or 2 [default=0]
+
+       This is the vectorized version of :func:`dihed_angle`, with the same
+       sign convention. A tuple with the values, shape=(nic,), the first
+       derivatives, shape=(nic,4,3), and the second derivatives,
+       shape=(nic,4,3,4,3), is returned, depending on deriv.
+
+       The angle is computed as atan2(y, x) with two polynomials in the
+       relative vectors (up to a common positive factor): x is proportional
+       to the cosine and y to the sine. This avoids the branches for angles
+       close to zero or pi in the scalar version.
+    """
+    rs = _get_ic_points(coordinates, quads, 4)
+    a = rs[:, 0] - rs[:, 1]
+    b = rs[:, 2] - rs[:, 1]
+    c = rs[:, 3] - rs[:, 2]
+    aa, ab, ac, bb, bc = [(u*v).sum(axis=1) for u, v in [(a, a), (a, b), (a, c), (b, b), (b, c)]]
+    lb = np.sqrt(bb)
+    det = (a*np.cross(b, c)).sum(axis=1)
+    # x = |b|^2 (a_ortho . c_ortho) and y = |b|^2 (b_unit x a_ortho) . c_ortho
+    x = bb*ac - ab*bc
+    y = -lb*det
+    result = [np.arctan2(y, x)]
+    if deriv == 0:
+        return _transform_many(result, _dihed_coeffs, deriv)
+
+    n = len(x)
+    gx = np.concatenate([
+        bb[:, None]*c - bc[:, None]*b,
+        2*ac[:, None]*b - bc[:, None]*a - ab[:, None]*c,
+        bb[:, None]*a - ab[:, None]*b,
+    ], axis=1)
+    gdet = np.concatenate([np.cross(b, c), np.cross(c, a), np.cross(a, b)], axis=1)
+    glb = np.zeros((n, 9), float)
+    glb[:, 3:6] = b/lb[:, None]
+    gy = -(lb[:, None]*gdet + det[:, None]*glb)
+    norm2 = x**2 + y**2
+    numerator = x[:, None]*gy - y[:, None]*gx
+    result.append(numerator/norm2[:, None])
+    if deriv == 1:
+        return _transform_many(result, _dihed_coeffs, deriv)
+
+    eye = np.identity(3)
+    hx = np.zeros((n, 9, 9), float)
+    hx[:, :3, 3:6] = 2*_outer(c, b) - _outer(b, c) - bc[:, None, None]*eye
+    hx[:, :3, 6:] = bb[:, None, None]*eye - _outer(b, b)
+    hx[:, 3:6, 3:6] = 2*ac[:, None, None]*eye - _outer(a, c) - _outer(c, a)
+    hx[:, 3:6, 6:] = 2*_outer(b, a) - _outer(a, b) - ab[:, None, None]*eye
+    hdet = np.zeros((n, 9, 9), float)
+    hdet[:, :3, 3:6] = -_skew(c)
+    hdet[:, :3, 6:] = _skew(b)
+    hdet[:, 3:6, 6:] = -_skew(a)
+    for h in hx, hdet:
+        h += h.transpose(0, 2, 1)
+    hx[:, 3:6, 3:6] /= 2
+    hlb = np.zeros((n, 9, 9), float)
+    hlb[:, 3:6, 3:6] = (eye - _outer(b, b)/bb[:, None, None])/lb[:, None, None]
+    hy = -(
+        lb[:, None, None]*hdet + _outer(glb, gdet) + _outer(gdet, glb) +
+        det[:, None, None]*hlb
+    )
+    hessian = (
+        x[:, None, None]*hy - y[:, None, None]*hx + _outer(gy, gx) - _outer(gx, gy)
+    )/norm2[:, None, None]
+    hessian -= 2*_outer(numerator, x[:, None]*gx + y[:, None]*gy)/(norm2**2)[:, None, None]
+    result.append(hessian)
+    return _transform_many(result, _dihed_coeffs, deriv)
+
+
+# Coefficients of the relative vectors in terms of the atomic positions
+_bond_coeffs = np.array([[1, -1]], float)
+_bend_coeffs = np.array([[1, -1, 0], [0, -1, 1]], float)
+_dihed_coeffs = np.array([[1, -1, 0, 0], [0, -1, 1, 0], [0, 0, -1, 1]], float)
+
+
+def _get_ic_points(coordinates, indexes, size):
+    """Return the positions of the atoms in each internal coordinate"""
+    indexes = np.asarray(indexes, int).reshape((-1, size))
+    return np.asarray(coordinates, float)[indexes]
+
+
+def _outer(u, v):
+    """Outer products of two stacks of vectors"""
+    return u[:, :, None]*v[:, None, :]
+
+
+def _skew(u):
+    """Matrices of the cross product with a stack of vectors, i.e. u x ..."""
+    result = np.zeros((len(u), 3, 3), float)
+    result[:, 0, 1] = -u[:, 2]
+    result[:, 0, 2] = u[:, 1]
+    result[:, 1, 0] = u[:, 2]
+    result[:, 1, 2] = -u[:, 0]
+    result[:, 2, 0] = -u[:, 1]
+    result[:, 2, 1] = u[:, 0]
+    return result
+
+
+def _transform_many(result, coeffs, deriv):
+    """Convert derivatives towards relative vectors into atomic derivatives"""
+    if deriv not in (0, 1, 2):
+        raise ValueError("deriv must be 0, 1 or 2.")
+    v = result[0]
+    if deriv == 0:
+        return v,
+    nrel = len(coeffs)
+    d = np.einsum("rk,nri->nki", coeffs, result[1].reshape((-1, nrel, 3)))
+    if deriv == 1:
+        return v, d
+    dd = np.einsum(
+        "rk,sl,nrisj->nkilj", coeffs, coeffs, result[2].reshape((-1, nrel, 3, nrel, 3))
+    )
+    return v, d, dd
+
+
+def _cos_to_angle_many(result, deriv):
+    """Vectorized version of _cos_to_angle, without the sign"""
+    cos = result[0]
+    v = np.arccos(np.clip(cos, -1, 1))
+    if deriv == 0:
+        return [v]
+    inside = abs(cos) < 1
+    factor1 = np.zeros(len(cos), float)
+    factor1[inside] = -1.0/np.sqrt(1 - cos[inside]**2)
+    d = factor1[:, None]*result[1]
+    if deriv == 1:
+        return [v, d]
+    factor2 = cos*factor1**3
+    dd = factor2[:, None, None]*_outer(result[1], result[1]) + factor1[:, None, None]*result[2]
+    return [v, d, dd]
@@ -106,3 +106,16 @@ class XYZTestCase(BaseTestCase):
         self.assertEqual(xyz.numbers[5], 6)
         self.assertEqual(xyz.symbols[-1], "H")
         self.assertEqual(xyz.numbers[-1], 1)
+
+    def test_get_frames(self):
+        xf = XYZFile(pkg_resources.resource_filename(__name__, "../../data/test/water.xyz"))
+        xf.geometries = np.array([xf.geometries[0] + i*0.1 for i in range(5)])
+        xf.titles = [xf.titles[0]]*5
+        frames = xf.get_frames()
+        frames.set_default_masses()
+        self.assertEqual(len(frames), 5)
+        self.assertEqual(frames.symbols, ("O", "H", "H"))
+        molecule = xf.get_molecule(3)
+        molecule.set_default_masses()
+        self.assertArraysAlmostEqual(frames.com[3], molecule.com)
+        self.assertArraysAlmostEqual(frames.principal_moments[3], molecule.principal_moments, 1e-10)
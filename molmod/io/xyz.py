@@ -33,7 +33,7 @@ import numpy as np
 
 from molmod.io.common import SlicedReader, FileFormatError
 from molmod.periodic import periodic
-from molmod.molecules import Molecule
+from molmod.molecules import Molecule, Frames
 from molmod.units import angstrom
 
 
@@ -252,6 +252,15 @@ class XYZFile(object):
         """
         return Molecule(self.numbers, self.geometries[index], self.titles[index], symbols=self.symbols)
 
+    def get_frames(self):
+        """Get all frames of the trajectory as a Frames object
+
+           The Frames object shares the array with geometries and offers
+           vectorized analysis of all frames, e.g. centers of mass or inertia
+           tensors.
+        """
+        return Frames(self.numbers, self.geometries, self.titles, symbols=self.symbols)
+
     def write_to_file(self, f, file_unit=angstrom):
         """Write the trajectory to a file
 
@@ -28,15 +28,17 @@ from __future__ import division
 from builtins import range
 import numpy as np
 
-from molmod.graphs import cached, Graph, CustomPattern
+from molmod.graphs import cached, Graph, CustomPattern, GraphSearch, \
+    get_vertex_mask
 from molmod.utils import ReadOnlyAttribute
-from molmod.binning import PairSearchIntra
+from molmod.units import angstrom
+from molmod.binning import get_pair_arrays
 
 
 __all__ = [
-    "MolecularGraph",
+    "MolecularGraph", "MolecularGraphStore", "BondEvent", "TopologyTracker",
     "HasAtomNumber", "HasNumNeighbors", "HasNeighborNumbers", "HasNeighbors",
-    "BondLongerThan", "atom_criteria",
+    "BondLongerThan", "atom_criteria", "AtomTypeRule", "AtomTyper",
     "BondPattern", "BendingAnglePattern", "DihedralAnglePattern",
     "OutOfPlanePattern", "TetraPattern", "NRingPattern",
 ]
@@ -92,80 +94,98 @@ class MolecularGraph(Graph):
             | ``molecule``  --  The molecule to derive the graph from
 
            Optional arguments:
-            | ``do_orders``  --  set to True to estimate the bond order
+            | ``do_orders``  --  set to True to estimate the bond order from the
+                                 bond lengths, or to 'valence' to assign bond
+                                 orders and formal charges that satisfy the
+                                 valences of the atoms, see
+                                 :meth:`assign_bond_orders`
             | ``scaling``  --  scale the threshold for the connectivity. increase
                                this to 1.5 in case of transition states when a
                                fully connected topology is required.
+
+           Each edge ``(i, j)`` of the result has ``i > j`` and the edges are
+           sorted by the first and then by the second atom index.
         """
         from molmod.bonds import bonds
 
+        if not (do_orders == "valence" or do_orders in (True, False)):
+            raise ValueError("do_orders must be True, False or 'valence'.")
+        numbers = molecule.numbers
         unit_cell = molecule.unit_cell
-        pair_search = PairSearchIntra(
-            molecule.coordinates,
-            bonds.max_length*bonds.bond_tolerance,
-            unit_cell
-        )
-
-        orders = []
-        lengths = []
-        edges = []
-
-        for i0, i1, delta, distance in pair_search:
-            bond_order = bonds.bonded(molecule.numbers[i0], molecule.numbers[i1], distance/scaling)
-            if bond_order is not None:
-                if do_orders:
-                    orders.append(bond_order)
-                lengths.append(distance)
-                edges.append((i0,i1))
-
-        if do_orders:
-            result = cls(edges, molecule.numbers, orders, symbols=molecule.symbols)
+        # Only the elements in the molecule determine the cutoff. The scaling
+        # can not push the cutoff beyond the largest tabulated bond length.
+        cutoff = min(
+            bonds.get_max_length(numbers)*scaling, bonds.max_length
+        )*bonds.bond_tolerance
+        if cutoff > 0:
+            i0, i1, deltas, lengths = get_pair_arrays(
+                molecule.coordinates, cutoff, unit_cell
+            )
         else:
-            result = cls(edges, molecule.numbers, symbols=molecule.symbols)
+            i0 = i1 = np.zeros(0, int)
+            deltas = np.zeros((0, 3), float)
+            lengths = np.zeros(0, float)
+        bond_types = bonds.bonded_many(numbers[i0], numbers[i1], lengths/scaling)
+        mask = bond_types > 0
+        i0, i1, deltas, lengths, bond_types = \
+            i0[mask], i1[mask], deltas[mask], lengths[mask], bond_types[mask]
 
         # run a check on all neighbors. if two bonds point in a direction that
-        # differs only by 45 deg. the longest of the two is discarded. the
-        # double loop over the neighbors is done such that the longest bonds
-        # are eliminated first
-        slated_for_removal = set([])
-        threshold = 0.5**0.5
-        for c, ns in result.neighbors.items():
-            lengths_ns = []
-            for n in ns:
-                delta = molecule.coordinates[n] - molecule.coordinates[c]
-                if unit_cell is not None:
-                    delta = unit_cell.shortest_vector(delta)
-                length = np.linalg.norm(delta)
-                lengths_ns.append([length, delta, n])
-            lengths_ns.sort(reverse=True, key=(lambda r: r[0]))
-            for i0, (length0, delta0, n0) in enumerate(lengths_ns):
-                for i1, (length1, delta1, n1) in enumerate(lengths_ns[:i0]):
-                    if length1 == 0.0:
-                        continue
-                    cosine = np.dot(delta0, delta1)/length0/length1
-                    if cosine > threshold:
-                        # length1 > length0
-                        slated_for_removal.add((c,n1))
-                        lengths_ns[i1][0] = 0.0
-        # construct a mask
-        mask = np.ones(len(edges), bool)
-        for i0, i1 in slated_for_removal:
-            edge_index = result.edge_index.get(frozenset([i0,i1]))
-            if edge_index is None:
-                raise ValueError('Could not find edge that has to be removed: %i %i' % (i0, i1))
-            mask[edge_index] = False
-        # actual removal
-        edges = [edges[i] for i in range(len(edges)) if mask[i]]
-        if do_orders:
-            bond_order = [bond_order[i] for i in range(len(bond_order)) if mask[i]]
-            result = cls(edges, molecule.numbers, orders)
+        # differs only by 45 deg. the longest of the two is discarded.
+        mask = ~cls._get_overlapping_bonds(i0, i1, deltas, lengths)
+
+        edge_array = np.array([i0[mask], i1[mask]]).T
+        if do_orders == "valence" or not do_orders:
+            orders = None
         else:
-            result = cls(edges, molecule.numbers)
+            orders = bond_types[mask].astype(float)
+        result = cls.from_arrays(edge_array, numbers, orders, molecule.symbols)
+        if do_orders == "valence":
+            result = result.assign_bond_orders()
+        result.bond_lengths = lengths[mask]
+        return result
 
-        lengths = [lengths[i] for i in range(len(lengths)) if mask[i]]
-        result.bond_lengths = np.array(lengths)
+    @staticmethod
+    def _get_overlapping_bonds(i0, i1, deltas, lengths):
+        """Mask of bonds that make an angle below 45 deg. with a shorter bond
 
-        return result
+           Arguments: the two atom indexes, the relative vectors and the
+           lengths of the bonds.
+
+           When two bonds of the same atom point in nearly the same direction,
+           the longest of the two is discarded. Bonds with a zero length are
+           ignored.
+        """
+        threshold = 0.5**0.5
+        num_bonds = len(i0)
+        # both directions of each bond, sorted by center and decreasing length
+        centers = np.concatenate([i0, i1])
+        others = np.concatenate([i1, i0])
+        directions = np.concatenate([deltas, -deltas])
+        directed_lengths = np.concatenate([lengths, lengths])
+        bond_indexes = np.concatenate([np.arange(num_bonds)]*2)
+        order = np.lexsort((others, -directed_lengths, centers))
+        centers = centers[order]
+        directions = directions[order]
+        directed_lengths = directed_lengths[order]
+        bond_indexes = bond_indexes[order]
+
+        removed = np.zeros(num_bonds, bool)
+        if num_bonds == 0:
+            return removed
+        max_degree = np.bincount(centers).max()
+        for offset in range(1, max_degree):
+            # compare each bond with a shorter bond of the same center
+            longer = np.arange(len(centers) - offset)
+            shorter = longer + offset
+            same = (centers[longer] == centers[shorter]) & \
+                (directed_lengths[longer] > 0) & (directed_lengths[shorter] > 0)
+            longer = longer[same]
+            shorter = shorter[same]
+            cosines = (directions[longer]*directions[shorter]).sum(axis=1)
+            cosines /= directed_lengths[longer]*directed_lengths[shorter]
+            removed[bond_indexes[longer[cosines > threshold]]] = True
+        return removed
 
     @classmethod
     def from_blob(cls, s):
@@ -180,6 +200,54 @@ class MolecularGraph(Graph):
             orders.append(o)
         return cls(edges, numbers, np.array(orders))
 
+    @classmethod
+    def from_binary_blob(cls, data):
+        """Construct a molecular graph from the binary blob representation
+
+           Argument:
+            | ``data``  --  a bytes object or an array of unsigned bytes, see
+                            :attr:`binary_blob`
+        """
+        data = np.frombuffer(data, np.uint8) if isinstance(data, bytes) else data
+        num_vertices, position = _read_varint(data, 0)
+        num_edges, position = _read_varint(data, position)
+        float_orders, position = _read_varint(data, position)
+        data = data[position:]
+        num_ints = num_vertices + (2 if float_orders else 3)*num_edges
+        values, end = _decode_varints(data, num_ints)
+        values = _zigzag_decode(values)
+        numbers = values[:num_vertices]
+        edges = values[num_vertices:num_vertices + 2*num_edges].reshape((-1, 2))
+        edges[:, 1] += edges[:, 0]
+        if float_orders:
+            orders = data[end:end + 8*num_edges].view("<f8").astype(float)
+        else:
+            orders = values[num_vertices + 2*num_edges:].astype(float)
+        return cls.from_arrays(edges, numbers, orders)
+
+    @classmethod
+    def from_arrays(cls, edge_array, numbers, orders=None, symbols=None):
+        """Construct a molecular graph directly from an array with edges
+
+           Arguments:
+            | ``edge_array``  --  an integer array with shape (num_edges, 2)
+            | ``numbers``  --  consecutive atom numbers
+
+           Optional arguments:
+            | ``orders``  --  bond orders
+            | ``symbols``  --  atomic symbols
+
+           The edges are not validated, see :meth:`Graph.from_arrays`.
+        """
+        result = cls.__new__(cls)
+        Graph._init_arrays(result, edge_array, len(numbers))
+        if orders is None:
+            orders = np.ones(result.num_edges, float)
+        result.numbers = numbers
+        result.orders = orders
+        result.symbols = symbols
+        return result
+
     def __init__(self, edges, numbers, orders=None, symbols=None, num_vertices=None):
         """
            Arguments:
@@ -217,25 +285,15 @@ class MolecularGraph(Graph):
         """
         if not isinstance(repeat, int):
             raise TypeError("Can only multiply a graph with an integer")
-        # copy edges
-        new_edges = []
-        for i in range(repeat):
-            for vertex1, vertex2 in self.edges:
-                new_edges.append(frozenset([vertex1+i*self.num_vertices, vertex2+i*self.num_vertices]))
-        # copy numbers
-        new_numbers = np.zeros((repeat, len(self.numbers)), int)
-        new_numbers[:] = self.numbers
-        new_numbers = new_numbers.ravel()
-        # copy orders
-        new_orders = np.zeros((repeat, len(self.orders)), int)
-        new_orders[:] = self.orders
-        new_orders = new_orders.ravel()
+        # copy numbers and orders
+        new_numbers = np.tile(self.numbers, repeat)
+        new_orders = np.tile(self.orders, repeat)
         # copy symbols
         if self.symbols is not None:
             new_symbols = self.symbols*repeat
         else:
             new_symbols = None
-        return MolecularGraph(new_edges, new_numbers, new_orders, new_symbols)
+        return MolecularGraph.from_arrays(self._get_repeated_edges(repeat), new_numbers, new_orders, new_symbols)
 
     __rmul__ = __mul__
 
@@ -246,6 +304,31 @@ class MolecularGraph(Graph):
         edge_str = ",".join("%i_%i_%i" % (i, j, o) for (i, j), o in zip(self.edges, self.orders))
         return "%s %s" % (atom_str, edge_str)
 
+    @cached
+    def binary_blob(self):
+        """A compact binary representation of the graph
+
+           The atom numbers, the edges and the bond orders are stored as
+           variable-length integers, which take one byte for small values.
+           Non-integer bond orders are stored as doubles. Just like
+           :attr:`blob`, the symbols are not included.
+        """
+        orders = np.asarray(self.orders, float)
+        float_orders = (orders != np.round(orders)).any()
+        edges = self.edge_array.astype(np.int64)
+        values = [
+            [self.num_vertices, self.num_edges, int(float_orders)],
+            _zigzag_encode(self.numbers),
+            # store the second vertex relative to the first one
+            _zigzag_encode(np.array([edges[:, 0], edges[:, 1] - edges[:, 0]]).T.ravel()),
+        ]
+        if not float_orders:
+            values.append(_zigzag_encode(orders))
+        result = _encode_varints(np.concatenate(values)).tobytes()
+        if float_orders:
+            result += orders.astype("<f8").tobytes()
+        return result
+
     def get_vertex_string(self, i):
         """Return a string based on the atom number"""
         number = self.numbers[i]
@@ -264,6 +347,10 @@ class MolecularGraph(Graph):
             # pad with zeros to make sure that string sort is identical to number sort
             return "%03i" % order
 
+    def _get_edited(self, edge_array, orders):
+        """A graph with new edges and the same atoms, see :class:`molmod.graphs.GraphBuilder`"""
+        return MolecularGraph.from_arrays(edge_array, self.numbers, orders, self.symbols)
+
     def get_subgraph(self, subvertices, normalize=False):
         """Creates a subgraph of the current graph
 
@@ -281,12 +368,148 @@ class MolecularGraph(Graph):
         else:
             new_symbols = self.symbols
         new_orders = self.orders[graph._old_edge_indexes]
-        result = MolecularGraph(graph.edges, new_numbers, new_orders, new_symbols)
+        result = MolecularGraph.from_arrays(graph.edge_array, new_numbers, new_orders, new_symbols)
         if normalize:
             result._old_vertex_indexes = graph._old_vertex_indexes
         result._old_edge_indexes = graph._old_edge_indexes
         return result
 
+    def assign_bond_orders(self, formal_charges=None):
+        """Return a molecular graph with bond orders that satisfy the valences
+
+           Optional argument:
+            | ``formal_charges``  --  known formal charges of the atoms. A
+                                      charged atom gets the valences of the
+                                      isoelectronic neutral element, e.g. O-
+                                      is treated as F, and keeps its charge.
+
+           Each atom gets the lowest common valence of its element that is not
+           smaller than its number of neighbors. The remaining (free) valence
+           is distributed over the bonds as follows:
+
+           1. Atoms with free valence and only one neighbor with free valence
+              form a multiple bond with that neighbor. This is repeated until
+              no such atoms are left. All such atoms are treated at once with
+              array operations.
+           2. The remaining atoms, e.g. in aromatic systems, get a Kekulé
+              structure from a maximum matching between atoms with free
+              valence (Edmonds' blossom algorithm).
+           3. Atoms with a valence that is still unsatisfied may raise the
+              valence of a neighbor (e.g. S, P or N in sulfate, phosphate or
+              nitro groups), which may introduce a positive formal charge.
+              All other unsatisfied valences become negative formal charges.
+
+           The atoms for which no valences are known keep single bonds. The
+           result has an additional attribute ``formal_charges``.
+        """
+        num_vertices = self.num_vertices
+        edge_array = self.edge_array
+        # directed edges sorted by source vertex, i.e. in CSR order
+        sources = np.concatenate([edge_array[:, 0], edge_array[:, 1]])
+        targets = np.concatenate([edge_array[:, 1], edge_array[:, 0]])
+        edge_ids = np.concatenate([np.arange(self.num_edges)]*2)
+        order = sources.argsort(kind="mergesort")
+        sources, targets, edge_ids = sources[order], targets[order], edge_ids[order]
+        degrees = np.bincount(sources, minlength=num_vertices)
+
+        # choose the initial valences
+        options = []
+        for i, number in enumerate(self.numbers):
+            charge = 0 if formal_charges is None else int(formal_charges[i])
+            if charge == 0:
+                options.append(_valence_options.get(number, ()))
+            else:
+                options.append(tuple(
+                    (valence, charge) for valence, other
+                    in _valence_options.get(number - charge, ()) if other == 0
+                ))
+        option_indexes = -np.ones(num_vertices, int)
+        free = np.zeros(num_vertices, int)
+        charges = np.zeros(num_vertices, int)
+        for i, atom_options in enumerate(options):
+            for index, (valence, charge) in enumerate(atom_options):
+                if valence >= degrees[i]:
+                    option_indexes[i] = index
+                    free[i] = valence - degrees[i]
+                    charges[i] = charge
+                    break
+        extra = np.zeros(self.num_edges, int)
+
+        # 1) atoms with a single partner
+        while True:
+            active = (free[sources] > 0) & (free[targets] > 0) & (extra[edge_ids] < 2)
+            counts = np.bincount(sources[active], minlength=num_vertices)
+            forced = active & (counts[sources] == 1)
+            if not forced.any():
+                break
+            # one bond per partner in each round
+            edges = np.unique(edge_ids[forced])
+            partners = targets[forced]
+            first = np.unique(partners, return_index=True)[1]
+            edges = np.intersect1d(edges, edge_ids[forced][first])
+            i, j = edge_array[edges].T
+            amounts = np.minimum(np.minimum(free[i], free[j]), 2 - extra[edges])
+            extra[edges] += amounts
+            free[i] -= amounts
+            free[j] -= amounts
+
+        # 2) maximum matching among the remaining atoms with free valence
+        active = (free[sources] > 0) & (free[targets] > 0) & (extra[edge_ids] < 2)
+        if active.any():
+            # Each atom with two free valences is represented twice.
+            copies = [[] for i in range(num_vertices)]
+            owners = []
+            for i in np.unique(sources[active]):
+                for k in range(min(free[i], 2)):
+                    copies[i].append(len(owners))
+                    owners.append(i)
+            neighbors = [[] for owner in owners]
+            copy_edges = {}
+            for i, j, edge in zip(sources[active], targets[active], edge_ids[active]):
+                for ci in copies[i]:
+                    for cj in copies[j]:
+                        neighbors[ci].append(cj)
+                        copy_edges[(ci, cj)] = edge
+            match = _get_max_matching(neighbors)
+            for ci, cj in enumerate(match):
+                if cj > ci:
+                    edge = copy_edges[(ci, cj)]
+                    i, j = edge_array[edge]
+                    if extra[edge] < 2 and free[i] > 0 and free[j] > 0:
+                        extra[edge] += 1
+                        free[i] -= 1
+                        free[j] -= 1
+
+        # 3) raise valences of neighbors of unsatisfied atoms
+        indptr = np.concatenate([[0], np.cumsum(degrees)])
+        for i in free.nonzero()[0]:
+            for position in range(indptr[i], indptr[i+1]):
+                j = targets[position]
+                edge = edge_ids[position]
+                if free[i] == 0:
+                    break
+                if extra[edge] >= 2 or option_indexes[j] == -1:
+                    continue
+                if free[j] == 0:
+                    # switch to the next higher valence, if any
+                    valence = options[j][option_indexes[j]][0]
+                    for index in range(option_indexes[j] + 1, len(options[j])):
+                        new_valence, charge = options[j][index]
+                        if new_valence > valence:
+                            free[j] = new_valence - valence
+                            charges[j] = charge
+                            option_indexes[j] = index
+                            break
+                amount = min(free[i], free[j], 2 - extra[edge])
+                extra[edge] += amount
+                free[i] -= amount
+                free[j] -= amount
+        charges -= free
+
+        result = MolecularGraph.from_arrays(edge_array, self.numbers, 1.0 + extra, self.symbols)
+        result.formal_charges = charges
+        return result
+
     def add_hydrogens(self, formal_charges=None):
         """Returns a molecular graph where hydrogens are added explicitely
 
@@ -301,6 +524,11 @@ class MolecularGraph(Graph):
 
         new_edges = list(self.edges)
         counter = self.num_vertices
+        # the sum of the (integer) bond orders of each atom
+        orders = self.orders.astype(int)
+        orders[self.orders <= 0] = 1
+        order_sums = np.bincount(self.edge_array.ravel(), np.repeat(orders, 2),
+            minlength=self.num_vertices).astype(int)
         for i in range(self.num_vertices):
             num_elec = self.numbers[i]
             if formal_charges is not None:
@@ -315,11 +543,7 @@ class MolecularGraph(Graph):
                 continue
             if num_hydrogen > 4:
                 num_hydrogen = 8 - num_hydrogen
-            for n in self.neighbors[i]:
-                bo = self.orders[self.edge_index[frozenset([i, n])]]
-                if bo <= 0:
-                    bo = 1
-                num_hydrogen -= int(bo)
+            num_hydrogen -= order_sums[i]
             for j in range(num_hydrogen):
                 new_edges.append((i, counter))
                 counter += 1
@@ -335,8 +559,450 @@ class MolecularGraph(Graph):
 
 
 
+# common valences and the corresponding formal charges, in order of preference
+_valence_options = {
+    1: ((1, 0),), 5: ((3, 0), (4, -1)), 6: ((4, 0),), 7: ((3, 0), (4, 1)),
+    8: ((2, 0), (3, 1)), 9: ((1, 0),), 13: ((3, 0), (4, -1)), 14: ((4, 0),),
+    15: ((3, 0), (5, 0), (4, 1)), 16: ((2, 0), (4, 0), (6, 0), (3, 1)),
+    17: ((1, 0),), 35: ((1, 0),), 53: ((1, 0),),
+}
+
+
+def _get_max_matching(neighbors):
+    """Compute a maximum matching in a general graph
+
+       Argument:
+        | ``neighbors``  --  a list with the neighbors of each vertex
+
+       Returns a list with the matching vertex for each vertex, or -1 for
+       unmatched vertices. A greedy matching, starting with the vertices with
+       the fewest neighbors, is completed with augmenting paths from Edmonds'
+       blossom algorithm.
+    """
+    size = len(neighbors)
+    match = [-1]*size
+    for v in sorted(range(size), key=lambda v: len(neighbors[v])):
+        if match[v] == -1:
+            for w in sorted(neighbors[v], key=lambda w: len(neighbors[w])):
+                if match[w] == -1:
+                    match[v] = w
+                    match[w] = v
+                    break
+
+    def find_lca(base, parents, a, b):
+        """The lowest common ancestor of a and b in the alternating tree"""
+        seen = set([])
+        while True:
+            a = base[a]
+            seen.add(a)
+            if match[a] == -1:
+                break
+            a = parents[match[a]]
+        while True:
+            b = base[b]
+            if b in seen:
+                return b
+            b = parents[match[b]]
+
+    def mark_path(base, parents, blossom, v, lca, child):
+        while base[v] != lca:
+            blossom[base[v]] = True
+            blossom[base[match[v]]] = True
+            parents[v] = child
+            child = match[v]
+            v = parents[match[v]]
+
+    def find_path(root):
+        """Search an augmenting path, returns its last vertex or -1"""
+        used = [False]*size
+        parents = [-1]*size
+        base = list(range(size))
+        used[root] = True
+        queue = [root]
+        while queue:
+            v = queue.pop(0)
+            for w in neighbors[v]:
+                if base[v] == base[w] or match[v] == w:
+                    continue
+                if w == root or (match[w] != -1 and parents[match[w]] != -1):
+                    # contract the blossom
+                    lca = find_lca(base, parents, v, w)
+                    blossom = [False]*size
+                    mark_path(base, parents, blossom, v, lca, w)
+                    mark_path(base, parents, blossom, w, lca, v)
+                    for u in range(size):
+                        if blossom[base[u]]:
+                            base[u] = lca
+                            if not used[u]:
+                                used[u] = True
+                                queue.append(u)
+                elif parents[w] == -1:
+                    parents[w] = v
+                    if match[w] == -1:
+                        return w, parents
+                    used[match[w]] = True
+                    queue.append(match[w])
+        return -1, parents
+
+    for root in range(size):
+        if match[root] != -1 or len(neighbors[root]) == 0:
+            continue
+        v, parents = find_path(root)
+        # flip the matching along the augmenting path
+        while v != -1:
+            pv = parents[v]
+            ppv = match[pv]
+            match[v] = pv
+            match[pv] = v
+            v = ppv
+    return match
+
+
+def _zigzag_encode(values):
+    """Map signed integers to unsigned integers, small in absolute value first"""
+    values = np.asarray(values).astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _zigzag_decode(values):
+    """Inverse of :func:`_zigzag_encode`"""
+    values = values.astype(np.uint64)
+    return ((values >> np.uint64(1)).astype(np.int64)) ^ -((values & np.uint64(1)).astype(np.int64))
+
+
+def _encode_varints(values):
+    """Encode unsigned integers as variable-length integers
+
+       Each byte stores seven bits of the value, starting with the least
+       significant ones. The high bit is set in all but the last byte of a
+       value. Returns an array of unsigned bytes.
+    """
+    values = np.asarray(values, np.uint64)
+    shifts = np.arange(10, dtype=np.uint64)*np.uint64(7)
+    groups = (values[:, None] >> shifts) & np.uint64(0x7f)
+    # the number of bytes per value, at least one
+    sizes = np.maximum(1, 10 - (np.cumsum(groups[:, ::-1], axis=1) == 0).sum(axis=1))
+    used = np.arange(10) < sizes[:, None]
+    groups[np.arange(10) < sizes[:, None] - 1] |= np.uint64(0x80)
+    return groups[used].astype(np.uint8)
+
+
+def _decode_varints(data, count):
+    """Decode the first ``count`` variable-length integers in ``data``
+
+       Returns the integers and the position of the first byte after them.
+    """
+    if count == 0:
+        return np.zeros(0, np.int64), 0
+    ends = (data[:10*count] < 0x80).nonzero()[0][:count]
+    if len(ends) < count:
+        raise ValueError("Unexpected end of the binary data.")
+    end = ends[-1] + 1
+    if end == count:
+        # all values fit in a single byte
+        return data[:end].astype(np.int64), end
+    data = data[:end].astype(np.uint64)
+    begins = np.zeros(count, int)
+    begins[1:] = ends[:-1] + 1
+    positions = np.arange(end) - np.repeat(begins, ends - begins + 1)
+    parts = (data & np.uint64(0x7f)) << (positions.astype(np.uint64)*np.uint64(7))
+    return np.bitwise_or.reduceat(parts, begins).astype(np.int64), end
+
+
+def _read_varint(data, position):
+    """Decode a single variable-length integer, returns value and new position"""
+    result = 0
+    shift = 0
+    while True:
+        byte = int(data[position])
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+class MolecularGraphStore(object):
+    """A file with many molecular graphs in their binary blob representation
+
+       The file is memory-mapped and the graphs are only decoded when they are
+       accessed, such that random access to a large collection of graphs is
+       cheap.
+
+       >>> MolecularGraphStore.write("graphs.bin", graphs)
+       >>> store = MolecularGraphStore("graphs.bin")
+       >>> graph = store[12345]
+
+       The file starts with a magic string, followed by the concatenated
+       binary blobs, an array with offsets of the blobs and the number of
+       graphs. Because the index comes last, the graphs are written one by one
+       without keeping them in memory.
+    """
+    magic = b"MMGBIN01"
+
+    def __init__(self, filename):
+        """
+           Argument:
+            | ``filename``  --  a file written with :meth:`write`
+        """
+        # a plain array view on the memory map avoids the overhead of the
+        # memmap subclass when slicing
+        self._data = np.asarray(np.memmap(filename, np.uint8, mode="r"))
+        if self._data[:len(self.magic)].tobytes() != self.magic:
+            raise ValueError("The file %s does not contain molecular graphs." % filename)
+        num_graphs = int(self._data[-8:].view("<i8")[0])
+        begin = len(self._data) - 8*(num_graphs + 2)
+        self._offsets = self._data[begin:-8].view("<i8")
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        """Decode the graph with the given index, or a list for a slice"""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("Graph index out of range.")
+        begin, end = self._offsets[index], self._offsets[index+1]
+        return MolecularGraph.from_binary_blob(self._data[begin:end])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @classmethod
+    def write(cls, filename, graphs):
+        """Write molecular graphs to a file
+
+           Arguments:
+            | ``filename``  --  the file to write to
+            | ``graphs``  --  an iterable of MolecularGraph objects
+        """
+        offsets = [len(cls.magic)]
+        with open(filename, "wb") as f:
+            f.write(cls.magic)
+            for graph in graphs:
+                blob = graph.binary_blob
+                f.write(blob)
+                offsets.append(offsets[-1] + len(blob))
+            f.write(b"\0"*((-offsets[-1]) % 8))
+            f.write(np.array(offsets, "<i8").tobytes())
+            f.write(np.array([len(offsets) - 1], "<i8").tobytes())
+
+
+class BondEvent(object):
+    """A bond that is formed or broken in a trajectory"""
+    def __init__(self, frame, atom0, atom1, formed):
+        """
+           Arguments:
+            | ``frame``  --  the index of the frame in which the change occurs
+            | ``atom0``, ``atom1``  --  the atoms of the bond, atom0 > atom1
+            | ``formed``  --  True when the bond is formed, False when it is
+                              broken
+        """
+        self.frame = frame
+        self.atom0 = atom0
+        self.atom1 = atom1
+        self.formed = formed
+
+    def _get_key(self):
+        """The tuple that is used for comparisons and hashing"""
+        return (self.frame, self.atom0, self.atom1, self.formed)
+
+    def __eq__(self, other):
+        if not isinstance(other, BondEvent):
+            return NotImplemented
+        return self._get_key() == other._get_key()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self._get_key())
+
+    def __repr__(self):
+        return "BondEvent(%i, %i, %i, %s)" % (self.frame, self.atom0, self.atom1, self.formed)
+
+
+class TopologyTracker(object):
+    """Follow the bonds in a trajectory with incremental updates
+
+       The bonds are detected with the same criteria as in
+       :meth:`MolecularGraph.from_geometry`, but the pair search is only
+       repeated when some atom has moved more than half of the skin since the
+       previous search. In all other frames, only the distances of the
+       candidate pairs are recomputed.
+
+       Example usage::
+
+           xr = XYZReader("trajectory.xyz")
+           tracker = TopologyTracker(xr.numbers, xr.symbols)
+           for title, coordinates in xr:
+               for event in tracker.update(coordinates):
+                   print(event)
+           print(tracker.graph)
+    """
+
+    def __init__(self, numbers, symbols=None, unit_cell=None, scaling=1.0,
+                 skin=1.0*angstrom, hysteresis=0.0):
+        """
+           Arguments:
+            | ``numbers``  --  the atom numbers
+
+           Optional arguments:
+            | ``symbols``  --  the atom symbols, passed on to the graphs
+            | ``unit_cell``  --  the periodic boundary conditions
+            | ``scaling``  --  scale the threshold for the connectivity, see
+                               :meth:`MolecularGraph.from_geometry`
+            | ``skin``  --  the margin on top of the largest bond length for
+                            the list of candidate pairs
+            | ``hysteresis``  --  an existing bond is only broken when the
+                                  distance exceeds its threshold by this
+                                  amount. This suppresses events due to
+                                  vibrations of bonds close to the threshold.
+
+           After initialization, the following attributes are defined:
+            | ``graph``  --  the MolecularGraph of the last frame, only
+                             replaced when the topology changes. Its
+                             ``bond_lengths`` are updated in every frame.
+            | ``frame``  --  the index of the last frame
+            | ``events``  --  all BondEvent objects so far
+            | ``num_searches``  --  the number of pair searches so far
+        """
+        from molmod.bonds import bonds
+        self.numbers = np.asarray(numbers)
+        self.symbols = symbols
+        self.unit_cell = unit_cell
+        self.scaling = scaling
+        self.skin = skin
+        self.hysteresis = hysteresis
+        self._bonds = bonds
+        self._cutoff = min(
+            bonds.get_max_length(self.numbers)*scaling, bonds.max_length
+        )*bonds.bond_tolerance + hysteresis + skin
+
+        self.graph = None
+        self.frame = -1
+        self.events = []
+        self.num_searches = 0
+        # candidate pairs and reference coordinates of the last pair search
+        self._pairs = None
+        self._thresholds = None
+        self._reference = None
+        # raw bond state of the candidate pairs, before removing overlaps
+        self._bonded = None
+        self._keys = np.zeros(0, np.int64)
+
+    def _search_pairs(self, coordinates):
+        """Rebuild the list of candidate pairs"""
+        i0, i1 = get_pair_arrays(coordinates, self._cutoff, self.unit_cell)[:2]
+        thresholds = np.minimum(
+            self._bonds.get_max_distances(self.numbers[i0], self.numbers[i1])*self.scaling,
+            self._bonds.max_length*self._bonds.bond_tolerance
+        )
+        # only keep the pairs that can be bonded
+        mask = thresholds > 0
+        pairs = np.array([i0[mask], i1[mask]]).T
+        if self._bonded is not None:
+            # transfer the bond state of the previous candidate pairs
+            old_keys = self._get_keys(self._pairs[self._bonded])
+            self._bonded = np.in1d(self._get_keys(pairs), old_keys)
+        self._pairs = pairs
+        self._thresholds = thresholds[mask]
+        self._reference = coordinates.copy()
+        self.num_searches += 1
+
+    def _get_keys(self, pairs):
+        """Unique integer keys for an array of pairs"""
+        return pairs[:, 0].astype(np.int64)*len(self.numbers) + pairs[:, 1]
+
+    def _get_deltas(self, deltas):
+        """Apply the minimum image convention when needed"""
+        if self.unit_cell is None:
+            return deltas
+        return self.unit_cell.shortest_vector(deltas)
+
+    def update(self, coordinates):
+        """Process the next frame and return the list of BondEvent objects
+
+           Argument:
+            | ``coordinates``  --  the atomic coordinates of the frame
+
+           The events of the first frame are empty: all bonds in the first
+           frame are considered to be present from the start.
+        """
+        coordinates = np.asarray(coordinates, float)
+        self.frame += 1
+        if self._reference is None:
+            self._search_pairs(coordinates)
+        else:
+            displacements = self._get_deltas(coordinates - self._reference)
+            if (displacements**2).sum(axis=1).max() > (0.5*self.skin)**2:
+                self._search_pairs(coordinates)
+
+        i0, i1 = self._pairs.T
+        deltas = self._get_deltas(coordinates[i1] - coordinates[i0])
+        distances = np.sqrt((deltas**2).sum(axis=1))
+        if self._bonded is None:
+            self._bonded = distances < self._thresholds
+        else:
+            self._bonded = np.where(
+                self._bonded,
+                distances < self._thresholds + self.hysteresis,
+                distances < self._thresholds,
+            )
+
+        # remove overlapping bonds, just like in from_geometry
+        bonded = self._bonded.nonzero()[0]
+        overlapping = MolecularGraph._get_overlapping_bonds(
+            i0[bonded], i1[bonded], deltas[bonded], distances[bonded]
+        )
+        bonded = bonded[~overlapping]
+        keys = self._get_keys(self._pairs[bonded])
+
+        events = []
+        if self.graph is not None:
+            formed = np.setdiff1d(keys, self._keys)
+            broken = np.setdiff1d(self._keys, keys)
+            size = len(self.numbers)
+            for key, is_formed in sorted([(key, True) for key in formed] +
+                                         [(key, False) for key in broken]):
+                events.append(BondEvent(self.frame, int(key//size), int(key%size), is_formed))
+        if self.graph is None or len(events) > 0:
+            self.graph = MolecularGraph.from_arrays(
+                self._pairs[bonded], self.numbers, symbols=self.symbols
+            )
+        # The bonds are sorted by their keys, both in the graph and here, so
+        # the lengths are in the edge order even without a rebuild.
+        self.graph.bond_lengths = distances[bonded]
+        self._keys = keys
+        self.events.extend(events)
+        return events
+
+
 # basic criteria for molecular patterns
 
+def _get_neighbor_table(graph, count):
+    """Return the vertices with a given number of neighbors and their neighbors
+
+       Arguments:
+        | ``graph``  --  the graph whose vertices are selected
+        | ``count``  --  the number of neighbors
+
+       Returns an array with the selected vertices and an array with shape
+       (len(vertices), count) with the neighbors of each selected vertex.
+    """
+    indptr, indices = graph.csr
+    vertices = (np.diff(indptr) == count).nonzero()[0]
+    neighbors = indices[indptr[vertices, None] + np.arange(count)]
+    return vertices, neighbors
+
+
 class HasAtomNumber(object):
     """Criterion for the atom number of a vertex"""
 
@@ -357,6 +1023,10 @@ class HasAtomNumber(object):
         """
         return graph.numbers[index] == self.number
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`molmod.graphs.get_vertex_mask`"""
+        return graph.numbers == self.number
+
 
 class HasNumNeighbors(object):
     """Criterion for the number of neighboring vertexes"""
@@ -378,6 +1048,10 @@ class HasNumNeighbors(object):
         """
         return len(graph.neighbors[index]) == self.count
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`molmod.graphs.get_vertex_mask`"""
+        return np.diff(graph.csr[0]) == self.count
+
 
 class HasNeighborNumbers(object):
     """Criterion for the atom numbers of the neighbor vertexes"""
@@ -407,6 +1081,14 @@ class HasNeighborNumbers(object):
         neighbor_numbers = sorted([graph.numbers[neighbor] for neighbor in neighbors])
         return neighbor_numbers == self.numbers
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`molmod.graphs.get_vertex_mask`"""
+        vertices, neighbors = _get_neighbor_table(graph, len(self.numbers))
+        result = np.zeros(graph.num_vertices, bool)
+        neighbor_numbers = np.sort(graph.numbers[neighbors], axis=1)
+        result[vertices] = (neighbor_numbers == self.numbers).all(axis=1)
+        return result
+
 
 class HasNeighbors(object):
     """Tests if the neighbors of a vertex match the given criteria"""
@@ -452,6 +1134,24 @@ class HasNeighbors(object):
                 return True
         return False
 
+    def get_vertex_mask(self, graph):
+        """Vectorized version of the criterion, see :func:`molmod.graphs.get_vertex_mask`"""
+        from itertools import permutations
+        count = len(self.neighbor_criteria)
+        result = np.zeros(graph.num_vertices, bool)
+        if count == 0:
+            return result
+        vertices, neighbors = _get_neighbor_table(graph, count)
+        # ok[i, j, k] is True if neighbor j of vertex i satisfies criterion k
+        ok = np.array([
+            get_vertex_mask(criterion, graph)[neighbors]
+            for criterion in self.neighbor_criteria
+        ]).transpose(1, 2, 0)
+        columns = np.arange(count)
+        for permutation in permutations(columns):
+            result[vertices] |= ok[:, columns, permutation].all(axis=1)
+        return result
+
 
 class BondLongerThan(object):
     """A vertex criterion to select bonds longer than a given threshold"""
@@ -489,6 +1189,195 @@ def atom_criteria(*params):
     return result
 
 
+# rule-based atom typing
+
+
+class AtomTypeRule(object):
+    """A description of an atom type in terms of local features
+
+       All given conditions must be satisfied. The local features (atom
+       number, degree, neighbor atom numbers and ring membership) are compared
+       for all atoms at once by :class:`AtomTyper`. Conditions that depend on
+       a larger environment are given as a vertex criterion or as a pattern.
+    """
+
+    def __init__(self, number=None, degree=None, neighbor_numbers=None,
+                 in_ring=None, ring_size=None, criterion=None, pattern=None):
+        """
+           Optional arguments:
+            | ``number``  --  the atom number
+            | ``degree``  --  the number of neighbors
+            | ``neighbor_numbers``  --  the atom numbers of all neighbors, in
+                                        any order
+            | ``in_ring``  --  True for atoms in a ring, False for atoms that
+                               are not part of any ring
+            | ``ring_size``  --  the atom must be part of a relevant cycle with
+                                 this size, see :meth:`Graph.rings`
+            | ``criterion``  --  a vertex criterion, e.g.
+                                 ``HasNeighbors(...)``. See
+                                 :func:`molmod.graphs.get_vertex_mask`
+            | ``pattern``  --  a :class:`CustomPattern`. The atom must be
+                               the first vertex of some match of the pattern.
+                               This is the slowest option because it requires
+                               a graph search.
+        """
+        if neighbor_numbers is not None:
+            neighbor_numbers = tuple(sorted(neighbor_numbers))
+            if degree is not None and degree != len(neighbor_numbers):
+                raise ValueError("The degree does not match the number of neighbor numbers.")
+            degree = len(neighbor_numbers)
+        self.number = number
+        self.degree = degree
+        self.neighbor_numbers = neighbor_numbers
+        self.in_ring = in_ring
+        self.ring_size = ring_size
+        self.criterion = criterion
+        self.pattern = pattern
+
+
+class AtomTyper(object):
+    """Assign atom types to all atoms in a molecular graph in one pass
+
+       Example usage::
+
+           typer = AtomTyper([
+               ("cach3", AtomTypeRule(6, neighbor_numbers=(1, 1, 1, 6))),
+               ("cach2", AtomTypeRule(6, neighbor_numbers=(1, 1, 6, 6))),
+               ("h", AtomTypeRule(1)),
+           ])
+           print(typer.get_types(graph))
+
+       The rules are tested in the given order and the first matching rule
+       determines the type of an atom. The local features of all rules are
+       stored in arrays such that they can be compared with the features of
+       all atoms at once.
+    """
+
+    def __init__(self, rules):
+        """
+           Argument:
+            | ``rules``  --  a list of (label, AtomTypeRule) pairs
+        """
+        self.labels = [label for label, rule in rules]
+        self.rules = [rule for label, rule in rules]
+        # the scalar features of the rules, -1 in case of a wildcard
+        def get_column(name, convert=int):
+            return np.array([
+                -1 if getattr(rule, name) is None else convert(getattr(rule, name))
+                for rule in self.rules
+            ], int)
+        self._rule_numbers = get_column("number")
+        self._rule_degrees = get_column("degree")
+        self._rule_in_ring = get_column("in_ring", bool)
+        self._rule_signatures = sorted(set(
+            rule.neighbor_numbers for rule in self.rules
+            if rule.neighbor_numbers is not None
+        ))
+
+    def _get_signature_ids(self, graph):
+        """Index in self._rule_signatures of the sorted neighbor numbers of each atom, -1 if absent"""
+        result = -np.ones(graph.num_vertices, int)
+        lookup = dict((signature, index) for index, signature in enumerate(self._rule_signatures))
+        for degree in set(len(signature) for signature in self._rule_signatures):
+            vertices, neighbors = _get_neighbor_table(graph, degree)
+            if len(vertices) == 0 or degree == 0:
+                result[vertices] = lookup.get((), -1)
+                continue
+            rows, inverse = np.unique(
+                np.sort(graph.numbers[neighbors], axis=1).reshape((len(vertices), degree)),
+                axis=0, return_inverse=True
+            )
+            row_ids = np.array([lookup.get(tuple(row), -1) for row in rows.tolist()], int)
+            result[vertices] = row_ids[inverse.ravel()]
+        return result
+
+    def get_rule_masks(self, graph):
+        """Return a boolean array with the atoms that satisfy each rule
+
+           Argument:
+            | ``graph``  --  a MolecularGraph instance
+
+           The result has shape (num_vertices, num_rules).
+        """
+        def compare(features, rule_features):
+            return (features[:, None] == rule_features) | (rule_features == -1)
+
+        result = compare(graph.numbers, self._rule_numbers)
+        result &= compare(np.diff(graph.csr[0]), self._rule_degrees)
+        if (self._rule_in_ring != -1).any():
+            # an atom is in a ring when it takes part in an edge that is no bridge
+            cyclic = np.ones(graph.num_edges, bool)
+            cyclic[graph.bridges] = False
+            in_ring = np.zeros(graph.num_vertices, bool)
+            in_ring[graph.edge_array[cyclic].ravel()] = True
+            result &= compare(in_ring.astype(int), self._rule_in_ring)
+        if len(self._rule_signatures) > 0:
+            signature_ids = self._get_signature_ids(graph)
+            rule_ids = np.array([
+                -1 if rule.neighbor_numbers is None else
+                self._rule_signatures.index(rule.neighbor_numbers)
+                for rule in self.rules
+            ], int)
+            result &= compare(signature_ids, rule_ids)
+
+        # conditions that are evaluated per rule, only for the remaining atoms
+        ring_masks = {}
+        for index, rule in enumerate(self.rules):
+            if not result[:, index].any():
+                continue
+            if rule.ring_size is not None:
+                mask = ring_masks.get(rule.ring_size)
+                if mask is None:
+                    rings = [ring for ring in graph.rings(rule.ring_size) if len(ring) == rule.ring_size]
+                    mask = graph.get_ring_membership(rings).any(axis=0)
+                    ring_masks[rule.ring_size] = mask
+                result[:, index] &= mask
+            if rule.criterion is not None and result[:, index].any():
+                result[:, index] &= get_vertex_mask(rule.criterion, graph)
+            if rule.pattern is not None and result[:, index].any():
+                mask = np.zeros(graph.num_vertices, bool)
+                pattern_graph = rule.pattern.pattern_graph
+                criteria_sets = rule.pattern.criteria_sets
+                for match in GraphSearch(rule.pattern)(graph):
+                    # only one of the symmetrically equivalent matches is
+                    # yielded, so also the images of vertex 0 are marked.
+                    for symmetry in pattern_graph.symmetries:
+                        image = match*symmetry
+                        if criteria_sets is None or any(
+                            criteria_set.test_match(image, pattern_graph, graph)
+                            for criteria_set in criteria_sets
+                        ):
+                            mask[image.forward[0]] = True
+                result[:, index] &= mask
+        return result
+
+    def get_type_indexes(self, graph):
+        """Return the index of the first matching rule for each atom
+
+           Argument:
+            | ``graph``  --  a MolecularGraph instance
+
+           Atoms that do not match any rule get index -1.
+        """
+        masks = self.get_rule_masks(graph)
+        result = masks.argmax(axis=1)
+        result[~masks.any(axis=1)] = -1
+        return result
+
+    def get_types(self, graph):
+        """Return a list with the label of the atom type of each atom
+
+           Argument:
+            | ``graph``  --  a MolecularGraph instance
+
+           Atoms that do not match any rule get the label None.
+        """
+        return [
+            None if index == -1 else self.labels[index]
+            for index in self.get_type_indexes(graph)
+        ]
+
+
 # common patterns for molecular structures
 
 
@@ -33,11 +33,160 @@ from molmod.units import angstrom
 from molmod.utils import cached, ReadOnly, ReadOnlyAttribute
 from molmod.molecular_graphs import MolecularGraph
 from molmod.unit_cells import UnitCell
-from molmod.transformations import fit_rmsd
+from molmod.binning import get_pair_arrays
+from molmod.transformations import fit_rmsd, rmsd_matrix
 from molmod.symmetry import compute_rotsym
 
 
-__all__ = ["Molecule"]
+__all__ = [
+    "Molecule", "Frames", "compute_com", "compute_inertia_tensor",
+    "compute_principal_moments", "compute_radius_of_gyration",
+    "iter_distance_blocks", "compute_distances_condensed",
+    "compute_distances_sparse",
+]
+
+
+def compute_com(coordinates, masses):
+    """Compute the center of mass of one or more geometries
+
+       Arguments:
+        | ``coordinates``  --  an array with shape (natom, 3) or with shape
+                               (nframes, natom, 3)
+        | ``masses``  --  the atomic masses, shape (natom,)
+
+       The result has shape (3,) or (nframes, 3).
+    """
+    return np.einsum("...ij,i->...j", coordinates, masses)/masses.sum()
+
+
+def compute_inertia_tensor(coordinates, masses):
+    """Compute the inertia tensor of one or more geometries
+
+       Arguments: see :func:`compute_com`
+
+       The inertia tensor is computed with respect to the center of mass. The
+       result has shape (3, 3) or (nframes, 3, 3).
+    """
+    relative = coordinates - compute_com(coordinates, masses)[..., None, :]
+    result = -np.einsum("i,...ij,...ik->...jk", masses, relative, relative)
+    diagonal = np.einsum("i,...ij,...ij->...", masses, relative, relative)
+    result += diagonal[..., None, None]*np.identity(3)
+    return result
+
+
+def compute_principal_moments(coordinates, masses):
+    """Compute the principal moments of inertia of one or more geometries
+
+       Arguments: see :func:`compute_com`
+
+       The result contains the eigenvalues of the inertia tensor in
+       ascending order and has shape (3,) or (nframes, 3).
+    """
+    return np.linalg.eigvalsh(compute_inertia_tensor(coordinates, masses))
+
+
+def compute_radius_of_gyration(coordinates, masses):
+    """Compute the radius of gyration of one or more geometries
+
+       Arguments: see :func:`compute_com`
+
+       This is the root of the mass-weighted mean square distance from the
+       center of mass. The result is a scalar or has shape (nframes,).
+    """
+    relative = coordinates - compute_com(coordinates, masses)[..., None, :]
+    return np.sqrt(np.einsum("i,...ij,...ij->...", masses, relative, relative)/masses.sum())
+
+
+def iter_distance_blocks(coordinates, block_size=512, dtype=float, unit_cell=None):
+    """Iterate over tiles of the distance matrix
+
+       Arguments:
+        | ``coordinates``  --  a Nx3 numpy array with Cartesian coordinates
+
+       Optional arguments:
+        | ``block_size``  --  the maximum number of rows and columns in a tile
+        | ``dtype``  --  the data type of the tiles, e.g. np.float32
+        | ``unit_cell``  --  when given, the minimum image convention is used
+
+       Only the tiles on and below the diagonal are generated, the others
+       follow from the symmetry of the distance matrix. Each iteration yields
+       a tuple ``(begin0, begin1, tile)`` where the tile contains the
+       distances between the atoms ``begin0:begin0+len(tile)`` and the atoms
+       ``begin1:begin1+tile.shape[1]``. The memory usage is bounded by the
+       block size, not by the number of atoms.
+    """
+    natom = len(coordinates)
+    for begin0 in range(0, natom, block_size):
+        coords0 = coordinates[begin0:begin0+block_size]
+        for begin1 in range(0, begin0+1, block_size):
+            coords1 = coordinates[begin1:begin1+block_size]
+            deltas = coords0[:, None, :] - coords1[None, :, :]
+            if unit_cell is not None:
+                deltas = unit_cell.shortest_vector(deltas)
+            yield begin0, begin1, np.sqrt((deltas**2).sum(axis=2)).astype(dtype)
+
+
+def compute_distances_condensed(coordinates, dtype=float, unit_cell=None, block_size=512):
+    """Compute all atom pair distances in a condensed form
+
+       Arguments:
+        | ``coordinates``  --  a Nx3 numpy array with Cartesian coordinates
+
+       Optional arguments:
+        | ``dtype``  --  the data type of the result, e.g. np.float32
+        | ``unit_cell``  --  when given, the minimum image convention is used
+        | ``block_size``  --  the tile size used internally, see
+                              :func:`iter_distance_blocks`
+
+       The result is a one-dimensional array with N*(N-1)/2 elements. The
+       distance between atoms i and j, with i > j, is stored at position
+       ``i*(i-1)/2 + j``. This is the same order as in the similarity tables
+       and in :func:`molmod.binning.get_pair_arrays`.
+    """
+    natom = len(coordinates)
+    result = np.zeros(natom*(natom-1)//2, dtype)
+    for begin0, begin1, tile in iter_distance_blocks(coordinates, block_size, dtype, unit_cell):
+        rows = np.arange(begin0, begin0+tile.shape[0])
+        cols = np.arange(begin1, begin1+tile.shape[1])
+        if begin0 == begin1:
+            # only the part below the diagonal
+            i0, i1 = np.tril_indices(len(rows), -1)
+            result[rows[i0]*(rows[i0]-1)//2 + cols[i1]] = tile[i0, i1]
+        else:
+            result[(rows*(rows-1)//2)[:, None] + cols] = tile
+    return result
+
+
+def compute_distances_sparse(coordinates, cutoff, dtype=float, unit_cell=None):
+    """Compute the atom pair distances below a cutoff in a sparse form
+
+       Arguments:
+        | ``coordinates``  --  a Nx3 numpy array with Cartesian coordinates
+        | ``cutoff``  --  only distances below this cutoff are included
+
+       Optional arguments:
+        | ``dtype``  --  the data type of the distances, e.g. np.float32
+        | ``unit_cell``  --  when given, the minimum image convention is used
+
+       The result is a tuple ``(indptr, indices, distances)`` in compressed
+       sparse row format, similar to :attr:`molmod.graphs.Graph.csr`. The
+       (sorted) neighbors of atom ``i`` are ``indices[indptr[i]:indptr[i+1]]``
+       and the corresponding distances are
+       ``distances[indptr[i]:indptr[i+1]]``. Both triangles of the symmetric
+       matrix are included. The pairs are found with
+       :func:`molmod.binning.get_pair_arrays`, such that the cost scales
+       linearly with the number of atoms.
+    """
+    natom = len(coordinates)
+    indexes0, indexes1, deltas, distances = get_pair_arrays(coordinates, cutoff, unit_cell)
+    rows = np.concatenate([indexes0, indexes1])
+    cols = np.concatenate([indexes1, indexes0])
+    order = np.lexsort([cols, rows])
+    indptr = np.zeros(natom+1, np.int32)
+    np.cumsum(np.bincount(rows, minlength=natom), out=indptr[1:])
+    indices = cols[order].astype(np.int32)
+    distances = np.concatenate([distances, distances])[order].astype(dtype)
+    return indptr, indices, distances
 
 
 class Molecule(ReadOnly):
@@ -161,7 +310,12 @@ class Molecule(ReadOnly):
 
     @cached
     def distance_matrix(self):
-        """the matrix with all atom pair distances"""
+        """the matrix with all atom pair distances
+
+           This dense matrix is kept in memory as long as the molecule
+           exists. For large systems, consider :meth:`get_distances_condensed`,
+           :meth:`iter_distance_blocks` or :meth:`get_distances_sparse`.
+        """
         from molmod.ext import molecules_distance_matrix
         return molecules_distance_matrix(self.coordinates)
 
@@ -173,19 +327,62 @@ class Molecule(ReadOnly):
     @cached
     def com(self):
         """the center of mass of the molecule"""
-        return (self.coordinates*self.masses.reshape((-1,1))).sum(axis=0)/self.mass
+        return compute_com(self.coordinates, self.masses)
 
     @cached
     def inertia_tensor(self):
         """the intertia tensor of the molecule"""
-        result = np.zeros((3,3), float)
-        for i in range(self.size):
-            r = self.coordinates[i] - self.com
-            # the diagonal term
-            result.ravel()[::4] += self.masses[i]*(r**2).sum()
-            # the outer product term
-            result -= self.masses[i]*np.outer(r,r)
-        return result
+        return compute_inertia_tensor(self.coordinates, self.masses)
+
+    @cached
+    def principal_moments(self):
+        """the principal moments of inertia in ascending order"""
+        return np.linalg.eigvalsh(self.inertia_tensor)
+
+    @cached
+    def radius_of_gyration(self):
+        """the mass-weighted radius of gyration"""
+        return compute_radius_of_gyration(self.coordinates, self.masses)
+
+    def get_distances_condensed(self, dtype=float):
+        """Return all atom pair distances in condensed form
+
+           Optional argument:
+            | ``dtype``  --  the data type of the result, e.g. np.float32
+
+           See :func:`compute_distances_condensed` for the layout of the
+           result. Just like :attr:`distance_matrix`, periodic boundary
+           conditions are not taken into account and, unlike
+           :attr:`distance_matrix`, the result is not cached.
+        """
+        return compute_distances_condensed(self.coordinates, dtype)
+
+    def iter_distance_blocks(self, block_size=512, dtype=float):
+        """Iterate over tiles of the distance matrix
+
+           Optional arguments:
+            | ``block_size``  --  the maximum number of rows and columns in a
+                                  tile
+            | ``dtype``  --  the data type of the tiles, e.g. np.float32
+
+           See :func:`iter_distance_blocks` for more details. Periodic
+           boundary conditions are not taken into account.
+        """
+        return iter_distance_blocks(self.coordinates, block_size, dtype)
+
+    def get_distances_sparse(self, cutoff, dtype=float):
+        """Return the atom pair distances below a cutoff in CSR format
+
+           Argument:
+            | ``cutoff``  --  only distances below this cutoff are included
+
+           Optional argument:
+            | ``dtype``  --  the data type of the distances, e.g. np.float32
+
+           See :func:`compute_distances_sparse` for more details. Periodic
+           boundary conditions are not taken into account.
+        """
+        return compute_distances_sparse(self.coordinates, cutoff, dtype)
 
     @cached
     def chemical_formula(self):
@@ -290,3 +487,251 @@ class Molecule(ReadOnly):
             return compute_rotsym(self, graph, threshold)
         except ValueError:
             raise ValueError("The rotational symmetry number can only be computed when the graph is fully connected.")
+
+
+class Frames(ReadOnly):
+    """A sequence of geometries of the same molecular system
+
+       All properties that do not depend on the geometry, e.g. the atom
+       numbers, masses and the molecular graph, are stored only once. The
+       coordinates of all frames are stored in one array with shape (nframes,
+       natom, 3), which may also be a memory-mapped array, e.g. from
+       :meth:`from_npy`. Derived quantities are computed for all frames at once,
+       in chunks of ``chunk_size`` frames to keep the memory usage under
+       control.
+
+       Individual frames are only turned into Molecule objects when they are
+       accessed::
+
+           >>> frames = Frames.from_npy("traj.npy", numbers)
+           >>> frames.set_default_masses()
+           >>> print(frames.com[10])
+           >>> molecule = frames[10]
+    """
+    chunk_size = 1024
+
+    def _check_coordinates(self, coordinates):
+        """the second dimension must be the same as the length of the array numbers"""
+        if coordinates.shape[1] != self.size:
+            raise TypeError("The number of atoms in the coordinates does not "
+                "match the length of the atomic numbers array.")
+
+    def _check_masses(self, masses):
+        """the size must be the same as the length of the array numbers"""
+        if len(masses) != self.size:
+            raise TypeError("The number of masses does not match the length of "
+                "the atomic numbers array.")
+
+    def _check_graph(self, graph):
+        """the atomic numbers must match"""
+        if graph.num_vertices != self.size:
+            raise TypeError("The number of vertices in the graph does not "
+                "match the length of the atomic numbers array.")
+        if (self.numbers != graph.numbers).any():
+            raise TypeError("The atomic numbers in the graph do not match the "
+                "atomic numbers in the frames.")
+
+    def _check_symbols(self, symbols):
+        """the size must be the same as the length of the array numbers"""
+        if len(symbols) != self.size:
+            raise TypeError("The number of symbols does not match the length "
+                "of the atomic numbers array.")
+
+    def _check_titles(self, titles):
+        """the size must be the same as the number of frames"""
+        if len(titles) != len(self.coordinates):
+            raise TypeError("The number of titles does not match the number "
+                "of frames.")
+
+    numbers = ReadOnlyAttribute(np.ndarray, none=False, npdim=1, npdtype=int,
+        doc="the atomic numbers")
+    coordinates = ReadOnlyAttribute(np.ndarray, none=False, npdim=3,
+        npshape=(None, None, 3), npdtype=float, check=_check_coordinates,
+        doc="atomic Cartesian coordinates of all frames")
+    titles = ReadOnlyAttribute(tuple, check=_check_titles, doc="a title for each "
+        "frame")
+    masses = ReadOnlyAttribute(np.ndarray, npdim=1, npdtype=float,
+        check=_check_masses, doc="the atomic masses")
+    graph = ReadOnlyAttribute(MolecularGraph, check=_check_graph,
+        doc="the molecular graph with the atom connectivity")
+    symbols = ReadOnlyAttribute(tuple, check=_check_symbols, doc="symbols for the "
+        "atoms, which can be element names for force-field atom types")
+    unit_cell = ReadOnlyAttribute(UnitCell, doc="description of the periodic "
+        "boundary conditions")
+
+    def __init__(self, numbers, coordinates, titles=None, masses=None, graph=None, symbols=None, unit_cell=None):
+        """
+           Mandatory arguments:
+            | ``numbers``  --  numpy array (1D, N elements) with the atomic numbers
+            | ``coordinates``  --  numpy array (3D, MxNx3 elements) with the
+                                   Cartesian coordinates of M frames
+
+           Optional keyword arguments:
+            | ``titles``  --  a title for each frame
+            | ``masses``  --  a numpy array with atomic masses in atomic units
+            | ``graph``  --  a MolecularGraph instance
+            | ``symbols``  --  atomic elements or force-field atom-types
+            | ``unit_cell``  --  the unit cell in case the system is periodic
+        """
+        self.numbers = numbers
+        self.coordinates = coordinates
+        self.titles = titles
+        self.masses = masses
+        self.graph = graph
+        self.symbols = symbols
+        self.unit_cell = unit_cell
+
+    @classmethod
+    def from_molecules(cls, molecules):
+        """Construct a Frames object from a list of molecules
+
+           Argument:
+            | ``molecules``  --  a list of Molecule objects with the same atoms
+
+           All other attributes are taken from the first molecule.
+        """
+        first = molecules[0]
+        for molecule in molecules[1:]:
+            if molecule.numbers.shape != first.numbers.shape or \
+               (molecule.numbers != first.numbers).any():
+                raise ValueError("All molecules must have the same atom numbers.")
+        coordinates = np.array([molecule.coordinates for molecule in molecules])
+        titles = [molecule.title for molecule in molecules]
+        if None in titles:
+            titles = None
+        return cls(first.numbers, coordinates, titles, first.masses,
+                   first.graph, first.symbols, first.unit_cell)
+
+    @classmethod
+    def from_npy(cls, filename, numbers, mmap_mode="r", **kwargs):
+        """Construct a Frames object with coordinates from a ``*.npy`` file
+
+           Arguments:
+            | ``filename``  --  a file with an array with shape (nframes, natom,
+                                3), e.g. written with :meth:`save_npy`
+            | ``numbers``  --  the atomic numbers
+
+           Optional arguments:
+            | ``mmap_mode``  --  the mmap_mode argument of ``numpy.load``. By
+                                 default the file is memory-mapped read-only.
+                                 Use None to load the file into memory.
+
+           Only files with float64 coordinates can be memory-mapped, because
+           any other dtype would be converted into a copy in memory. A
+           TypeError is raised for other files, unless mmap_mode is None.
+
+           All other keyword arguments are passed to the constructor.
+        """
+        coordinates = np.load(filename, mmap_mode=mmap_mode)
+        if mmap_mode is not None and coordinates.dtype != np.float64:
+            raise TypeError("Only float64 coordinates can be memory-mapped, got "
+                "%s. Use mmap_mode=None to load the file into memory." %
+                coordinates.dtype)
+        return cls(numbers, coordinates, **kwargs)
+
+    def save_npy(self, filename):
+        """Write the coordinates to a ``*.npy`` file, see :meth:`from_npy`"""
+        np.save(filename, self.coordinates)
+
+    size = property(lambda self: self.numbers.shape[0],
+        doc="*Read-only attribute:* the number of atoms.")
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def __getitem__(self, index):
+        """Return a Molecule for a single frame or Frames for a slice"""
+        if isinstance(index, slice):
+            return self.copy_with(
+                coordinates=self.coordinates[index],
+                titles=None if self.titles is None else self.titles[index],
+            )
+        return Molecule(
+            self.numbers, self.coordinates[index],
+            None if self.titles is None else self.titles[index],
+            self.masses, self.graph, self.symbols, self.unit_cell
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _apply_chunked(self, function, shape):
+        """Apply a function to all chunks of coordinates, returns the stacked results"""
+        result = np.zeros((len(self),) + shape, float)
+        for begin in range(0, len(self), self.chunk_size):
+            end = begin + self.chunk_size
+            result[begin:end] = function(np.asarray(self.coordinates[begin:end]))
+        return result
+
+    @cached
+    def mass(self):
+        """the total mass of the system"""
+        return self.masses.sum()
+
+    @cached
+    def com(self):
+        """the center of mass of each frame, shape (nframes, 3)"""
+        return self._apply_chunked(lambda c: compute_com(c, self.masses), (3,))
+
+    @cached
+    def inertia_tensor(self):
+        """the inertia tensor of each frame, shape (nframes, 3, 3)"""
+        return self._apply_chunked(lambda c: compute_inertia_tensor(c, self.masses), (3, 3))
+
+    @cached
+    def principal_moments(self):
+        """the principal moments of inertia of each frame, shape (nframes, 3)"""
+        return np.linalg.eigvalsh(self.inertia_tensor)
+
+    @cached
+    def radius_of_gyration(self):
+        """the radius of gyration of each frame, shape (nframes,)"""
+        return self._apply_chunked(lambda c: compute_radius_of_gyration(c, self.masses), ())
+
+    def get_distance_matrix(self, index):
+        """Return the matrix with all atom pair distances of one frame
+
+           Argument:
+            | ``index``  --  the index of the frame
+        """
+        from molmod.ext import molecules_distance_matrix
+        return molecules_distance_matrix(np.ascontiguousarray(self.coordinates[index]))
+
+    def get_distances(self, pairs):
+        """Return the distances between selected pairs of atoms in all frames
+
+           Argument:
+            | ``pairs``  --  an integer array with shape (npairs, 2)
+
+           The result has shape (nframes, npairs). Just like
+           :attr:`Molecule.distance_matrix`, periodic boundary conditions are
+           not taken into account.
+        """
+        pairs = np.asarray(pairs, int).reshape((-1, 2))
+        def function(coordinates):
+            deltas = coordinates[:, pairs[:, 0]] - coordinates[:, pairs[:, 1]]
+            return np.sqrt((deltas**2).sum(axis=2))
+        return self._apply_chunked(function, (len(pairs),))
+
+    def get_rmsd_matrix(self, weights=None, nthreads=1, threshold=None):
+        """Return the minimal RMSD between all pairs of frames
+
+           Optional arguments:
+            | ``weights``  --  fitting weights for each atom, shape=(natom,)
+            | ``nthreads``  --  the number of threads
+            | ``threshold``  --  skip pairs whose rmsd certainly exceeds this
+                                 threshold
+
+           The result is a condensed matrix, see
+           :func:`molmod.transformations.rmsd_matrix` for more details.
+        """
+        return rmsd_matrix(np.asarray(self.coordinates), weights, nthreads, threshold)
+
+    def set_default_masses(self):
+        """Set self.masses based on self.numbers and periodic table."""
+        self.masses = np.array([periodic[n].mass for n in self.numbers])
+
+    def set_default_symbols(self):
+        """Set self.symbols based on self.numbers and the periodic table."""
+        self.symbols = tuple(periodic[n].symbol for n in self.numbers)
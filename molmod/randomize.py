@@ -31,6 +31,7 @@ import copy
 
 import numpy as np
 
+from molmod.binning import get_pair_arrays
 from molmod.molecules import Molecule
 from molmod.graphs import GraphError
 from molmod.transformations import Translation, Complete
@@ -204,13 +205,8 @@ class RandomDoubleStretch(RandomManipulation):
 
 def iter_halfs_bond(graph):
     """Select a random bond (pair of atoms) that divides the molecule in two"""
-    for atom1, atom2 in graph.edges:
-        try:
-            affected_atoms1, affected_atoms2 = graph.get_halfs(atom1, atom2)
-            yield affected_atoms1, affected_atoms2, (atom1, atom2)
-        except GraphError:
-            # just try again
-            continue
+    for affected_atoms1, affected_atoms2, hinge_atoms in graph.iter_single_cuts():
+        yield affected_atoms1, affected_atoms2, hinge_atoms
 
 
 def iter_halfs_bend(graph):
@@ -236,14 +232,8 @@ def iter_halfs_bend(graph):
 
 def iter_halfs_double(graph):
     """Select two random non-consecutive bonds that divide the molecule in two"""
-    edges = graph.edges
-    for index1, (atom_a1, atom_b1) in enumerate(edges):
-        for atom_a2, atom_b2 in edges[:index1]:
-            try:
-                affected_atoms1, affected_atoms2, hinge_atoms = graph.get_halfs_double(atom_a1, atom_b1, atom_a2, atom_b2)
-                yield affected_atoms1, affected_atoms2, hinge_atoms
-            except GraphError:
-                pass
+    for affected_atoms1, affected_atoms2, hinge_atoms in graph.iter_double_cuts():
+        yield affected_atoms1, affected_atoms2, hinge_atoms
 
 
 
@@ -340,13 +330,24 @@ def check_nonbond(molecule, thresholds):
        a coarse guess of a proper threshold value.
     """
 
-    # check that no atoms overlap
-    for atom1 in range(molecule.graph.num_vertices):
-        for atom2 in range(atom1):
-            if molecule.graph.distances[atom1, atom2] > 2:
-                distance = np.linalg.norm(molecule.coordinates[atom1] - molecule.coordinates[atom2])
-                if distance < thresholds[frozenset([molecule.numbers[atom1], molecule.numbers[atom2]])]:
-                    return False
+    # check that no atoms overlap. Atoms that are at most two bonds apart, or
+    # that are not connected at all, are not considered. Only the pairs within
+    # the largest threshold are looked at.
+    if len(thresholds) == 0:
+        return True
+    graph = molecule.graph
+    atoms1, atoms2, deltas, distances = get_pair_arrays(
+        molecule.coordinates, max(thresholds.values())
+    )
+    labels = graph.component_labels
+    mask = labels[atoms1] == labels[atoms2]
+    excluded = graph.distances_within(2)[0]
+    excluded = excluded[:, 0]*graph.num_vertices + excluded[:, 1]
+    mask &= ~np.in1d(atoms2*graph.num_vertices + atoms1, excluded)
+    numbers = molecule.numbers
+    for atom1, atom2, distance in zip(atoms1[mask], atoms2[mask], distances[mask]):
+        if distance < thresholds[frozenset([numbers[atom1], numbers[atom2]])]:
+            return False
     return True
 
 
@@ -35,6 +35,9 @@ a1 = SimilarityDescriptor.from_molecule(molecule)
 a1 = SimilarityDescriptor.from_molecular_graph(molecular_graph)
 a1 = SimilarityDescriptor.from_coordinates(coordinates, labels)
 a1 = SimilarityDescriptor(distance_matrix, labels)
+
+For large molecules, a cutoff can be given to from_molecule and
+from_coordinates, such that only short distances are stored.
 """
 
 
@@ -56,19 +59,37 @@ class SimilarityDescriptor(object):
 
            Arguments:
              distance_matrix  --  a matrix with interatomic distances, this can
-                                  also be distances in a graph
+                                  also be distances in a graph. Besides a
+                                  square matrix, a condensed matrix (see
+                                  compute_distances_condensed) or a sparse
+                                  tuple (indptr, indices, distances) (see
+                                  compute_distances_sparse) is also accepted.
              labels  --  a list with integer labels used to identify atoms of
                          the same type
         """
-        self.table_distances = similarity_table_distances(distance_matrix.astype(float))
-        self.table_labels = similarity_table_labels(labels.astype(int))
-        print(len(labels), len(distance_matrix))
+        labels = np.asarray(labels)
+        if isinstance(distance_matrix, tuple):
+            # Sparse matrix, only the pairs below the cutoff are included.
+            indptr, indices, distances = distance_matrix
+            rows = np.repeat(np.arange(len(indptr)-1), np.diff(indptr))
+            mask = indices < rows
+            self.table_distances = distances[mask].astype(float)
+            self.table_labels = np.array([labels[rows[mask]], labels[indices[mask]]], int).T
+        elif distance_matrix.ndim == 1:
+            # Condensed matrix, same order as the labels table.
+            if len(distance_matrix) != len(labels)*(len(labels)-1)//2:
+                raise TypeError("The condensed distance matrix does not match the number of labels.")
+            self.table_distances = distance_matrix.astype(float)
+            self.table_labels = similarity_table_labels(labels.astype(int))
+        else:
+            self.table_distances = similarity_table_distances(distance_matrix.astype(float))
+            self.table_labels = similarity_table_labels(labels.astype(int))
         order = np.lexsort([self.table_labels[:, 1], self.table_labels[:, 0]])
-        self.table_labels = self.table_labels[order]
+        self.table_labels = np.ascontiguousarray(self.table_labels[order])
         self.table_distances = self.table_distances[order]
 
     @classmethod
-    def from_molecule(cls, molecule, labels=None):
+    def from_molecule(cls, molecule, labels=None, cutoff=None):
         """Initialize a similarity descriptor
 
            Arguments:
@@ -76,10 +97,17 @@ class SimilarityDescriptor(object):
              labels  --  a list with integer labels used to identify atoms of
                          the same type. When not given, the atom numbers from
                          the molecule are used.
+             cutoff  --  when given, only distances below the cutoff are
+                         included. compute_similarity gives the same result as
+                         without a cutoff when this cutoff is at least the
+                         cutoff plus the margin of compute_similarity.
         """
         if labels is None:
             labels = molecule.numbers
-        return cls(molecule.distance_matrix, labels)
+        if cutoff is None:
+            return cls(molecule.get_distances_condensed(), labels)
+        else:
+            return cls(molecule.get_distances_sparse(cutoff), labels)
 
     @classmethod
     def from_molecular_graph(cls, molecular_graph, labels=None):
@@ -96,17 +124,22 @@ class SimilarityDescriptor(object):
         return cls(molecular_graph.distances, labels)
 
     @classmethod
-    def from_coordinates(cls, coordinates, labels):
+    def from_coordinates(cls, coordinates, labels, cutoff=None):
         """Initialize a similarity descriptor
 
            Arguments:
              coordinates  --  a Nx3 numpy array
              labels  --  a list with integer labels used to identify atoms of
                          the same type
+             cutoff  --  when given, only distances below the cutoff are
+                         included, see from_molecule
         """
-        from molmod.ext import molecules_distance_matrix
-        distance_matrix = molecules_distance_matrix(coordinates)
-        return cls(distance_matrix, labels)
+        from molmod.molecules import compute_distances_condensed, \
+            compute_distances_sparse
+        if cutoff is None:
+            return cls(compute_distances_condensed(coordinates), labels)
+        else:
+            return cls(compute_distances_sparse(coordinates, cutoff), labels)
 
 
 def compute_similarity(a, b, margin=1.0, cutoff=10.0):
@@ -23,6 +23,8 @@
 """Tools to analyze the symmetry of molecules"""
 
 
+import numpy as np
+
 from molmod.units import angstrom
 from molmod.transformations import fit_rmsd
 
@@ -41,12 +43,32 @@ def compute_rotsym(molecule, graph, threshold=1e-3*angstrom):
         | ``threshold``  --  only when a rotation results in an rmsd below the
                              given threshold, the rotation is considered to
                              transform the molecule onto itself.
+
+       The symmetries of the graph are generated from its stabilizer chain,
+       see :meth:`molmod.graphs.Graph.iter_symmetry_permutations`. Partial
+       permutations that do not preserve the interatomic distances within the
+       tolerance implied by the threshold are pruned, such that the (possibly
+       huge) group of graph symmetries is never enumerated completely.
     """
+    coordinates = molecule.coordinates
+    # The rmsd is the root mean square over all 3*size Cartesian components
+    # (see compute_rmsd). When it is below the threshold, no atom deviates
+    # more than sqrt(3*size)*threshold from its image and no distance changes
+    # more than twice that amount.
+    tolerance = 2*np.sqrt(3*molecule.size)*threshold
+
+    def accept(vertices, images):
+        """Check the distances of the last vertex to the other vertices"""
+        deltas = coordinates[vertices[:-1]] - coordinates[vertices[-1]]
+        image_deltas = coordinates[images[:-1]] - coordinates[images[-1]]
+        distances = np.sqrt((deltas**2).sum(axis=1))
+        image_distances = np.sqrt((image_deltas**2).sum(axis=1))
+        return (abs(distances - image_distances) < tolerance).all()
+
     result = 0
-    for match in graph.symmetries:
-        permutation = list(j for i,j in sorted(match.forward.items()))
-        new_coordinates = molecule.coordinates[permutation]
-        rmsd = fit_rmsd(molecule.coordinates, new_coordinates)[2]
+    for permutation in graph.iter_symmetry_permutations(accept):
+        new_coordinates = coordinates[permutation]
+        rmsd = fit_rmsd(coordinates, new_coordinates)[2]
         if rmsd < threshold:
             result += 1
     return result
@@ -219,3 +219,43 @@ class BinningTestCase(unittest.TestCase):
                 in pair_search
             ]
             self.verify_distances_inter(coordinates0, coordinates1, cutoff, distances, unit_cell)
+
+    def verify_pair_arrays(self, coordinates, cutoff, unit_cell=None):
+        indexes0, indexes1, deltas, distances = get_pair_arrays(coordinates, cutoff, unit_cell)
+        self.assertTrue((indexes0 > indexes1).all())
+        expected = {}
+        for index0, coord0 in enumerate(coordinates):
+            for index1, coord1 in enumerate(coordinates[:index0]):
+                delta = coord1 - coord0
+                if unit_cell is not None:
+                    delta = unit_cell.shortest_vector(delta)
+                if np.linalg.norm(delta) <= cutoff:
+                    expected[(index0, index1)] = delta
+        self.assertEqual(sorted(expected), list(zip(indexes0.tolist(), indexes1.tolist())))
+        for index0, index1, delta, distance in zip(indexes0, indexes1, deltas, distances):
+            self.assertTrue(abs(delta - expected[(index0, index1)]).max() < 1e-10)
+            self.assertAlmostEqual(distance, np.linalg.norm(delta))
+
+    def test_pair_arrays_lau(self):
+        coordinates = XYZFile(pkg_resources.resource_filename(__name__, "../data/test/lau.xyz")).geometries[0]
+        cutoff = periodic.max_radius*2
+        unit_cell = UnitCell.from_parameters3(
+            np.array([14.59, 12.88, 7.61])*angstrom,
+            np.array([ 90.0, 111.0, 90.0])*deg,
+        )
+        self.verify_pair_arrays(coordinates, cutoff)
+        self.verify_pair_arrays(coordinates, cutoff, unit_cell)
+
+    def test_pair_arrays_random(self):
+        for i in range(10):
+            coordinates = np.random.uniform(0,5,(20,3))
+            cutoff = np.random.uniform(1, 6)
+            self.verify_pair_arrays(coordinates, cutoff)
+
+    def test_pair_arrays_random_periodic(self):
+        for i in range(10):
+            coordinates = np.random.uniform(0,1,(20,3))
+            unit_cell = get_random_uc(5.0, np.random.randint(0, 4), 0.5)
+            coordinates = unit_cell.to_cartesian(coordinates)*3-unit_cell.matrix.sum(axis=1)
+            cutoff = np.random.uniform(1, 6)
+            self.verify_pair_arrays(coordinates, cutoff, unit_cell)
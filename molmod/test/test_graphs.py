@@ -26,6 +26,8 @@ from __future__ import print_function
 
 from builtins import range
 import copy
+import pickle
+import time
 import unittest
 
 import pkg_resources
@@ -297,6 +299,38 @@ class GraphTestCase(unittest.TestCase):
         self.assertEqual(expecting.shape,graph.distances.shape)
         self.assert_((expecting==graph.distances).all())
 
+    def test_distances_from(self):
+        for case in self.iter_cases(disconnected=True):
+            g = case.graph
+            for i in range(g.num_vertices):
+                row = g.distances_from(i)
+                self.assert_((row == g.distances[i]).all())
+            # also without the dense matrix
+            g = Graph(g.edges, g.num_vertices)
+            for i in range(g.num_vertices):
+                row = g.distances_from(i)
+                self.assert_((row == case.graph.distances[i]).all())
+            self.assert_(not hasattr(g, "_cache_distances"))
+
+    def test_distances_within(self):
+        for case in self.iter_cases(disconnected=True):
+            for max_distance in 1, 2, 3, None:
+                g = Graph(case.graph.edges, case.graph.num_vertices)
+                pairs, lengths = g.distances_within(max_distance)
+                self.assert_(not hasattr(g, "_cache_distances"))
+                dm = case.graph.distances
+                mask = dm > 0
+                if max_distance is not None:
+                    mask &= dm <= max_distance
+                mask = np.triu(mask, 1)
+                self.assertEqual(set(map(tuple, pairs)), set(zip(*mask.nonzero())))
+                self.assert_((lengths == dm[pairs[:,0], pairs[:,1]]).all())
+                self.assert_((pairs[:,0] < pairs[:,1]).all())
+                # the same result when the dense matrix is present
+                pairs_bis, lengths_bis = case.graph.distances_within(max_distance)
+                self.assert_((pairs == pairs_bis).all())
+                self.assert_((lengths == lengths_bis).all())
+
     def test_neighbors(self):
         for case in self.iter_cases():
             g = case.graph
@@ -307,12 +341,54 @@ class GraphTestCase(unittest.TestCase):
                     self.assert_(frozenset([central,neighbor]) in g.edges)
             self.assertEqual(counter, len(g.edges)*2)
 
+    def test_csr(self):
+        for case in self.iter_cases(disconnected=True):
+            g = case.graph
+            indptr, indices = g.csr
+            self.assertEqual(indptr.dtype, np.int32)
+            self.assertEqual(indices.dtype, np.int32)
+            self.assertEqual(len(indptr), g.num_vertices+1)
+            for i in range(g.num_vertices):
+                row = indices[indptr[i]:indptr[i+1]]
+                self.assertEqual(list(row), sorted(g.neighbors[i]))
+
+    def test_from_arrays(self):
+        for case in self.iter_cases(disconnected=True):
+            edge_array = np.array([tuple(edge) for edge in case.graph.edges])
+            g = Graph.from_arrays(edge_array, case.graph.num_vertices)
+            self.assertEqual(g.num_edges, case.graph.num_edges)
+            self.assert_(not hasattr(g, "_cache_neighbors"))
+            self.assertEqual(g.neighbors, case.graph.neighbors)
+            self.assertEqual(g.edges, case.graph.edges)
+            self.assert_((g.distances == case.graph.distances).all())
+            # the constructor accepts arrays too
+            g = Graph(edge_array, case.graph.num_vertices)
+            self.assertEqual(g.edges, case.graph.edges)
+            self.assert_((g.edge_array == edge_array).all())
+
+    def test_edge_array_pickle(self):
+        g = Graph([(0, 1), (1, 2), (4, 2)])
+        g = pickle.loads(pickle.dumps(g))
+        self.assertEqual(g.edge_array.tolist(), [list(edge) for edge in g.edges])
+        self.assertEqual(g.num_edges, 3)
+        self.assertEqual(g.num_vertices, 5)
+
+    def test_invalid_edges(self):
+        self.assertRaises(ValueError, Graph, [(0, 1), (1, 1)])
+        self.assertRaises(TypeError, Graph, [(0, 1), (1, -2)])
+        self.assertRaises(TypeError, Graph, [(0, 1, 2)])
+        self.assertRaises(ValueError, Graph, np.array([[0, 1], [2, 2]]))
+        self.assertRaises(ValueError, Graph, [(0, 1)], 1)
+
     def test_central_vertices(self):
         for case in self.iter_cases():
             g = case.graph
             max_distances = g.distances.max(axis=1)
             max_distances_min = max_distances[max_distances>0].min()
             self.assert_(len(g.central_vertices>0))
+            # without the dense distance matrix
+            g_bis = Graph(g.edges, g.num_vertices)
+            self.assert_((g_bis.central_vertices == g.central_vertices).all())
             for c in g.central_vertices:
                 self.assert_(g.distances[c].max() == max_distances_min)
             self.assert_(g.central_vertex in g.central_vertices)
@@ -322,6 +398,25 @@ class GraphTestCase(unittest.TestCase):
         g = Graph(edges)
         self.assertEqual(g.independent_vertices, [[0, 1, 2, 3, 4, 5], [6, 7, 8, 9, 10, 11]])
 
+    def test_component_labels(self):
+        g = Graph([(5, 6), (0, 3), (3, 1), (8, 6)], 10)
+        self.assertEqual(g.component_labels.tolist(), [0, 0, 1, 0, 2, 3, 3, 4, 3, 5])
+        self.assertEqual(
+            [group.tolist() for group in g.component_groups],
+            [[0, 1, 3], [2], [4], [5, 6, 8], [7], [9]]
+        )
+        self.assertEqual(Graph([]).independent_vertices, [])
+        for case in self.iter_cases(disconnected=True):
+            g = case.graph
+            labels = g.component_labels
+            for i, j in g.edges:
+                self.assertEqual(labels[i], labels[j])
+            for group in g.independent_vertices:
+                self.assertEqual(
+                    set(group),
+                    set(vertex for vertex, distance in g.iter_breadth_first(group[0]))
+                )
+
     def test_fingerprints(self):
         for case in self.iter_cases():
             g0 = case.graph
@@ -332,6 +427,33 @@ class GraphTestCase(unittest.TestCase):
             for i in range(g0.num_vertices):
                 self.assert_((g0.vertex_fingerprints[i]==g1.vertex_fingerprints[permutation[i]]).all())
 
+    def test_fingerprints_sha1(self):
+        for case in self.iter_cases():
+            g0 = case.graph
+            permutation = np.random.permutation(g0.num_vertices)
+            new_edges = tuple((permutation[i], permutation[j]) for i,j in g0.edges)
+            g1 = Graph(new_edges, g0.num_vertices)
+            vs = [""]*g0.num_vertices
+            es = [""]*g0.num_edges
+            fp0 = g0.get_vertex_fingerprints(vs, es, method="sha1")
+            fp1 = g1.get_vertex_fingerprints(vs, es, method="sha1")
+            self.assertEqual(fp0.shape, (g0.num_vertices, 20))
+            self.assert_((fp0 == fp1[permutation]).all())
+
+    def test_fingerprints_partition(self):
+        for case in self.iter_cases():
+            g = case.graph
+            vs = [""]*g.num_vertices
+            es = [""]*g.num_edges
+            # the partition of the SHA1 variant may not be finer
+            fp_mix = g.vertex_fingerprints
+            fp_sha1 = g.get_vertex_fingerprints(vs, es, method="sha1")
+            for i in range(g.num_vertices):
+                for j in range(i):
+                    if (fp_mix[i] == fp_mix[j]).all():
+                        self.assert_((fp_sha1[i] == fp_sha1[j]).all())
+        self.assertRaises(ValueError, g.get_vertex_fingerprints, vs, es, method="foo")
+
     def test_symmetries(self):
         cases = self.iter_cases()
         for case in cases:
@@ -397,6 +519,73 @@ class GraphTestCase(unittest.TestCase):
                 equivalent_vertices.setdefault(vertex, set([vertex]))
             self.assertEqual(equivalent_vertices, g.equivalent_vertices)
 
+    def test_symmetry_generators(self):
+        for case in self.iter_cases(disconnected=False):
+            g = case.graph
+            expected = set(
+                tuple(j for i, j in sorted(symmetry.forward.items()))
+                for symmetry in g.symmetries
+            )
+            permutations = set(tuple(p) for p in g.iter_symmetry_permutations())
+            self.assertEqual(permutations, expected)
+            self.assertEqual(g.symmetry_order, len(expected))
+            for generator in g.symmetry_generators:
+                self.assert_(tuple(generator) in expected)
+            orbits = set(frozenset(s) for s in g.equivalent_vertices.values())
+            self.assertEqual(orbits, set(frozenset(o) for o in g.symmetry_orbits))
+        # a disconnected graph: two triangles and a single edge
+        g = Graph([(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (6, 7)])
+        self.assertEqual(g.symmetry_order, 6*6*2*2)
+        self.assertEqual(g.symmetry_orbits, [[0, 1, 2, 3, 4, 5], [6, 7]])
+        # only symmetries that keep vertex 0 fixed
+        count = 0
+        for permutation in g.iter_symmetry_permutations(lambda vs, ims: ((vs != 0) | (ims == 0)).all()):
+            self.assertEqual(permutation[0], 0)
+            count += 1
+        self.assertEqual(count, 2*6*2)
+        # many identical components are treated as one
+        import math
+        g = Graph(sum([[(3*i, 3*i+1), (3*i+1, 3*i+2)] for i in range(30)], []))
+        self.assertEqual(g.symmetry_order, 2**30*math.factorial(30))
+        ends = sorted(list(range(0, 90, 3)) + list(range(2, 90, 3)))
+        self.assertEqual(g.symmetry_orbits, [ends, list(range(1, 90, 3))])
+        edges = set(frozenset(edge) for edge in g.edges)
+        for generator in g.symmetry_generators:
+            self.assertEqual(set(frozenset(generator[list(edge)]) for edge in edges), edges)
+
+    def test_canonical_string(self):
+        strings = {}
+        for case in self.iter_cases():
+            g0 = case.graph
+            for i in range(5):
+                permutation = np.random.permutation(g0.num_vertices)
+                g1 = g0.get_subgraph(permutation, normalize=True)
+                self.assertEqual(g0.canonical_string, g1.canonical_string)
+            other = strings.setdefault(g0.canonical_string, g0)
+            self.assertEqual(other.num_vertices, g0.num_vertices)
+            if len(g0.independent_vertices) == 1:
+                self.assertNotEqual(other.full_match(g0), None)
+        # the 4x4 rook graph and the Shrikhande graph are strongly regular
+        # with the same parameters, but they are not isomorphic
+        rook = Graph([
+            (4*a + b, 4*c + d) for a in range(4) for b in range(4)
+            for c in range(4) for d in range(4)
+            if (a == c) != (b == d) and 4*a + b < 4*c + d
+        ])
+        shrikhande = Graph(set(
+            (min(4*a + b, 4*((a + da)%4) + (b + db)%4),
+             max(4*a + b, 4*((a + da)%4) + (b + db)%4))
+            for a in range(4) for b in range(4)
+            for da, db in [(0, 1), (1, 0), (1, 1)]
+        ))
+        self.assertEqual(rook.symmetry_order, 1152)
+        self.assertEqual(shrikhande.symmetry_order, 192)
+        self.assertNotEqual(rook.canonical_string, shrikhande.canonical_string)
+        for g0 in rook, shrikhande:
+            permutation = np.random.permutation(g0.num_vertices)
+            g1 = g0.get_subgraph(permutation, normalize=True)
+            self.assertEqual(g0.canonical_hash, g1.canonical_hash)
+
     # auxiliary graph routines
 
     def test_iter_breadth_first(self):
@@ -442,6 +631,36 @@ class GraphTestCase(unittest.TestCase):
                 visited[edge_index[frozenset(edge)]] = 1
             self.assert_((visited==1).all())
 
+    def test_get_breadth_first(self):
+        for case in self.iter_cases(disconnected=True):
+            g = case.graph
+            for start in range(g.num_vertices):
+                order, distances, parents = g.get_breadth_first(start)
+                expected = g.distances[start].copy()
+                expected[expected == 0] = -1
+                expected[start] = 0
+                self.assert_((distances == expected).all())
+                self.assertEqual(set(order), set((distances >= 0).nonzero()[0]))
+                self.assert_((np.diff(distances[order]) >= 0).all())
+                self.assertEqual(parents[start], -1)
+                for vertex in order[1:]:
+                    self.assert_(parents[vertex] in g.neighbors[vertex])
+                    self.assertEqual(distances[parents[vertex]], distances[vertex] - 1)
+                edges, edge_distances, kinds = g.get_breadth_first_edges(start)
+                self.assertEqual(len(edges), sum(
+                    1 for edge in g.edges if distances[list(edge)[0]] >= 0
+                ))
+                for (i, j), distance, kind in zip(edges, edge_distances, kinds):
+                    self.assertEqual(distances[i], distance)
+                    if kind == 0:
+                        self.assertEqual(parents[j], i)
+                    elif kind == 1:
+                        self.assertEqual(distances[j], distance)
+                    else:
+                        self.assertEqual(distances[j], distance + 1)
+                        self.assertNotEqual(parents[j], i)
+        self.assertRaises(ValueError, g.get_breadth_first, g.num_vertices)
+
     def test_iter_shortest_paths(self):
         # a few exotic cases
         cases = [
@@ -470,6 +689,20 @@ class GraphTestCase(unittest.TestCase):
                 expected_paths.discard(path)
                 #print path
             self.assertEqual(len(expected_paths), 0)
+        # same order as the breadth first search over all paths
+        for case in self.iter_cases(disconnected=True):
+            graph = case.graph
+            for begin in range(graph.num_vertices):
+                end = graph.num_vertices - 1
+                paths = []
+                max_len = None
+                for vertex, length, path in graph.iter_breadth_first(begin, True, True):
+                    if max_len is not None and length > max_len:
+                        break
+                    if vertex == end:
+                        max_len = length
+                        paths.append(path)
+                self.assertEqual(list(graph.iter_shortest_paths(begin, end)), paths)
 
     def test_get_subgraph(self):
         for case in self.iter_cases():
@@ -578,6 +811,53 @@ class GraphTestCase(unittest.TestCase):
         self.assertEqual(part2, set([3,4,9,10,11,12]))
         self.assertEqual(hinges, (1,4,2,3))
 
+    def test_cuts(self):
+        for case in self.iter_cases(disconnected=True):
+            g = case.graph
+            single = []
+            bridges = []
+            for index, (i, j) in enumerate(g.edges):
+                # reference based on flood fills
+                part_i = g.get_part(i, [j])
+                part_j = g.get_part(j, [i])
+                if part_i.isdisjoint(part_j):
+                    single.append((part_i, part_j, (i, j)))
+                    bridges.append(index)
+            self.assertEqual(list(g.iter_single_cuts()), single)
+            self.assertEqual(g.bridges, bridges)
+            double = []
+            for index1, (a1, b1) in enumerate(g.edges):
+                for a2, b2 in g.edges[:index1]:
+                    try:
+                        double.append(g.get_halfs_double(a1, b1, a2, b2))
+                    except GraphError:
+                        pass
+            self.assertEqual(list(g.iter_double_cuts()), double)
+
+    def test_biconnected_components(self):
+        # two triangles connected by a bridge, with a tail on one side
+        g = Graph([(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (5, 3), (5, 6)])
+        self.assertEqual(g.bridges, [3, 7])
+        self.assertEqual(g.articulation_points, [2, 3, 5])
+        self.assertEqual(
+            sorted(g.biconnected_components),
+            [[0, 1, 2], [2, 3], [3, 4, 5], [5, 6]]
+        )
+        tree = g.block_cut_tree
+        self.assertEqual(tree.num_vertices, 7)
+        self.assertEqual(tree.num_edges, 6)
+        self.assertEqual(len(tree.independent_vertices), 1)
+        for case in self.iter_cases():
+            g = case.graph
+            for vertex in range(g.num_vertices):
+                remaining = [edge for edge in g.edges if vertex not in edge]
+                h = Graph(remaining, g.num_vertices)
+                is_articulation = len(h.independent_vertices) > 2
+                self.assertEqual(is_articulation, vertex in g.articulation_points)
+            # in a tree, each edge is a block
+            if case.rings == []:
+                self.assertEqual(len(g.biconnected_components), g.num_edges)
+
     # match generator related tests
 
     def check_graph_search(self, pattern, verbose=False, debug=False, callback=None):
@@ -608,6 +888,114 @@ class GraphTestCase(unittest.TestCase):
                 self.assert_(match.ring_vertices in case.rings)
         self.check_graph_search(RingPattern(10), callback=callback)
 
+    def test_rings(self):
+        def normalize(ring):
+            ring = tuple(ring)
+            start = ring.index(min(ring))
+            ring = ring[start:] + ring[:start]
+            if ring[-1] < ring[1]:
+                ring = ring[:1] + ring[:0:-1]
+            return ring
+
+        for case in self.iter_cases():
+            g = case.graph
+            rings = g.rings()
+            sssr = g.sssr()
+            num_components = len(g.independent_vertices)
+            self.assertEqual(len(sssr), g.num_edges - g.num_vertices + num_components)
+            for ring in sssr:
+                self.assert_(ring in rings)
+            for ring in rings:
+                self.assertEqual(ring, normalize(ring))
+                for index in range(len(ring)):
+                    self.assert_(ring[index-1] in g.neighbors[ring[index]])
+            # the rings of the RingPattern are relevant cycles
+            small_rings = g.rings(10)
+            for match in GraphSearch(RingPattern(10))(g):
+                self.assert_(normalize(match.ring_vertices) in small_rings)
+            membership = g.get_ring_membership(rings)
+            self.assertEqual(membership.shape, (len(rings), g.num_vertices))
+            self.assertEqual(membership.sum(), sum(len(ring) for ring in rings))
+        # a cage with three equivalent 6-rings, of which two are a basis
+        g = Graph([(0, 1), (0, 2), (0, 3), (1, 4), (2, 5), (3, 6), (4, 7), (5, 7), (6, 7)])
+        self.assertEqual(g.rings(), [(0, 1, 4, 7, 5, 2), (0, 1, 4, 7, 6, 3), (0, 2, 5, 7, 6, 3)])
+        self.assertEqual(g.sssr(), [(0, 1, 4, 7, 5, 2), (0, 1, 4, 7, 6, 3)])
+        self.assertEqual(g.rings(5), [])
+
+    def test_rings_lattice(self):
+        # a square grid and a brick wall (honeycomb) with a few hundred vertices
+        size = 20
+        grid_edges = []
+        wall_edges = []
+        for row in range(size):
+            for col in range(size):
+                vertex = row*size + col
+                if col < size - 1:
+                    grid_edges.append((vertex, vertex + 1))
+                    wall_edges.append((vertex, vertex + 1))
+                if row < size - 1:
+                    grid_edges.append((vertex, vertex + size))
+                    if (row + col) % 2 == 0:
+                        wall_edges.append((vertex, vertex + size))
+        for edges, ring_size in (grid_edges, 4), (wall_edges, 6):
+            g = Graph(edges)
+            start = time.time()
+            rings = g.rings()
+            sssr = g.sssr()
+            self.assert_(time.time() - start < 5)
+            self.assertEqual(len(sssr), g.num_edges - g.num_vertices + 1)
+            self.assertEqual(set(len(ring) for ring in rings), set([ring_size]))
+            self.assertEqual(rings, sssr)
+
+    def test_graph_builder(self):
+        np.random.seed(3)
+        for case in self.iter_cases():
+            g = case.graph
+            g.distances
+            builder = GraphBuilder.from_graph(g)
+            for i in range(20):
+                num_pairs = g.num_vertices*(g.num_vertices - 1)//2
+                if builder.num_edges == num_pairs or (builder.num_edges > 0 and np.random.randint(2)):
+                    edge = builder.edges[np.random.randint(builder.num_edges)]
+                    builder.remove_edge(*edge)
+                    self.assert_(not builder.has_edge(*edge))
+                else:
+                    while True:
+                        vertex1, vertex2 = np.random.randint(g.num_vertices, size=2)
+                        if vertex1 != vertex2 and not builder.has_edge(vertex1, vertex2):
+                            break
+                    builder.add_edge(vertex1, vertex2)
+                frozen = builder.freeze()
+                reference = Graph(frozen.edges, g.num_vertices)
+                self.assertEqual(frozen.neighbors, reference.neighbors)
+                self.assert_((frozen.csr[0] == reference.csr[0]).all())
+                self.assert_((frozen.csr[1] == reference.csr[1]).all())
+                self.assert_((frozen.component_labels == reference.component_labels).all())
+                self.assertEqual(builder.num_components, reference.component_labels.max()+1 if g.num_vertices > 0 else 0)
+                self.assert_((frozen.distances == reference.distances).all())
+        # a ring of eight vertices with a tail of two vertices
+        edges = [(i, (i+1)%8) for i in range(8)] + [(7, 8), (8, 9)]
+        builder = GraphBuilder(10, edges, track_distances=True)
+        self.assertEqual(builder.num_searches, 10)
+        # removing a bridge needs no search
+        builder.remove_edge(8, 9)
+        self.assertEqual(builder.num_searches, 10)
+        self.assert_((builder.distances == Graph(builder.edges, 10).distances).all())
+        # removing a ring bond only searches from the smallest side, 1 to 4.
+        builder.remove_edge(0, 1)
+        self.assertEqual(builder.num_searches, 14)
+        self.assert_((builder.distances == Graph(builder.edges, 10).distances).all())
+        builder = GraphBuilder(4, [(0, 1), (1, 2)])
+        self.assertRaises(ValueError, builder.add_edge, 0, 1)
+        self.assertRaises(ValueError, builder.add_edge, 2, 2)
+        self.assertRaises(ValueError, builder.add_edge, 2, 4)
+        self.assertRaises(ValueError, builder.remove_edge, 0, 2)
+        self.assertRaises(GraphError, (lambda: builder.distances))
+        self.assertEqual(list(builder.component_labels), [0, 0, 0, 1])
+        frozen = builder.freeze()
+        self.assertEqual(frozen.edges, (frozenset([0, 1]), frozenset([1, 2])))
+        self.assertEqual(frozen.num_vertices, 4)
+
     def test_custom_pattern(self):
         # just run through the code
         for case in self.iter_cases():
@@ -671,3 +1059,5 @@ class GraphTestCase(unittest.TestCase):
             sizes.sort()
             sizes = tuple(sizes)
             self.assertEqual(sizes, expected_sizes)
+            sizes = tuple(len(ring) for ring in mol.graph.rings(12))
+            self.assertEqual(sizes, expected_sizes)
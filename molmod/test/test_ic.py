@@ -249,3 +249,42 @@ def test_opbend_ethene():
         ]
         assert abs(ic.opbend_cos([c[0], c[5], c[4], c[3]])[0] - np.cos(angle)) < 1e-5
         assert abs(ic.opbend_angle([c[0], c[5], c[4], c[3]])[0] - angle) < 1e-5
+
+
+def check_vectorized_ic(icfn_many, icfn, iterp, period=None):
+    points = list(iterp())
+    size = len(points[0])
+    coordinates = np.concatenate(points)
+    indexes = np.arange(len(coordinates)).reshape((-1, size))
+    # shuffle the atoms to make sure the indexes are used properly
+    permutation = np.random.permutation(len(coordinates))
+    coordinates[permutation] = coordinates.copy()
+    indexes = permutation[indexes]
+    for deriv in range(3):
+        result = icfn_many(coordinates, indexes, deriv)
+        assert len(result) == deriv + 1
+        for i, ps in enumerate(points):
+            expected = icfn(ps, deriv)
+            error = abs(result[0][i] - expected[0])
+            if period is not None:
+                error = min(error, abs(error - period))
+            assert error < 1e-10
+            for order in range(1, deriv+1):
+                assert result[order][i].shape == expected[order].shape
+                assert abs(result[order][i] - expected[order]).max() < 1e-8
+
+
+def test_vectorized_bond():
+    check_vectorized_ic(ic.bond_lengths, ic.bond_length, iter_bonds)
+
+
+def test_vectorized_bend_angle():
+    check_vectorized_ic(ic.bend_angles, ic.bend_angle, iter_bends)
+
+
+def test_vectorized_dihed_angle():
+    check_vectorized_ic(ic.dihed_angles, ic.dihed_angle, iter_diheds, 2*np.pi)
+
+
+def test_vectorized_dihed_angle_special():
+    check_vectorized_ic(ic.dihed_angles, ic.dihed_angle, iter_diheds_special, 2*np.pi)
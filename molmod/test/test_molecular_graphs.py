@@ -23,6 +23,7 @@
 
 
 from builtins import range
+import os
 import unittest
 
 import numpy as np
@@ -30,6 +31,7 @@ from nose.plugins.skip import SkipTest
 import pkg_resources
 
 from molmod import *
+from molmod.test.common import *
 
 
 __all__ = ["MolecularGraphTestCase"]
@@ -363,6 +365,11 @@ class MolecularGraphTestCase(unittest.TestCase):
             self.assert_((check.numbers==check_numbers).all())
             self.assertEqual(check.orders.shape,check_orders.shape)
             self.assert_((check.orders==check_orders).all())
+        # non-integer bond orders are retained
+        benzene = MolecularGraph([(i, (i+1)%6) for i in range(6)], np.array([6]*6), np.array([1.5]*6))
+        self.assert_(((benzene*4).orders == 1.5).all())
+        self.assertEqual((benzene*0).num_vertices, 0)
+        self.assertEqual(str(Graph(edges)*2), "0-1 0-2 0-3 0-4 5-6 5-7 5-8 5-9")
 
     def test_fingerprints(self):
         for mol in self.iter_molecules():
@@ -373,6 +380,98 @@ class MolecularGraphTestCase(unittest.TestCase):
                 self.assert_((g0.vertex_fingerprints[permutation[i]]==g1.vertex_fingerprints[i]).all())
             self.assert_((g0.fingerprint==g1.fingerprint).all())
 
+    def test_search_many(self):
+        pattern = DihedralAnglePattern([
+            CriteriaSet(atom_criteria(1, 6, 6, None), tag="HCC*"),
+            CriteriaSet(atom_criteria(None, 6, 7, None), tag="*CN*"),
+        ])
+        graph_search = GraphSearch(pattern)
+        graphs = [mol.graph for mol in self.iter_molecules()]
+        expected = [
+            [(match.forward, match.tag) for match in graph_search(graph)]
+            for graph in graphs
+        ]
+        for processes in 1, 2:
+            result = graph_search.search_many(graphs, processes=processes)
+            self.assertEqual(len(result), len(graphs))
+            for matches, expected_matches in zip(result, expected):
+                self.assertEqual([(match.forward, match.tag) for match in matches], expected_matches)
+        graph = self.load_molecule("tpa.xyz").graph
+        expected = [(match.forward, match.tag) for match in graph_search(graph)]
+        for processes, num_chunks in (1, 3), (2, None), (2, 5):
+            matches = graph_search.search_split(graph, processes=processes, num_chunks=num_chunks)
+            self.assertEqual([(match.forward, match.tag) for match in matches], expected)
+        matches = graph_search.search_split(graph, processes=2, one_match=True)
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0].forward, next(graph_search(graph, one_match=True)).forward)
+
+    def test_vertex_masks(self):
+        criteria = [
+            HasAtomNumber(6), HasNumNeighbors(3), HasNeighborNumbers(1, 1, 6),
+            HasNeighborNumbers(), HasNeighbors(HasAtomNumber(1), HasAtomNumber(6)),
+            HasNeighbors(HasAtomNumber(6), CritOr(HasAtomNumber(1), HasAtomNumber(8)), Anything()),
+            CritAnd(HasAtomNumber(6), CritNot(HasNumNeighbors(4))),
+            CritXor(HasAtomNumber(1), HasNumNeighbors(1), HasNumNeighbors(2)),
+            lambda index, graph: index % 2 == 0,
+        ]
+        for mol in self.iter_molecules(allow_multi=True):
+            g = mol.graph
+            for criterion in criteria:
+                mask = get_vertex_mask(criterion, g)
+                expected = [bool(criterion(i, g)) for i in range(g.num_vertices)]
+                self.assertEqual(mask.tolist(), expected)
+
+    def test_graph_index(self):
+        index = GraphIndex()
+        graphs = []
+        for mol in self.iter_molecules():
+            graphs.append(mol.graph)
+            i, is_new = index.add(mol.graph)
+            self.assertEqual(i, len(index)-1)
+            self.assert_(is_new)
+        for i, g0 in enumerate(graphs):
+            permutation = np.random.permutation(g0.num_vertices)
+            g1 = g0.get_subgraph(permutation, normalize=True)
+            self.assert_(g1 in index)
+            self.assertEqual(index.add(g1), (i, False))
+        self.assertEqual(len(index), len(graphs))
+        with tmpdir(__name__, 'test_graph_index') as dn:
+            fn = os.path.join(dn, 'graphs.idx')
+            index.save(fn)
+            index = GraphIndex.load(fn)
+            self.assertEqual(len(index), len(graphs))
+            for i, g0 in enumerate(graphs):
+                self.assertEqual(index.lookup(g0), i)
+                self.assertEqual(index[i].edges, g0.edges)
+                self.assert_(isinstance(index[i], MolecularGraph))
+                self.assertEqual(index[i].numbers.tolist(), g0.numbers.tolist())
+                self.assertEqual(index[i].orders.tolist(), g0.orders.tolist())
+            # incremental insertion after loading
+            g = MolecularGraph([(0, 1)], [6, 8])
+            self.assert_(g not in index)
+            self.assertEqual(index.add(g), (len(graphs), True))
+            index.save(fn)
+            index = GraphIndex.load(fn)
+            self.assertEqual(index.lookup(g), len(graphs))
+            # plain graphs and an empty index
+            plain = [Graph([(0, 1), (1, 2)]), Graph([(0, 1), (1, 2), (2, 0)])]
+            GraphIndex(plain).save(fn)
+            index = GraphIndex.load(fn)
+            self.assertEqual(type(index[1]), Graph)
+            self.assertEqual(index[1].edges, plain[1].edges)
+            self.assertEqual(index.lookup(plain[0]), 0)
+            GraphIndex().save(fn)
+            self.assertEqual(len(GraphIndex.load(fn)), 0)
+        # a free atom
+        index = GraphIndex()
+        g0 = MolecularGraph.from_arrays(np.array([[0, 1]]), np.array([6, 8, 18]))
+        g1 = MolecularGraph.from_arrays(np.array([[1, 2]]), np.array([18, 8, 6]))
+        self.assertEqual(index.add(g0), (0, True))
+        self.assertEqual(index.add(g1), (0, False))
+        self.assertEqual(index.lookup(g0), 0)
+        g2 = MolecularGraph.from_arrays(np.array([[0, 1]]), np.array([6, 8, 10]))
+        self.assertEqual(index.add(g2), (1, True))
+
     def test_fingerprint_collisions(self):
         raise SkipTest
         # These are collisions with older versions, found by scanning the
@@ -446,21 +545,49 @@ class MolecularGraphTestCase(unittest.TestCase):
     def test_canonical_order(self):
         # TODO: analogous tests voor pure graphs + fixen
         for molecule in self.iter_molecules():
-            try:
-                g0 = molecule.graph
-                order0 = g0.canonical_order
-                g0_bis = g0.get_subgraph(order0, normalize=True)
+            g0 = molecule.graph
+            order0 = g0.canonical_order
+            g0_bis = g0.get_subgraph(order0, normalize=True)
+
+            permutation = np.random.permutation(g0.num_vertices)
+            g1 = g0.get_subgraph(permutation, normalize=True)
+            order1 = g1.canonical_order
+            g1_bis = g1.get_subgraph(order1, normalize=True)
 
-                permutation = np.random.permutation(g0.num_vertices)
-                g1 = g0.get_subgraph(permutation, normalize=True)
-                order1 = g1.canonical_order
-                g1_bis = g1.get_subgraph(order1, normalize=True)
+            self.assertEqual(str(g0_bis), str(g1_bis))
+            self.assert_((g0_bis.numbers==g1_bis.numbers).all())
+            self.assert_((g0_bis.orders==g1_bis.orders).all())
 
-                self.assertEqual(str(g0_bis), str(g1_bis))
-                self.assert_((g0_bis.numbers==g1_bis.numbers).all())
-                self.assert_((g0_bis.orders==g1_bis.orders).all())
-            except NotImplementedError:
-                pass
+    def test_canonical_string(self):
+        lookup = {}
+        for molecule in self.iter_molecules(allow_multi=True):
+            g0 = molecule.graph
+            permutation = np.random.permutation(g0.num_vertices)
+            g1 = g0.get_subgraph(permutation, normalize=True)
+            self.assertEqual(g0.canonical_string, g1.canonical_string)
+            self.assertEqual(g0.canonical_hash, g1.canonical_hash)
+            # a graph with the canonical labels as new order is identical
+            # for both
+            g0_bis = g0.get_subgraph(np.argsort(g0.canonical_labels), normalize=True)
+            g1_bis = g1.get_subgraph(np.argsort(g1.canonical_labels), normalize=True)
+            self.assertEqual(g0_bis.edges, g1_bis.edges)
+            self.assert_((g0_bis.numbers == g1_bis.numbers).all())
+            self.assert_((g0_bis.orders == g1_bis.orders).all())
+            # dictionary lookup
+            other = lookup.setdefault(g0.canonical_string, g0)
+            self.assertEqual(other.full_match(g0) is not None, True)
+
+    def test_graph_builder(self):
+        graph = self.load_molecule("ethene.xyz").graph
+        builder = GraphBuilder.from_graph(graph)
+        order = builder.remove_edge(0, 3)
+        self.assertEqual(order, graph.orders[graph.edge_index[frozenset([0, 3])]])
+        builder.add_edge(3, 2, 2.0)
+        frozen = builder.freeze()
+        self.assert_(isinstance(frozen, MolecularGraph))
+        self.assert_((frozen.numbers == graph.numbers).all())
+        self.assertEqual(frozen.orders[frozen.edge_index[frozenset([2, 3])]], 2.0)
+        self.assertEqual(frozen.num_edges, graph.num_edges)
 
     def test_blob(self):
         for molecule in self.iter_molecules(allow_multi=True):
@@ -469,6 +596,29 @@ class MolecularGraphTestCase(unittest.TestCase):
             self.assert_((graph.numbers==molecule.graph.numbers).all(), "Atom numbers do not match.")
             self.assert_(graph.edges==molecule.graph.edges, "edges do not match.")
 
+    def test_binary_blob(self):
+        graphs = [molecule.graph for molecule in self.iter_molecules(allow_multi=True)]
+        graphs.append(MolecularGraph([(0, 1), (1, 2)], [6, -3, 300], [1.5, 2.0]))
+        graphs.append(MolecularGraph([], [1]))
+        graphs.append(MolecularGraph([(0, 1), (2, 1)], [6, 8, 1000000]*100, [5, -1]))
+        for graph in graphs:
+            other = MolecularGraph.from_binary_blob(graph.binary_blob)
+            self.assertEqual(other.num_vertices, graph.num_vertices)
+            self.assert_((other.numbers == graph.numbers).all())
+            self.assert_((other.edge_array == graph.edge_array).all())
+            self.assert_((other.orders == graph.orders).all())
+            if graph.num_edges > 0 and (graph.orders == graph.orders.round()).all():
+                self.assert_(len(graph.binary_blob) < len(graph.blob))
+
+        with tmpdir(__name__, 'test_binary_blob') as dn:
+            fn = os.path.join(dn, "graphs.bin")
+            MolecularGraphStore.write(fn, iter(graphs))
+            store = MolecularGraphStore(fn)
+            self.assertEqual(len(store), len(graphs))
+            for index in [-1, 3, 0, len(graphs) - 2]:
+                self.assertEqual(store[index].binary_blob, graphs[index].binary_blob)
+            self.assertEqual([graph.blob for graph in store[:-3]], [graph.blob for graph in graphs[:-3]])
+
     def test_halfs_double_thf(self):
         molecule = self.load_molecule("thf_single.xyz")
         cases = [
@@ -512,6 +662,68 @@ class MolecularGraphTestCase(unittest.TestCase):
             self.assert_((after.numbers==after_check.numbers).all())
             self.assert_((after.orders==after_check.orders).all())
 
+    def test_assign_bond_orders(self):
+        def check(graph, expected_sums, expected_charges):
+            result = graph.assign_bond_orders()
+            sums = np.bincount(result.edge_array.ravel(), np.repeat(result.orders, 2))
+            self.assertEqual(sums.tolist(), expected_sums)
+            self.assertEqual(result.formal_charges.tolist(), expected_charges)
+        # nitromethane, sulfate, phosphate, formate and cyclopentadienyl
+        check(MolecularGraph([(0, 1), (1, 2), (1, 3), (0, 4), (0, 5), (0, 6)], np.array([6, 7, 8, 8, 1, 1, 1])),
+            [4, 4, 2, 1, 1, 1, 1], [0, 1, 0, -1, 0, 0, 0])
+        check(MolecularGraph([(0, 1), (0, 2), (0, 3), (0, 4)], np.array([16, 8, 8, 8, 8])),
+            [6, 2, 2, 1, 1], [0, 0, 0, -1, -1])
+        check(MolecularGraph([(0, 1), (0, 2), (0, 3), (0, 4)], np.array([15, 8, 8, 8, 8])),
+            [5, 2, 1, 1, 1], [0, 0, -1, -1, -1])
+        check(MolecularGraph([(0, 1), (0, 2), (0, 3)], np.array([6, 8, 8, 1])),
+            [4, 2, 1, 1], [0, 0, -1, 0])
+        ring = [(i, (i+1)%5) for i in range(5)] + [(i, i+5) for i in range(5)]
+        check(MolecularGraph(ring, np.array([6]*5 + [1]*5)),
+            [4, 4, 4, 4, 3] + [1]*5, [0, 0, 0, 0, -1] + [0]*5)
+
+        # molecules from files, with and without formal charges
+        for molecule in self.iter_molecules(allow_multi=True):
+            graph = molecule.graph
+            formal_charges = getattr(molecule, "formal_charges", None)
+            result = graph.assign_bond_orders(formal_charges)
+            self.assertEqual(result.edges, graph.edges)
+            self.assertEqual(result.symbols, graph.symbols)
+            if formal_charges is not None:
+                self.assert_((result.formal_charges == formal_charges).all())
+            if (graph.orders > 1).any():
+                # compare with the bond orders from the file
+                sums0 = np.bincount(graph.edge_array.ravel(), np.repeat(graph.orders, 2), minlength=graph.num_vertices)
+                sums1 = np.bincount(result.edge_array.ravel(), np.repeat(result.orders, 2), minlength=graph.num_vertices)
+                self.assert_((sums0 == sums1).all())
+
+        # from_geometry
+        molecule = self.load_molecule("benzene.xyz")
+        graph = MolecularGraph.from_geometry(molecule, do_orders="valence")
+        self.assertEqual(sorted(graph.orders), [1.0]*9 + [2.0]*3)
+        self.assertEqual(len(graph.bond_lengths), graph.num_edges)
+
+        # a large polyaromatic sheet with a Kekulé structure
+        size = 30
+        edges = []
+        for i in range(size):
+            for j in range(2*size):
+                if j + 1 < 2*size:
+                    edges.append((i*2*size + j, i*2*size + j + 1))
+                if i + 1 < size and (i + j) % 2 == 0:
+                    edges.append((i*2*size + j, (i+1)*2*size + j))
+        num_carbon = 2*size*size
+        degrees = np.bincount(np.array(edges).ravel())
+        num_hydrogen = 0
+        for i in range(num_carbon):
+            for k in range(3 - degrees[i]):
+                edges.append((i, num_carbon + num_hydrogen))
+                num_hydrogen += 1
+        graph = MolecularGraph(edges, np.array([6]*num_carbon + [1]*num_hydrogen))
+        result = graph.assign_bond_orders()
+        sums = np.bincount(result.edge_array.ravel(), np.repeat(result.orders, 2))
+        self.assert_((sums[:num_carbon] == 4).all())
+        self.assert_((result.formal_charges == 0).all())
+
     def test_criteria_arguments(self):
         try:
             HasNeighborNumbers([1, 6])
@@ -540,6 +752,171 @@ class MolecularGraphTestCase(unittest.TestCase):
         mol.set_default_graph()
         assert len(mol.graph.edges)==12
 
+    def test_from_geometry_bond_types(self):
+        from molmod.bonds import bonds
+        for mol in self.iter_molecules(allow_multi=True):
+            graph = MolecularGraph.from_geometry(mol, do_orders=True)
+            self.assertEqual(graph.symbols, mol.symbols)
+            self.assertEqual(len(graph.bond_lengths), graph.num_edges)
+            for (i0, i1), order, length in zip(graph.edge_array, graph.orders, graph.bond_lengths):
+                self.assertTrue(i0 > i1)
+                self.assertAlmostEqual(length, mol.distance_matrix[i0, i1])
+                self.assertEqual(order, bonds.bonded(mol.numbers[i0], mol.numbers[i1], length))
+            # the edges are sorted by the first and then by the second index
+            edge_array = graph.edge_array
+            order = np.lexsort((edge_array[:, 1], edge_array[:, 0]))
+            self.assertTrue((order == np.arange(graph.num_edges)).all())
+            # any true-ish value estimates the bond orders
+            other = MolecularGraph.from_geometry(mol, do_orders=1)
+            self.assertTrue((other.edge_array == edge_array).all())
+            self.assertTrue((other.orders == graph.orders).all())
+            other = MolecularGraph.from_geometry(mol, do_orders=0)
+            self.assertTrue((other.edge_array == edge_array).all())
+            self.assertTrue((other.orders == 1).all())
+        self.assertRaises(ValueError, MolecularGraph.from_geometry, mol, do_orders="foo")
+        # vectorized bond types must match the scalar method
+        numbers = np.random.randint(0, 120, (1000, 2))
+        distances = np.random.uniform(0, 3*angstrom, 1000)
+        types = bonds.bonded_many(numbers[:, 0], numbers[:, 1], distances)
+        for (n1, n2), distance, bond_type in zip(numbers, distances, types):
+            self.assertEqual(bond_type, bonds.bonded(n1, n2, distance) or 0)
+
+    def test_topology_tracker(self):
+        mol = self.load_molecule("tpa.xyz")
+        tracker = TopologyTracker(mol.numbers, mol.symbols, skin=0.5*angstrom)
+        coordinates = mol.coordinates.copy()
+        for frame in range(50):
+            coordinates += np.random.normal(0, 0.04*angstrom, coordinates.shape)
+            old_graph = tracker.graph
+            events = tracker.update(coordinates)
+            self.assertEqual(tracker.frame, frame)
+            expected = MolecularGraph.from_geometry(Molecule(mol.numbers, coordinates))
+            self.assertEqual(tracker.graph.edges, expected.edges)
+            self.assertTrue(np.allclose(tracker.graph.bond_lengths, expected.bond_lengths))
+            self.assertEqual(old_graph is tracker.graph, frame > 0 and len(events) == 0)
+            for event in events:
+                self.assertEqual(frozenset([event.atom0, event.atom1]) in expected.edges, event.formed)
+        self.assertTrue(tracker.num_searches < 50)
+
+    def test_topology_tracker_hysteresis(self):
+        from molmod.bonds import bonds
+        mol = self.load_molecule("water.xyz")
+        # let one hydrogen oscillate around the bond threshold of O-H
+        threshold = bonds.get_max_distances([8], [1])[0]
+        o, h = (mol.numbers == 8).nonzero()[0][0], (mol.numbers == 1).nonzero()[0][0]
+        direction = mol.coordinates[h] - mol.coordinates[o]
+        direction /= np.linalg.norm(direction)
+        def iter_frames():
+            for distance in [0.9, 1.01, 0.99, 1.01, 0.99, 1.2, 0.99, 0.9]:
+                coordinates = mol.coordinates.copy()
+                coordinates[h] = coordinates[o] + direction*threshold*distance
+                yield coordinates
+        tracker = TopologyTracker(mol.numbers)
+        for coordinates in iter_frames():
+            tracker.update(coordinates)
+        pair = (max(o, h), min(o, h))
+        self.assertEqual(tracker.events, [
+            BondEvent(frame, pair[0], pair[1], formed)
+            for frame, formed in [(1, False), (2, True), (3, False), (4, True), (5, False), (6, True)]
+        ])
+        tracker = TopologyTracker(mol.numbers, hysteresis=0.05*threshold)
+        for coordinates in iter_frames():
+            tracker.update(coordinates)
+        self.assertEqual(tracker.events, [
+            BondEvent(5, pair[0], pair[1], False), BondEvent(6, pair[0], pair[1], True),
+        ])
+        # events can be used in sets and compared with other objects
+        self.assertEqual(len(set(tracker.events + tracker.events)), 2)
+        self.assertEqual(hash(BondEvent(5, 1, 0, True)), hash(BondEvent(5, 1, 0, True)))
+        self.assertNotEqual(BondEvent(5, 1, 0, True), BondEvent(5, 1, 0, False))
+        self.assertNotEqual(BondEvent(5, 1, 0, True), None)
+
+    def test_atom_typer(self):
+        is_cach3 = CritAnd(HasAtomNumber(6), HasNeighborNumbers(1, 1, 1, 6))
+        is_cach2 = CritAnd(HasAtomNumber(6), HasNeighborNumbers(1, 1, 6, 6))
+        criteria = [
+            ("cach3", is_cach3),
+            ("cach2", is_cach2),
+            ("hach3", CritAnd(HasAtomNumber(1), HasNeighbors(is_cach3))),
+            ("hach2", CritAnd(HasAtomNumber(1), HasNeighbors(is_cach2))),
+            ("csp2", CritAnd(HasAtomNumber(6), HasNumNeighbors(3))),
+            ("hoh", CritAnd(HasAtomNumber(1), HasNeighborNumbers(8))),
+        ]
+        typer = AtomTyper([
+            ("cach3", AtomTypeRule(6, neighbor_numbers=(6, 1, 1, 1))),
+            ("cach2", AtomTypeRule(6, neighbor_numbers=(1, 6, 1, 6))),
+            ("hach3", AtomTypeRule(1, criterion=HasNeighbors(is_cach3))),
+            ("hach2", AtomTypeRule(1, criterion=HasNeighbors(is_cach2))),
+            ("csp2", AtomTypeRule(6, degree=3)),
+            ("hoh", AtomTypeRule(1, neighbor_numbers=[8])),
+        ])
+        for molecule in self.iter_molecules(allow_multi=True):
+            graph = molecule.graph
+            expected = []
+            for index in range(graph.num_vertices):
+                labels = [label for label, criterion in criteria if criterion(index, graph)]
+                expected.append(labels[0] if len(labels) > 0 else None)
+            self.assertEqual(typer.get_types(graph), expected)
+
+    def test_atom_typer_rings(self):
+        pattern = BondPattern([CriteriaSet(vertex_criteria={0: HasAtomNumber(8), 1: HasAtomNumber(1)})])
+        typer = AtomTyper([
+            ("c5", AtomTypeRule(6, ring_size=5)),
+            ("c6", AtomTypeRule(6, ring_size=6)),
+            ("cr", AtomTypeRule(6, in_ring=True)),
+            ("c", AtomTypeRule(6, in_ring=False)),
+            ("oh", AtomTypeRule(8, pattern=pattern)),
+        ])
+        counts = {}
+        for molecule in self.iter_molecules(allow_multi=True):
+            graph = molecule.graph
+            types = typer.get_types(graph)
+            for label in types:
+                counts[label] = counts.get(label, 0) + 1
+            for size in 5, 6:
+                ring_atoms = set([])
+                for ring in graph.rings(size):
+                    if len(ring) == size:
+                        ring_atoms.update(ring)
+                for index in range(graph.num_vertices):
+                    if graph.numbers[index] == 6 and types[index] != "c5":
+                        self.assertEqual(types[index] == "c%i" % size, index in ring_atoms)
+            for index in range(graph.num_vertices):
+                # an atom is in a ring if it remains connected to a neighbor
+                # after removing the bond between them
+                in_ring = False
+                for neighbor in graph.neighbors[index]:
+                    edges = [edge for edge in graph.edges if edge != frozenset([index, neighbor])]
+                    subgraph = Graph(edges, graph.num_vertices)
+                    in_ring |= subgraph.component_labels[index] == subgraph.component_labels[neighbor]
+                if graph.numbers[index] == 6:
+                    self.assertEqual(types[index] in ("c5", "c6", "cr"), in_ring)
+                    self.assertEqual(types[index] == "c", not in_ring)
+                elif graph.numbers[index] == 8:
+                    is_oh = (graph.numbers[list(graph.neighbors[index])] == 1).any()
+                    self.assertEqual(types[index] == "oh", is_oh)
+                else:
+                    self.assertEqual(types[index], None)
+            self.assertEqual(typer.get_type_indexes(graph).tolist(), [
+                -1 if label is None else typer.labels.index(label) for label in types
+            ])
+        for label in typer.labels:
+            self.assert_(counts.get(label, 0) > 0)
+
+    def test_atom_typer_symmetric_pattern(self):
+        # both carbons are the first vertex of a C-C bond match
+        typer = AtomTyper([
+            ("cc", AtomTypeRule(6, pattern=BondPattern([CriteriaSet(atom_criteria(6, 6))]))),
+            ("co", AtomTypeRule(6, pattern=BondPattern([CriteriaSet(atom_criteria(6, 8))]))),
+            ("oc", AtomTypeRule(8, pattern=BondPattern([CriteriaSet(atom_criteria(6, 8))]))),
+            ("x", AtomTypeRule()),
+        ])
+        ethane = MolecularGraph([(0, 1), (0, 2), (0, 3), (0, 4), (1, 5), (1, 6), (1, 7)], [6, 6, 1, 1, 1, 1, 1, 1])
+        self.assertEqual(typer.get_types(ethane), ["cc", "cc"] + ["x"]*6)
+        # the criteria of the pattern vertices are not swapped
+        methanol = MolecularGraph([(0, 1), (0, 2), (0, 3), (0, 4), (1, 5)], [6, 8, 1, 1, 1, 1])
+        self.assertEqual(typer.get_types(methanol), ["co", "x"] + ["x"]*4)
+
     def test_copy_with(self):
         for mol in self.iter_molecules():
             graph = mol.graph.copy_with()
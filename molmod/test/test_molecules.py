@@ -23,6 +23,8 @@
 
 
 from builtins import range
+import os
+
 import numpy as np
 import pkg_resources
 
@@ -60,6 +62,44 @@ class MoleculeTestCase(BaseTestCase):
                     distance = np.linalg.norm(delta)
                     self.assertAlmostEqual(dm[i,j], distance)
 
+    def test_distance_variants(self):
+        molecule = Molecule.from_file(pkg_resources.resource_filename(__name__, "../data/test/tpa.xyz"))
+        dm = molecule.distance_matrix
+        i0, i1 = np.tril_indices(molecule.size, -1)
+        # condensed, also in single precision and with a block size that
+        # does not divide the number of atoms
+        condensed = molecule.get_distances_condensed()
+        self.assertArraysAlmostEqual(condensed, dm[i0, i1])
+        condensed = compute_distances_condensed(molecule.coordinates, np.float32, block_size=7)
+        self.assertEqual(condensed.dtype, np.float32)
+        self.assertArraysAlmostEqual(condensed, dm[i0, i1], 1e-6)
+        # tiles
+        covered = np.zeros(dm.shape, bool)
+        for begin0, begin1, tile in molecule.iter_distance_blocks(10):
+            self.assert_(begin1 <= begin0)
+            end0 = begin0 + tile.shape[0]
+            end1 = begin1 + tile.shape[1]
+            self.assertArraysAlmostEqual(tile, dm[begin0:end0, begin1:end1], doabs=True)
+            covered[begin0:end0, begin1:end1] = True
+        self.assert_((covered | covered.T).all())
+        # sparse
+        cutoff = 4.0*angstrom
+        indptr, indices, distances = molecule.get_distances_sparse(cutoff)
+        for i in range(molecule.size):
+            expected = ((dm[i] < cutoff) & (np.arange(molecule.size) != i)).nonzero()[0]
+            self.assertArraysEqual(indices[indptr[i]:indptr[i+1]], expected)
+            self.assertArraysAlmostEqual(distances[indptr[i]:indptr[i+1]], dm[i, expected])
+
+    def test_distance_variants_periodic(self):
+        for i in range(5):
+            coordinates = np.random.uniform(0, 5, (10, 3))
+            unit_cell = get_random_uc(5.0, np.random.randint(0, 4), 0.5)
+            from molmod.ext import molecules_distance_matrix
+            dm = molecules_distance_matrix(coordinates, unit_cell.matrix, unit_cell.reciprocal)
+            i0, i1 = np.tril_indices(10, -1)
+            condensed = compute_distances_condensed(coordinates, unit_cell=unit_cell, block_size=3)
+            self.assertArraysAlmostEqual(condensed, dm[i0, i1])
+
     def test_read_only(self):
         numbers = [8, 1]
         coordinates = [
@@ -202,3 +242,86 @@ class MoleculeTestCase(BaseTestCase):
             mol1.write_to_file("%s/probes.xyz" % dn)
         mol2 = Molecule.from_file(pkg_resources.resource_filename(__name__, "../data/test/probes.xyz"))
         self.assertArraysEqual(mol1.numbers, mol2.numbers)
+
+    def get_frames(self, num_frames=20):
+        molecule = Molecule.from_file(pkg_resources.resource_filename(__name__, "../data/test/tpa.xyz"))
+        molecule.set_default_masses()
+        molecule.set_default_graph()
+        coordinates = molecule.coordinates + np.random.normal(0, 0.1, (num_frames,) + molecule.coordinates.shape)
+        titles = ["frame %i" % i for i in range(num_frames)]
+        return Frames(molecule.numbers, coordinates, titles, molecule.masses, molecule.graph)
+
+    def test_frames(self):
+        frames = self.get_frames()
+        frames.chunk_size = 7
+        self.assertEqual(len(frames), 20)
+        self.assertEqual(frames.size, 41)
+        pairs = np.array([[0, 1], [5, 3], [10, 40]])
+        distances = frames.get_distances(pairs)
+        for index, molecule in enumerate(frames):
+            self.assertEqual(molecule.title, "frame %i" % index)
+            self.assert_(molecule.graph is frames.graph)
+            self.assertArraysAlmostEqual(frames.com[index], molecule.com)
+            self.assertArraysAlmostEqual(frames.inertia_tensor[index], molecule.inertia_tensor, 1e-10)
+            self.assertArraysAlmostEqual(frames.get_distance_matrix(index), molecule.distance_matrix)
+            self.assertArraysAlmostEqual(distances[index], molecule.distance_matrix[pairs[:, 0], pairs[:, 1]])
+        part = frames[5:15:2]
+        self.assertEqual(len(part), 5)
+        self.assertEqual(part.titles[1], "frame 7")
+        self.assertArraysAlmostEqual(part.com, frames.com[5:15:2])
+        self.assertArraysAlmostEqual(Frames.from_molecules(list(part)).coordinates, part.coordinates)
+        rmsds = part.get_rmsd_matrix()
+        self.assertEqual(len(rmsds), 10)
+        self.assertAlmostEqual(rmsds[3], part[3].rmsd(part[0])[2])
+
+    def test_frames_check(self):
+        numbers = np.array([1, 1])
+        coordinates = np.zeros((2, 2, 3))
+        self.assertRaises(TypeError, Frames, numbers, coordinates, titles=("a",))
+        self.assertRaises(TypeError, Frames, numbers, coordinates, symbols=("H",))
+        frames = Frames(numbers, coordinates, titles=("a", "b"), symbols=("H", "H"))
+        self.assertEqual(frames.titles, ("a", "b"))
+
+    def test_frames_npy(self):
+        frames = self.get_frames()
+        with tmpdir(__name__, 'test_frames_npy') as dn:
+            fn = os.path.join(dn, "frames.npy")
+            frames.save_npy(fn)
+            other = Frames.from_npy(fn, frames.numbers, masses=frames.masses)
+            # memory-mapped in read-only mode
+            self.assertFalse(other.coordinates.flags.writeable)
+            # no copy was made, the coordinates are a view of the memmap
+            base = other.coordinates.base
+            while base is not None and not isinstance(base, np.memmap):
+                base = base.base
+            self.assertTrue(isinstance(base, np.memmap))
+            self.assertArraysAlmostEqual(other.com, frames.com)
+            self.assertArraysAlmostEqual(other[3].coordinates, frames.coordinates[3])
+            del other
+            # other dtypes can not be memory-mapped without a copy
+            np.save(fn, frames.coordinates.astype(np.float32))
+            self.assertRaises(TypeError, Frames.from_npy, fn, frames.numbers)
+            other = Frames.from_npy(fn, frames.numbers, mmap_mode=None)
+            self.assertEqual(other.coordinates.dtype, np.float64)
+            del other
+
+    def test_shape_descriptors(self):
+        frames = self.get_frames()
+        frames.chunk_size = 6
+        for index, molecule in enumerate(frames):
+            relative = molecule.coordinates - molecule.com
+            rg = np.sqrt(np.dot(molecule.masses, (relative**2).sum(axis=1))/molecule.mass)
+            self.assertAlmostEqual(molecule.radius_of_gyration, rg)
+            self.assertAlmostEqual(frames.radius_of_gyration[index], rg)
+            moments = np.linalg.eigvalsh(molecule.inertia_tensor)
+            self.assertArraysAlmostEqual(molecule.principal_moments, moments, 1e-10)
+            self.assertArraysAlmostEqual(frames.principal_moments[index], moments, 1e-10)
+        # the batched functions also accept a single geometry
+        self.assertArraysAlmostEqual(
+            compute_principal_moments(frames.coordinates, frames.masses),
+            frames.principal_moments, 1e-10
+        )
+        self.assertArraysAlmostEqual(
+            compute_inertia_tensor(frames.coordinates[4], frames.masses),
+            frames.inertia_tensor[4], 1e-10
+        )
@@ -52,6 +52,18 @@ class SimilarityTestCase(unittest.TestCase):
             molecule.descriptor = SimilarityDescriptor.from_molecule(molecule)
         self.check(molecules, margin=0.2*angstrom, cutoff=7.0*angstrom)
 
+    def test_mol_cutoff(self):
+        margin = 0.2*angstrom
+        cutoff = 7.0*angstrom
+        for molecule in self.get_molecules():
+            full = SimilarityDescriptor.from_molecule(molecule)
+            dense = SimilarityDescriptor(molecule.distance_matrix, molecule.numbers)
+            sparse = SimilarityDescriptor.from_molecule(molecule, cutoff=cutoff+margin)
+            expected = compute_similarity(full, full, margin, cutoff)
+            self.assertAlmostEqual(compute_similarity(dense, dense, margin, cutoff), expected)
+            self.assertAlmostEqual(compute_similarity(sparse, sparse, margin, cutoff), expected)
+            self.assertAlmostEqual(compute_similarity(full, sparse, margin, cutoff), expected)
+
     def test_graph(self):
         molecules = self.get_molecules()
         for molecule in molecules:
@@ -376,3 +376,105 @@ class TransformationsTestCase(BaseTestCase):
         self.assertArraysAlmostEqual(trans.t, np.zeros(3, float), doabs=True)
         self.assertArraysAlmostEqual(a, a_trans)
         self.assertAlmostEqual(rmsd, 0.0)
+
+    def test_superpose_many(self):
+        ras = np.random.normal(0, 5, (15, 3))
+        rbss = np.array([
+            transf*ras + np.random.normal(0, 0.5, ras.shape)
+            for transf in self.iter_random_completes(20)
+        ])
+        for weights in None, np.random.uniform(1, 2, 15):
+            rotations, translations = superpose_many(ras, rbss, weights, chunk_size=7)
+            rotations2, translations2, rbss_trans, rmsds = fit_rmsd_many(ras, rbss, weights, chunk_size=6)
+            self.assertArraysAlmostEqual(rotations, rotations2)
+            self.assertArraysAlmostEqual(translations, translations2)
+            for k in range(len(rbss)):
+                transf, rbs_trans, rmsd = fit_rmsd(ras, rbss[k], weights)
+                self.assertArraysAlmostEqual(rotations[k], transf.r, 1e-8, doabs=True)
+                self.assertArraysAlmostEqual(translations[k], transf.t, 1e-8, doabs=True)
+                self.assertArraysAlmostEqual(rbss_trans[k], rbs_trans, 1e-8, doabs=True)
+                self.assertAlmostEqual(rmsds[k], rmsd)
+        # in-place alignment
+        expected = fit_rmsd_many(ras, rbss)
+        result = fit_rmsd_many(ras, rbss, out=rbss)
+        self.assert_(result[2] is rbss)
+        self.assertArraysAlmostEqual(rbss, expected[2])
+        self.assertArraysAlmostEqual(result[3], expected[3])
+
+    def test_qcp_rmsd(self):
+        ras = np.random.normal(0, 5, (15, 3))
+        for transf in self.iter_random_completes(20):
+            rbs = transf*ras + np.random.normal(0, 0.5, ras.shape)
+            expected_transf, rbs_trans, expected_rmsd = fit_rmsd(ras, rbs)
+            self.assertAlmostEqual(qcp_rmsd(ras, rbs), expected_rmsd)
+            check_transf, rmsd = qcp_rmsd(ras, rbs, do_rotation=True)
+            self.assertAlmostEqual(rmsd, expected_rmsd)
+            self.assertArraysAlmostEqual(check_transf.r, expected_transf.r, 1e-8, doabs=True)
+            self.assertArraysAlmostEqual(check_transf.t, expected_transf.t, 1e-8, doabs=True)
+        # identical geometries
+        check_transf, rmsd = qcp_rmsd(ras, ras, do_rotation=True)
+        self.assertAlmostEqual(rmsd, 0.0, 6)
+        self.assertArraysAlmostEqual(check_transf.r, np.identity(3), 1e-6, doabs=True)
+        # linear geometries, where the largest eigenvalue is a double root and
+        # only about half of the digits are retained
+        co2 = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 2.2], [0.0, 0.0, -2.2]])
+        self.assertEqual(qcp_rmsd(co2, co2), 0.0)
+        for transf in self.iter_random_completes(5):
+            for rbs in transf*co2, transf*(co2*[1.0, 1.0, 1.1]):
+                expected_rmsd = fit_rmsd(co2, rbs)[2]
+                self.assertAlmostEqual(qcp_rmsd(co2, rbs), expected_rmsd, 4)
+                check_transf, rmsd = qcp_rmsd(co2, rbs, do_rotation=True)
+                self.assertAlmostEqual(rmsd, expected_rmsd, 4)
+                self.assertAlmostEqual(compute_rmsd(co2, check_transf*rbs), expected_rmsd)
+
+    def test_qcp_rmsd_weights(self):
+        ras = np.random.normal(0, 5, (15, 3))
+        rbs = Rotation.random()*ras + np.random.normal(0, 0.5, ras.shape)
+        weights = np.random.uniform(1, 2, 15)
+        transf, rmsd = qcp_rmsd(ras, rbs, weights, do_rotation=True)
+        deviations = ((ras - transf*rbs)**2).sum(axis=1)
+        self.assertAlmostEqual(rmsd, np.sqrt(np.dot(weights, deviations)/weights.sum()/3))
+        # small changes of the transformation increase the rmsd
+        for i in range(10):
+            transf_bis = transf*Complete.from_properties(0.01, random_unit(), True, np.random.normal(0, 0.001, 3))
+            deviations = ((ras - transf_bis*rbs)**2).sum(axis=1)
+            self.assert_(rmsd < np.sqrt(np.dot(weights, deviations)/weights.sum()/3))
+
+    def test_rmsd_matrix(self):
+        ras = np.random.normal(0, 5, (15, 3))
+        frames = np.array([
+            transf*(ras*np.random.uniform(0.8, 1.2)) + np.random.normal(0, 0.5, ras.shape)
+            for transf in self.iter_random_completes(25)
+        ])
+        weights = np.random.uniform(1, 2, 15)
+        rmsds = rmsd_matrix(frames)
+        rmsds_weights = rmsd_matrix(frames, weights, nthreads=3)
+        counter = 0
+        for i in range(len(frames)):
+            for j in range(i):
+                self.assertAlmostEqual(rmsds[counter], fit_rmsd(frames[i], frames[j])[2])
+                self.assertAlmostEqual(rmsds_weights[counter], qcp_rmsd(frames[i], frames[j], weights))
+                counter += 1
+        self.assertEqual(counter, len(rmsds))
+        self.assertArraysAlmostEqual(rmsd_matrix(frames, nthreads=4), rmsds)
+        # early termination, the remaining elements must be exact.
+        threshold = np.median(rmsds)
+        rmsds_threshold = rmsd_matrix(frames, threshold=threshold, nthreads=2)
+        mask = np.isfinite(rmsds_threshold)
+        self.assertArraysAlmostEqual(rmsds_threshold[mask], rmsds[mask])
+        self.assert_((mask == (rmsds <= threshold)).all())
+        self.assert_((~mask).any())
+        # linear geometries
+        co2 = np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 2.2], [0.0, 0.0, -2.2]])
+        scales = [1.0, 1.0, 1.05, 0.95, 1.1]
+        frames = np.array([
+            transf*(co2*[1.0, 1.0, scale])
+            for transf, scale in zip(self.iter_random_completes(5), scales)
+        ])
+        rmsds = rmsd_matrix(frames)
+        self.assert_(np.isfinite(rmsds).all())
+        counter = 0
+        for i in range(len(frames)):
+            for j in range(i):
+                self.assertAlmostEqual(rmsds[counter], fit_rmsd(frames[i], frames[j])[2], 4)
+                counter += 1
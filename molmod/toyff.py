@@ -181,7 +181,13 @@ class ToyFF(object):
             self.matrix = unit_cell.matrix
             self.reciprocal = unit_cell.reciprocal
 
-        self.dm = graph.distances.astype(int)
+        # The compiled kernels need the dense matrix, but it is filled in with
+        # one breadth first search per atom instead of the O(N**3) all-pairs
+        # algorithm behind graph.distances.
+        pairs, lengths = graph.distances_within()
+        self.dm = np.zeros((graph.num_vertices, graph.num_vertices), int)
+        self.dm[pairs[:, 0], pairs[:, 1]] = lengths
+        self.dm[pairs[:, 1], pairs[:, 0]] = lengths
         dm = self.dm.astype(float)
         self.dm0 = dm**2
         self.dmk = (dm+0.1)**(-3)
@@ -223,7 +229,7 @@ class ToyFF(object):
             for j in neighbors:
                 number_j = graph.numbers[j]
                 for k in neighbors:
-                    if j < k and not frozenset([j, k]) in graph.edges:
+                    if j < k and not frozenset([j, k]) in graph.edge_index:
                         number_k = graph.numbers[k]
 
                         triplet = (
@@ -0,0 +1,227 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2012 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#include "transformations.h"
+
+#include <math.h>
+
+// Implementation of the quaternion characteristic polynomial (QCP) method:
+//
+// D. L. Theobald, Acta Crystallographica A 61, 478-480 (2005)
+// http://dx.doi.org/10.1107/S0108767305015266
+//
+// P. Liu, D. K. Agrafiotis and D. L. Theobald, Journal of Computational
+// Chemistry 31, 1561-1563 (2010)
+// http://dx.doi.org/10.1002/jcc.21439
+//
+// All coordinates must be centered (with the same weights) before the inner
+// product is computed. The rmsd follows the convention of compute_rmsd in
+// molmod.utils, i.e. the mean is taken over all Cartesian components.
+
+#define QCP_EVAL_PREC 1e-11
+#define QCP_EVEC_PREC 1e-6
+#define QCP_MAX_ITER 50
+
+
+double transformations_qcp_inner(size_t natom, double *a, double *b, double *weights, double *inner) {
+  // Computes inner[3*k+l] = sum_i w_i a_ik b_il and returns
+  // e0 = (G_a + G_b)/2, where G is the weighted sum of squares.
+  size_t i, k, l;
+  double w, e0;
+  for (k=0; k<9; k++) inner[k] = 0.0;
+  e0 = 0.0;
+  for (i=0; i<natom; i++) {
+    w = (weights==NULL)?1.0:weights[i];
+    for (k=0; k<3; k++) {
+      for (l=0; l<3; l++) {
+        inner[3*k+l] += w*a[k]*b[l];
+      }
+      e0 += w*(a[k]*a[k] + b[k]*b[k]);
+    }
+    a += 3;
+    b += 3;
+  }
+  return 0.5*e0;
+}
+
+
+double transformations_qcp_rmsd(double *inner, double e0, double total_weight, double *rot) {
+  // Returns the rmsd computed from the inner product matrix and
+  // e0 = (G_a + G_b)/2, where G is the weighted sum of squares of the
+  // centered coordinates. When rot is not NULL, the rotation matrix that
+  // brings b into overlap with a is written to rot.
+  double Sxx, Sxy, Sxz, Syx, Syy, Syz, Szx, Szy, Szz;
+  double Sxx2, Syy2, Szz2, Sxy2, Syz2, Sxz2, Syx2, Szy2, Szx2;
+  double SyzSzymSyySzz2, Sxx2Syy2Szz2Syz2Szy2, Sxy2Sxz2Syx2Szx2;
+  double SxzpSzx, SyzpSzy, SxypSyx, SyzmSzy, SxzmSzx, SxymSyx, SxxpSyy, SxxmSyy;
+  double c0, c1, c2, lambda, old, x2, b, a, delta, rmsd;
+  double a11, a12, a13, a14, a21, a22, a23, a24, a31, a32, a33, a34, a41, a42, a43, a44;
+  double a3344_4334, a3244_4234, a3243_4233, a3143_4133, a3144_4134, a3142_4132;
+  double a1324_1423, a1224_1422, a1223_1322, a1124_1421, a1123_1321, a1122_1221;
+  double q1, q2, q3, q4, qsqr, normq, y2, z2, xy, az, zx, ay, yz, ax;
+  int i;
+
+  Sxx = inner[0]; Sxy = inner[1]; Sxz = inner[2];
+  Syx = inner[3]; Syy = inner[4]; Syz = inner[5];
+  Szx = inner[6]; Szy = inner[7]; Szz = inner[8];
+
+  Sxx2 = Sxx*Sxx; Syy2 = Syy*Syy; Szz2 = Szz*Szz;
+  Sxy2 = Sxy*Sxy; Syz2 = Syz*Syz; Sxz2 = Sxz*Sxz;
+  Syx2 = Syx*Syx; Szy2 = Szy*Szy; Szx2 = Szx*Szx;
+
+  SyzSzymSyySzz2 = 2.0*(Syz*Szy - Syy*Szz);
+  Sxx2Syy2Szz2Syz2Szy2 = Syy2 + Szz2 - Sxx2 + Syz2 + Szy2;
+
+  c2 = -2.0*(Sxx2 + Syy2 + Szz2 + Sxy2 + Syx2 + Sxz2 + Szx2 + Syz2 + Szy2);
+  c1 = 8.0*(Sxx*Syz*Szy + Syy*Szx*Sxz + Szz*Sxy*Syx - Sxx*Syy*Szz - Syz*Szx*Sxy - Szy*Syx*Sxz);
+
+  SxzpSzx = Sxz + Szx; SyzpSzy = Syz + Szy; SxypSyx = Sxy + Syx;
+  SyzmSzy = Syz - Szy; SxzmSzx = Sxz - Szx; SxymSyx = Sxy - Syx;
+  SxxpSyy = Sxx + Syy; SxxmSyy = Sxx - Syy;
+  Sxy2Sxz2Syx2Szx2 = Sxy2 + Sxz2 - Syx2 - Szx2;
+
+  c0 = Sxy2Sxz2Syx2Szx2*Sxy2Sxz2Syx2Szx2
+     + (Sxx2Syy2Szz2Syz2Szy2 + SyzSzymSyySzz2)*(Sxx2Syy2Szz2Syz2Szy2 - SyzSzymSyySzz2)
+     + (-SxzpSzx*SyzmSzy + SxymSyx*(SxxmSyy - Szz))*(-SxzmSzx*SyzpSzy + SxymSyx*(SxxmSyy + Szz))
+     + (-SxzpSzx*SyzpSzy - SxypSyx*(SxxpSyy - Szz))*(-SxzmSzx*SyzmSzy - SxypSyx*(SxxpSyy + Szz))
+     + (SxypSyx*SyzpSzy + SxzpSzx*(SxxmSyy + Szz))*(-SxymSyx*SyzmSzy + SxzpSzx*(SxxpSyy + Szz))
+     + (SxypSyx*SyzmSzy + SxzmSzx*(SxxmSyy - Szz))*(-SxymSyx*SyzpSzy + SxzmSzx*(SxxpSyy - Szz));
+
+  // Newton-Raphson iterations for the largest eigenvalue, starting from the
+  // upper bound e0.
+  lambda = e0;
+  for (i=0; i<QCP_MAX_ITER; i++) {
+    old = lambda;
+    x2 = lambda*lambda;
+    b = (x2 + c2)*lambda;
+    a = b + c1;
+    delta = 2.0*x2*lambda + b + a;
+    // The derivative vanishes at a double root, e.g. for linear geometries.
+    // The last lambda is then already the largest eigenvalue.
+    if (fabs(delta) <= fabs(QCP_EVAL_PREC*x2*lambda)) break;
+    lambda -= (a*lambda + c0)/delta;
+    if (!isfinite(lambda)) {
+      lambda = old;
+      break;
+    }
+    if (fabs(lambda - old) < fabs(QCP_EVAL_PREC*lambda)) break;
+  }
+  delta = e0 - lambda;
+  if (delta < 0.0) delta = 0.0;
+  rmsd = sqrt(2.0*delta/(3.0*total_weight));
+  if (rot == NULL) return rmsd;
+
+  // The quaternion is a column of the adjoint of the shifted key matrix.
+  a11 = SxxpSyy + Szz - lambda; a12 = SyzmSzy; a13 = -SxzmSzx; a14 = SxymSyx;
+  a21 = SyzmSzy; a22 = SxxmSyy - Szz - lambda; a23 = SxypSyx; a24 = SxzpSzx;
+  a31 = a13; a32 = a23; a33 = Syy - Sxx - Szz - lambda; a34 = SyzpSzy;
+  a41 = a14; a42 = a24; a43 = a34; a44 = Szz - SxxpSyy - lambda;
+  a3344_4334 = a33*a44 - a43*a34; a3244_4234 = a32*a44 - a42*a34;
+  a3243_4233 = a32*a43 - a42*a33; a3143_4133 = a31*a43 - a41*a33;
+  a3144_4134 = a31*a44 - a41*a34; a3142_4132 = a31*a42 - a41*a32;
+  q1 = a22*a3344_4334 - a23*a3244_4234 + a24*a3243_4233;
+  q2 = -a21*a3344_4334 + a23*a3144_4134 - a24*a3143_4133;
+  q3 = a21*a3244_4234 - a22*a3144_4134 + a24*a3142_4132;
+  q4 = -a21*a3243_4233 + a22*a3143_4133 - a23*a3142_4132;
+  qsqr = q1*q1 + q2*q2 + q3*q3 + q4*q4;
+
+  // When the norm of the column is too small or not finite, try the other
+  // columns.
+  if (!(qsqr >= QCP_EVEC_PREC)) {
+    q1 = a12*a3344_4334 - a13*a3244_4234 + a14*a3243_4233;
+    q2 = -a11*a3344_4334 + a13*a3144_4134 - a14*a3143_4133;
+    q3 = a11*a3244_4234 - a12*a3144_4134 + a14*a3142_4132;
+    q4 = -a11*a3243_4233 + a12*a3143_4133 - a13*a3142_4132;
+    qsqr = q1*q1 + q2*q2 + q3*q3 + q4*q4;
+    if (!(qsqr >= QCP_EVEC_PREC)) {
+      a1324_1423 = a13*a24 - a14*a23; a1224_1422 = a12*a24 - a14*a22;
+      a1223_1322 = a12*a23 - a13*a22; a1124_1421 = a11*a24 - a14*a21;
+      a1123_1321 = a11*a23 - a13*a21; a1122_1221 = a11*a22 - a12*a21;
+      q1 = a42*a1324_1423 - a43*a1224_1422 + a44*a1223_1322;
+      q2 = -a41*a1324_1423 + a43*a1124_1421 - a44*a1123_1321;
+      q3 = a41*a1224_1422 - a42*a1124_1421 + a44*a1122_1221;
+      q4 = -a41*a1223_1322 + a42*a1123_1321 - a43*a1122_1221;
+      qsqr = q1*q1 + q2*q2 + q3*q3 + q4*q4;
+      if (!(qsqr >= QCP_EVEC_PREC)) {
+        q1 = a32*a1324_1423 - a33*a1224_1422 + a34*a1223_1322;
+        q2 = -a31*a1324_1423 + a33*a1124_1421 - a34*a1123_1321;
+        q3 = a31*a1224_1422 - a32*a1124_1421 + a34*a1122_1221;
+        q4 = -a31*a1223_1322 + a32*a1123_1321 - a33*a1122_1221;
+        qsqr = q1*q1 + q2*q2 + q3*q3 + q4*q4;
+        if (!(qsqr >= QCP_EVEC_PREC) || !isfinite(qsqr)) {
+          // The rotation is undetermined, e.g. for identical structures.
+          rot[0] = rot[4] = rot[8] = 1.0;
+          rot[1] = rot[2] = rot[3] = rot[5] = rot[6] = rot[7] = 0.0;
+          return rmsd;
+        }
+      }
+    }
+  }
+
+  normq = sqrt(qsqr);
+  q1 /= normq; q2 /= normq; q3 /= normq; q4 /= normq;
+  a = q1*q1; x2 = q2*q2; y2 = q3*q3; z2 = q4*q4;
+  xy = q2*q3; az = q1*q4; zx = q4*q2; ay = q1*q3; yz = q3*q4; ax = q1*q2;
+  rot[0] = a + x2 - y2 - z2;
+  rot[1] = 2*(xy + az);
+  rot[2] = 2*(zx - ay);
+  rot[3] = 2*(xy - az);
+  rot[4] = a - x2 + y2 - z2;
+  rot[5] = 2*(yz + ax);
+  rot[6] = 2*(zx + ay);
+  rot[7] = 2*(yz - ax);
+  rot[8] = a - x2 - y2 + z2;
+  return rmsd;
+}
+
+
+void transformations_rmsd_matrix(size_t nframe, size_t natom, double *frames, double *weights,
+                                 double *norms, double total_weight, double threshold,
+                                 size_t begin, size_t end, double *out) {
+  // Fills the elements begin:end of the condensed rmsd matrix. The element
+  // for frames i > j is stored at i*(i-1)/2+j. The frames must be centered
+  // and norms contains the weighted sum of squares of each frame. When the
+  // difference in norms already implies an rmsd above the threshold, the
+  // inner product is skipped and the element is set to INFINITY.
+  size_t i, j, index;
+  double inner[9], lower;
+  // find the first pair
+  i = 1;
+  while (i*(i+1)/2 <= begin) i++;
+  j = begin - i*(i-1)/2;
+  for (index=begin; index<end; index++) {
+    lower = sqrt(norms[i]) - sqrt(norms[j]);
+    if (lower*lower > threshold*threshold*3.0*total_weight) {
+      out[index] = INFINITY;
+    } else {
+      transformations_qcp_inner(natom, frames + 3*natom*i, frames + 3*natom*j, weights, inner);
+      out[index] = transformations_qcp_rmsd(inner, 0.5*(norms[i] + norms[j]), total_weight, NULL);
+    }
+    j++;
+    if (j == i) {
+      i++;
+      j = 0;
+    }
+  }
+}
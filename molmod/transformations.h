@@ -0,0 +1,38 @@
+// MolMod is a collection of molecular modelling tools for python.
+// Copyright (C) 2007 - 2012 Toon Verstraelen <Toon.Verstraelen@UGent.be>, Center
+// for Molecular Modeling (CMM), Ghent University, Ghent, Belgium; all rights
+// reserved unless otherwise stated.
+//
+// This file is part of MolMod.
+//
+// MolMod is free software; you can redistribute it and/or
+// modify it under the terms of the GNU General Public License
+// as published by the Free Software Foundation; either version 3
+// of the License, or (at your option) any later version.
+//
+// MolMod is distributed in the hope that it will be useful,
+// but WITHOUT ANY WARRANTY; without even the implied warranty of
+// MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+// GNU General Public License for more details.
+//
+// You should have received a copy of the GNU General Public License
+// along with this program; if not, see <http://www.gnu.org/licenses/>
+//
+// --
+
+
+
+#ifndef MOLMOD_TRANSFORMATIONS_H_
+#define MOLMOD_TRANSFORMATIONS_H_
+
+
+#include <stddef.h>
+
+double transformations_qcp_inner(size_t natom, double *a, double *b, double *weights, double *inner);
+double transformations_qcp_rmsd(double *inner, double e0, double total_weight, double *rot);
+void transformations_rmsd_matrix(size_t nframe, size_t natom, double *frames, double *weights,
+                                 double *norms, double total_weight, double threshold,
+                                 size_t begin, size_t end, double *out);
+
+
+#endif  // MOLMOD_TRANSFORMATIONS_H_
@@ -31,6 +31,8 @@ implementation of the Kabsch algorithm.
 from __future__ import division
 
 from builtins import range
+import threading
+
 import numpy as np
 
 from molmod.utils import cached, ReadOnly, ReadOnlyAttribute, compute_rmsd
@@ -39,7 +41,8 @@ from molmod.unit_cells import UnitCell
 
 
 __all__ = [
-    "Translation", "Rotation", "Complete", "superpose", "fit_rmsd"
+    "Translation", "Rotation", "Complete", "superpose", "fit_rmsd",
+    "superpose_many", "fit_rmsd_many", "qcp_rmsd", "rmsd_matrix",
 ]
 
 
@@ -505,3 +508,234 @@ def fit_rmsd(ras, rbs, weights=None):
     rbs_trans = transformation * rbs
     rmsd = compute_rmsd(ras, rbs_trans)
     return transformation, rbs_trans, rmsd
+
+
+def _iter_superpose_chunks(ras, rbss, weights, chunk_size):
+    """Iterate over chunks of frames and their optimal transformations
+
+       This is the batched version of the Kabsch algorithm in
+       :func:`superpose`. It yields tuples ``(begin, end, rbs, rotations,
+       translations)`` for consecutive chunks of frames.
+    """
+    if weights is None:
+        weights = np.ones(len(ras), float)
+        ma = ras.mean(axis=0)
+        wras = ras - ma
+    else:
+        ma = np.dot(weights, ras)/weights.sum()
+        wras = (ras - ma)*weights.reshape((-1, 1))
+    # The centering of the geometries B is moved out of the covariance
+    # matrices, such that the bulk of the work is a single tensordot:
+    # sum_i w_i (rb_i - mb) wra_i^T = sum_i w_i rb_i wra_i^T - mb sum_i w_i wra_i^T
+    wwras = wras*weights.reshape((-1, 1))
+    correction = wwras.sum(axis=0)
+    for begin in range(0, len(rbss), chunk_size):
+        rbs = np.asarray(rbss[begin:begin+chunk_size])
+        mb = np.tensordot(weights, rbs, axes=([0], [1]))/weights.sum()
+        A = np.tensordot(rbs, wwras, axes=([1], [0])) - mb[:, :, None]*correction
+        v, s, wt = np.linalg.svd(A)
+        s[:] = 1
+        s[np.linalg.det(np.matmul(v, wt)) < 0, 2] = -1
+        rotations = np.matmul(wt.transpose(0, 2, 1)*s[:, None, :], v.transpose(0, 2, 1))
+        translations = ma - np.einsum("kij,kj->ki", rotations, mb)
+        yield begin, begin + len(rbs), rbs, rotations, translations
+
+
+def superpose_many(ras, rbss, weights=None, chunk_size=1024):
+    """Compute the transformations that minimize the RMSD of many frames
+
+       Arguments:
+        | ``ras``  --  a ``np.array`` with 3D coordinates of the reference
+                       geometry A, shape=(N,3)
+        | ``rbss``  --  a ``np.array`` with 3D coordinates of many geometries
+                        B, shape=(M,N,3)
+
+       Optional arguments:
+        | ``weights``  --  a numpy array with fitting weights for each
+                           coordinate, shape=(N,)
+        | ``chunk_size``  --  the number of frames that are processed at once.
+                              This bounds the size of the temporary arrays,
+                              such that rbss may also be a memory-mapped array.
+
+       Return values:
+        | ``rotations``  --  the rotation matrices, shape=(M,3,3)
+        | ``translations``  --  the translation vectors, shape=(M,3)
+
+       The transformation with rotation matrix ``rotations[k]`` and
+       translation vector ``translations[k]`` brings geometry ``rbss[k]`` into
+       overlap with geometry A. The results are the same as those of
+       :func:`superpose`, but all frames are treated with a single batched
+       singular value decomposition per chunk.
+    """
+    rotations = np.zeros((len(rbss), 3, 3), float)
+    translations = np.zeros((len(rbss), 3), float)
+    for begin, end, rbs, rs, ts in _iter_superpose_chunks(ras, rbss, weights, chunk_size):
+        rotations[begin:end] = rs
+        translations[begin:end] = ts
+    return rotations, translations
+
+
+def fit_rmsd_many(ras, rbss, weights=None, out=None, chunk_size=1024):
+    """Fit many geometries onto ras, returns more info than superpose_many
+
+       Arguments:
+        | ``ras``  --  a numpy array with 3D coordinates of the reference
+                       geometry A, shape=(N,3)
+        | ``rbss``  --  a numpy array with 3D coordinates of many geometries
+                        B, shape=(M,N,3)
+
+       Optional arguments:
+        | ``weights``  --  a numpy array with fitting weights for each
+                           coordinate, shape=(N,)
+        | ``out``  --  an array with shape (M,N,3) for the transformed
+                       coordinates. When ``out`` is ``rbss`` itself, the
+                       geometries are aligned in place. When not given, a
+                       new array is allocated.
+        | ``chunk_size``  --  the number of frames that are processed at once
+
+       Return values:
+        | ``rotations``  --  the rotation matrices, shape=(M,3,3)
+        | ``translations``  --  the translation vectors, shape=(M,3)
+        | ``rbss_trans``  --  the transformed coordinates of the geometries B,
+                              i.e. ``out`` when it is given
+        | ``rmsds``  --  the rmsd of the distances between corresponding atoms
+                         in geometry A and each geometry B, shape=(M,)
+
+       This is the batched version of :func:`fit_rmsd`.
+    """
+    rotations = np.zeros((len(rbss), 3, 3), float)
+    translations = np.zeros((len(rbss), 3), float)
+    rmsds = np.zeros(len(rbss), float)
+    if out is None:
+        out = np.zeros(rbss.shape, float)
+    for begin, end, rbs, rs, ts in _iter_superpose_chunks(ras, rbss, weights, chunk_size):
+        rotations[begin:end] = rs
+        translations[begin:end] = ts
+        rbs_trans = np.matmul(rbs, rs.transpose(0, 2, 1)) + ts[:, None, :]
+        rmsds[begin:end] = np.sqrt(((rbs_trans - ras)**2).sum(axis=2).mean(axis=1)/3)
+        out[begin:end] = rbs_trans
+    return rotations, translations, out, rmsds
+
+
+def _center_weighted(coordinates, weights):
+    """Subtract the (weighted) center from one or more geometries"""
+    if weights is None:
+        center = coordinates.mean(axis=-2)
+    else:
+        center = np.tensordot(coordinates, weights, axes=([-2], [0]))/weights.sum()
+    return np.ascontiguousarray(coordinates - center[..., None, :], float), center
+
+
+def qcp_rmsd(ras, rbs, weights=None, do_rotation=False):
+    """Compute the minimal RMSD between two geometries with the QCP method
+
+       Arguments:
+        | ``ras``  --  a numpy array with 3D coordinates of geometry A,
+                       shape=(N,3)
+        | ``rbs``  --  a numpy array with 3D coordinates of geometry B,
+                       shape=(N,3)
+
+       Optional arguments:
+        | ``weights``  --  a numpy array with fitting weights for each
+                           coordinate, shape=(N,)
+        | ``do_rotation``  --  when True, also the transformation is computed
+
+       Return value:
+        | ``rmsd``  --  the rmsd after the optimal superposition, or
+        | ``(transformation, rmsd)``  --  when do_rotation is True. The
+          transformation brings geometry B into overlap with geometry A.
+
+       The quaternion characteristic polynomial (QCP) method only needs the
+       largest eigenvalue of a 4x4 key matrix, which is found with a few
+       Newton iterations in compiled code. Unlike :func:`fit_rmsd`, no SVD is
+       needed and the rotation is only constructed when requested:
+
+       http://dx.doi.org/10.1107/S0108767305015266
+
+       Without weights, the rmsd is the same as the one returned by
+       :func:`fit_rmsd`. With weights, the weighted mean squared deviation
+       is minimized, i.e. each atom contributes proportionally to its weight.
+       For linear geometries, the largest eigenvalue is a double root of the
+       characteristic polynomial and the rmsd only has about half of the
+       significant digits. The transformation is then computed with
+       :func:`superpose`.
+    """
+    from molmod.ext import transformations_qcp
+    if weights is not None:
+        weights = np.ascontiguousarray(weights, float)
+    a, ma = _center_weighted(ras, weights)
+    b, mb = _center_weighted(rbs, weights)
+    if not do_rotation:
+        return transformations_qcp(a, b, weights)
+    r = np.zeros((3, 3), float)
+    rmsd = transformations_qcp(a, b, weights, r)
+    if (r == np.identity(3)).all():
+        # The quaternion is not determined when the largest eigenvalue is
+        # degenerate, e.g. for linear geometries. The SVD still works.
+        return superpose(ras, rbs, weights), rmsd
+    return Complete(r, ma - np.dot(r, mb)), rmsd
+
+
+def rmsd_matrix(frames, weights=None, nthreads=1, threshold=None):
+    """Compute the minimal RMSD between all pairs of frames
+
+       Arguments:
+        | ``frames``  --  a numpy array with 3D coordinates of all frames,
+                          shape=(M,N,3)
+
+       Optional arguments:
+        | ``weights``  --  a numpy array with fitting weights for each
+                           coordinate, shape=(N,)
+        | ``nthreads``  --  the number of threads that compute elements of the
+                            matrix in parallel
+        | ``threshold``  --  when given, all elements above the threshold are
+                             set to ``np.inf``. A cheap lower bound, based on
+                             the sizes of the two frames, is used to skip the
+                             QCP computation for most of these pairs.
+
+       Return value:
+        | ``rmsds``  --  a condensed matrix with M*(M-1)/2 elements, in the
+                         same order as
+                         :func:`molmod.molecules.compute_distances_condensed`:
+                         the rmsd between frames i > j is stored at position
+                         ``i*(i-1)/2 + j``.
+
+       The elements are computed with the same compiled QCP kernel as in
+       :func:`qcp_rmsd`. The kernel releases the GIL, such that the work is
+       distributed over multiple threads.
+    """
+    from molmod.ext import transformations_rmsd_matrix
+    if weights is None:
+        total_weight = frames.shape[1]
+    else:
+        weights = np.ascontiguousarray(weights, float)
+        total_weight = weights.sum()
+    if threshold is None:
+        threshold = np.inf
+    centered = _center_weighted(frames, weights)[0]
+    if weights is None:
+        norms = (centered**2).sum(axis=2).sum(axis=1)
+    else:
+        norms = np.dot((centered**2).sum(axis=2), weights)
+    npair = (len(frames)*(len(frames) - 1))//2
+    result = np.zeros(npair, float)
+    args = (centered, weights, norms, total_weight, threshold)
+    if nthreads == 1:
+        transformations_rmsd_matrix(*(args + (0, npair, result)))
+    else:
+        # Each thread gets a contiguous slice of the condensed matrix with the
+        # same number of elements.
+        bounds = np.linspace(0, npair, nthreads + 1).astype(int)
+        threads = []
+        for begin, end in zip(bounds[:-1], bounds[1:]):
+            thread = threading.Thread(
+                target=transformations_rmsd_matrix,
+                args=args + (begin, end, result)
+            )
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+    # The lower bound does not catch all elements above the threshold.
+    result[result > threshold] = np.inf
+    return result
@@ -55,7 +55,7 @@ class ZMatrixGenerator(object):
              graph  --  an inseparable molecular graph
         """
         # Check that the graph is inseparable.
-        if len(graph.independent_vertices) > 1:
+        if (graph.component_labels != 0).any():
             raise ValueError("The graph must be inseparable.")
         self.graph = graph
         # First step is to reorder the atoms so that the zmatrix is somewhat
@@ -66,7 +66,7 @@ class ZMatrixGenerator(object):
         # We will try to take the original order as long as it satisfies the
         # constraint.
         for i in range(1, graph.num_vertices):
-            if (graph.distances[i][new_order] == 1).any():
+            if not graph.neighbors[i].isdisjoint(new_order):
                 new_order.append(i)
             else:
                 break
@@ -76,7 +76,7 @@ class ZMatrixGenerator(object):
         remaining = list(range(len(new_order), graph.num_vertices))
         while len(remaining) > 0:
             pivot = remaining.pop()
-            if (graph.distances[pivot][new_order] == 1).any():
+            if not graph.neighbors[pivot].isdisjoint(new_order):
                 new_order.append(pivot)
             else:
                 remaining.insert(0, pivot)
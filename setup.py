@@ -86,11 +86,11 @@ setup(
         "molmod.ext",
         sources=["molmod/ext.pyx", "molmod/common.c", "molmod/ff.c",
                  "molmod/graphs.c", "molmod/similarity.c", "molmod/molecules.c",
-                 "molmod/unit_cells.c"],
+                 "molmod/transformations.c", "molmod/unit_cells.c"],
         depends=["molmod/common.h", "molmod/ff.h", "molmod/ff.pxd", "molmod/graphs.h",
                  "molmod/graphs.pxd", "molmod/similarity.h", "molmod/similarity.pxd",
-                 "molmod/molecules.h", "molmod/molecules.pxd", "molmod/unit_cells.h",
-                 "molmod/unit_cells.pxd"],
+                 "molmod/molecules.h", "molmod/molecules.pxd", "molmod/transformations.h",
+                 "molmod/transformations.pxd", "molmod/unit_cells.h", "molmod/unit_cells.pxd"],
         include_dirs=[np.get_include()],
     )],
     setup_requires=['numpy>=1.0', 'cython>=0.24.1'],